@@ -7,8 +7,16 @@ from routes.services import services_bp
 from routes.test_db import test_bp
 from routes.transactions import transactions_bp
 from routes.reviews import reviews_bp
+from routes.metrics import metrics_bp
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
+from config.logger import init_logging
+from config.db import init_db
+from config.budget import init_budgets
+from config.jobs import init_jobs
+from config.scheduler import init_scheduler
+from config.compression import init_compression
+from config.indexes import ensure_indexes_command
 
 load_dotenv()
 
@@ -16,6 +24,12 @@ load_dotenv()
 def create_app():
     app = Flask(__name__)
 
+    # Logging estructurado (JSON, asíncrono, con request id)
+    init_logging(app)
+
+    # Compresión gzip/brotli de respuestas JSON grandes
+    init_compression(app)
+
     # Configuración JWT
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET')
     app.config['JWT_TOKEN_LOCATION'] = ['headers']
@@ -23,14 +37,30 @@ def create_app():
     # Inicializar JWT
     JWTManager(app)
 
+    # 503 rápido cuando MongoDB no está disponible (circuit breaker)
+    init_db(app)
+
     app.register_blueprint(categories_bp, url_prefix='/api/categories')
     app.register_blueprint(users_bp, url_prefix='/api/users')
     app.register_blueprint(services_bp, url_prefix='/api/services')
     app.register_blueprint(reviews_bp, url_prefix='/api/reviews')
     app.register_blueprint(transactions_bp, url_prefix='/api/transactions')
+    app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
     # Prueba la conexión a la db
     app.register_blueprint(test_bp, url_prefix='/api/test')
 
+    # Presupuesto de tiempo por ruta (maxTimeMS en cada consulta)
+    init_budgets(app)
+
+    # flask ensure-indexes
+    app.cli.add_command(ensure_indexes_command)
+
+    # Cola de trabajos en segundo plano (flask jobs ...)
+    init_jobs(app)
+
+    # Tareas periódicas (encolan trabajos; flask run-schedules para cron)
+    init_scheduler(app)
+
     return app
 
 
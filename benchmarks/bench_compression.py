@@ -0,0 +1,68 @@
+"""
+Compara bytes y CPU por respuesta al comprimir listas JSON parecidas a las
+de GET /api/services/ con distintos niveles de gzip y brotli.
+
+    python benchmarks/bench_compression.py
+"""
+import gzip
+import json
+import random
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SIZES = [10, 100, 1000, 5000]
+REPEAT = 20
+WORDS = ("clases de guitarra matemáticas cocina jardinería plomería inglés "
+         "programación cuidado mascotas mudanza costura fotografía").split()
+
+
+def fake_service(i):
+    return {
+        "_id": f"{i:024x}",
+        "title": " ".join(random.choices(WORDS, k=3)).capitalize(),
+        "description": " ".join(random.choices(WORDS, k=25)),
+        "categories": random.sample(WORDS, 2),
+        "hours": random.choice([0.5, 1.0, 1.5, 2.0]),
+        "contact": f"usuario{i}@correo.com",
+        "date_created": "2025-11-0%dT10:00:00" % (i % 9 + 1),
+        "location": random.choice(["Guadalajara", "Zapopan", "Tlaquepaque"]),
+        "owner_id": f"{i * 7:024x}",
+        "owner_name": f"Usuario {i}"
+    }
+
+
+def measure(fn, payload):
+    started = time.process_time()
+    for _ in range(REPEAT):
+        out = fn(payload)
+    cpu_ms = (time.process_time() - started) / REPEAT * 1000
+    return len(out), cpu_ms
+
+
+def main():
+    random.seed(7)
+    codecs = [(f"gzip-{level}", lambda d, level=level: gzip.compress(d, compresslevel=level))
+              for level in (1, 5, 6, 9)]
+    if brotli is not None:
+        codecs += [(f"br-{q}", lambda d, q=q: brotli.compress(d, quality=q))
+                   for q in (1, 4, 6, 11)]
+    else:
+        print("brotli no instalado; solo se mide gzip\n")
+
+    print(f"{'items':>6} {'codec':>8} {'bytes':>10} {'ratio':>7} {'cpu ms':>8}")
+    for size in SIZES:
+        payload = json.dumps([fake_service(i) for i in range(size)]).encode()
+        print(f"{size:>6} {'raw':>8} {len(payload):>10} {1:>7.2f} {0:>8.3f}")
+        for name, fn in codecs:
+            out_bytes, cpu_ms = measure(fn, payload)
+            print(f"{size:>6} {name:>8} {out_bytes:>10} "
+                  f"{out_bytes / len(payload):>7.2f} {cpu_ms:>8.3f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
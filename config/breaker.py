@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+
+from config import metrics
+
+# Circuit breaker para el acceso a MongoDB.
+#
+#   closed    -> todo pasa; N fallos de conexión seguidos lo abren
+#   open      -> se rechaza de inmediato (503) durante reset_timeout
+#   half_open -> una sola petición de prueba decide si se cierra o se abre
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpen(Exception):
+    """El circuito está abierto; reintentar en `retry_after` segundos."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=10.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._publish()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def before_call(self):
+        """
+        Regresa (permitido, es_prueba, segundos_para_reintentar). Si es_prueba
+        es True, quien llama debe reportar el resultado con record_success o
+        record_failure.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True, False, 0
+
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if self._state == OPEN and remaining <= 0:
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+                self._publish()
+
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True, True, 0
+
+        metrics.inc("circuit_rejected_total", breaker=self.name)
+        return False, False, max(1, int(remaining + 0.999))
+
+    def record_success(self):
+        with self._lock:
+            if self._state == OPEN:
+                # los éxitos tardíos no cierran el circuito; decide la prueba
+                return
+            self._failures = 0
+            if self._state == HALF_OPEN:
+                self._state = CLOSED
+                self._probe_in_flight = False
+                self._publish()
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (
+                    self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._trip()
+
+    def backoff(self, error, stop):
+        """
+        Pausa de un hilo en segundo plano (workers, scheduler) después de
+        `error`: CircuitOpen o un fallo de conexión. Con el circuito abierto
+        espera lo que falta sin llenar los logs; un fallo de conexión cuenta
+        como fallo y espera reset_timeout. `stop` (threading.Event)
+        interrumpe la espera.
+        """
+        if isinstance(error, CircuitOpen):
+            stop.wait(error.retry_after)
+            return
+        self.record_failure()
+        logger.warning("MongoDB no responde", extra={"breaker": self.name, "error": str(error)})
+        stop.wait(self.reset_timeout)
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        metrics.inc("circuit_trips_total", breaker=self.name)
+        self._publish()
+
+    def _publish(self):
+        metrics.set_gauge("circuit_state", _STATE_VALUES[self._state], breaker=self.name)
@@ -0,0 +1,100 @@
+import logging
+import os
+import time
+from functools import wraps
+
+import pymongo
+from flask import g, has_request_context, jsonify, make_response
+from pymongo.errors import PyMongoError, ServerSelectionTimeoutError
+
+from config import metrics
+
+# Presupuesto de tiempo por ruta. Cada vista corre dentro de
+# pymongo.timeout(), así el driver manda maxTimeMS con el tiempo restante en
+# cada find/aggregate/update y ninguna consulta sigue corriendo cuando el
+# cliente ya se fue.
+#
+#   ROUTE_TIME_BUDGET_MS=5000
+#   ROUTE_TIME_BUDGETS=services.get_all_services=2000,transactions.export_transactions=0
+#
+# Un presupuesto de 0 desactiva el límite para esa ruta; @no_time_budget lo
+# desactiva desde el código (escrituras masivas que no deben cortarse a la mitad).
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET_MS = int(os.getenv("ROUTE_TIME_BUDGET_MS", "5000"))
+
+
+def _parse_budgets(raw):
+    budgets = {}
+    for item in (raw or "").split(","):
+        if "=" not in item:
+            continue
+        route, value = item.split("=", 1)
+        try:
+            budgets[route.strip()] = int(value)
+        except ValueError:
+            continue
+    return budgets
+
+
+ROUTE_BUDGETS_MS = _parse_budgets(os.getenv("ROUTE_TIME_BUDGETS"))
+
+
+def remaining_seconds(default=None):
+    """Tiempo que le queda a la petición actual (o `default` si no hay límite)."""
+    if not has_request_context() or g.get("deadline") is None:
+        return default
+    return max(0.0, g.deadline - time.monotonic())
+
+
+def _budget_exceeded(endpoint, budget_ms):
+    metrics.inc("budget_exceeded_total", route=endpoint)
+    logger.warning("Presupuesto de tiempo excedido", extra={"budget_ms": budget_ms})
+    response = jsonify({"error": "La operación excedió el tiempo permitido"})
+    response.status_code = 504
+    return response
+
+
+def _with_budget(endpoint, view, budget_ms):
+    budget = budget_ms / 1000
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.deadline = time.monotonic() + budget
+        try:
+            with pymongo.timeout(budget):
+                rv = view(*args, **kwargs)
+        except PyMongoError as e:
+            # Mongo caído no es culpa del presupuesto: lo maneja el breaker
+            if not e.timeout or isinstance(e, ServerSelectionTimeoutError):
+                raise
+            return _budget_exceeded(endpoint, budget_ms)
+
+        # muchos handlers atrapan la excepción y regresan 500; si el tiempo
+        # ya se agotó, ese 500 en realidad es un presupuesto excedido
+        if time.monotonic() > g.deadline:
+            response = make_response(rv)
+            if response.status_code >= 500 and not response.is_streamed:
+                return _budget_exceeded(endpoint, budget_ms)
+            return response
+        return rv
+
+    return wrapper
+
+
+def no_time_budget(view):
+    """La vista corre sin presupuesto salvo que ROUTE_TIME_BUDGETS diga otra cosa."""
+    view.no_time_budget = True
+    return view
+
+
+def init_budgets(app):
+    """Envuelve las vistas ya registradas; llamar después de los blueprints."""
+    for endpoint, view in list(app.view_functions.items()):
+        if endpoint == "static":
+            continue
+        default_ms = 0 if getattr(view, "no_time_budget", False) else DEFAULT_BUDGET_MS
+        budget_ms = ROUTE_BUDGETS_MS.get(endpoint, default_ms)
+        if budget_ms > 0:
+            app.view_functions[endpoint] = _with_budget(endpoint, view, budget_ms)
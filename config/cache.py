@@ -0,0 +1,199 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from config import metrics
+
+# Caché de dos niveles:
+#   local  -> LRU en memoria de cada proceso (muy rápido, TTL corto)
+#   shared -> servidor con protocolo Redis compartido por todos los workers
+#
+# Invalidar deja una lápida (TOMBSTONE_SECONDS) en el nivel compartido y en
+# el LRU local; los otros procesos pueden servir su copia local hasta que
+# venza su TTL, por eso el TTL local debe ser corto. Mientras dure la lápida
+# no se guarda nada en esa llave: así un lector que leyó la base antes de la
+# escritura no deja su copia vieja en caché. En el nivel compartido se
+# escribe con SET NX. Si el nivel compartido falla, se trata como miss.
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("CACHE_REDIS_URL")
+# más que lo que tarda una petición entre leer la base y guardar en caché
+TOMBSTONE_SECONDS = float(os.getenv("CACHE_TOMBSTONE_SECONDS", "10"))
+
+_TOMBSTONE = "__invalidated__"
+
+
+class LocalLRU:
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+
+class MemoryStore:
+    """Sustituto local del servidor Redis (get/set con TTL y NX/delete)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex, nx=False):
+        with self._lock:
+            entry = self._data.get(key)
+            if nx and entry is not None and entry[0] >= time.monotonic():
+                return None
+            self._data[key] = (time.monotonic() + ex, value)
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+
+def _default_shared_store():
+    if not REDIS_URL:
+        return None
+    try:
+        import redis
+    except ImportError:
+        logger.warning("CACHE_REDIS_URL definido pero el paquete redis no está instalado")
+        return None
+    # timeouts cortos: el caché nunca debe hacer más lenta una petición
+    return redis.Redis.from_url(REDIS_URL, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+
+_shared_store = None
+_shared_store_loaded = False
+
+
+def get_shared_store():
+    global _shared_store, _shared_store_loaded
+    if not _shared_store_loaded:
+        _shared_store = _default_shared_store()
+        _shared_store_loaded = True
+    return _shared_store
+
+
+def set_shared_store(store):
+    """Reemplaza el nivel compartido (p. ej. con MemoryStore en pruebas)."""
+    global _shared_store, _shared_store_loaded
+    _shared_store = store
+    _shared_store_loaded = True
+
+
+class TwoTierCache:
+
+    def __init__(self, name, local_ttl, shared_ttl, max_entries=10000,
+                 tombstone_ttl=TOMBSTONE_SECONDS):
+        self.name = name
+        self.shared_ttl = shared_ttl
+        self.tombstone_ttl = tombstone_ttl
+        self.local = LocalLRU(max_entries, local_ttl)
+
+    def _shared_key(self, key):
+        return f"{self.name}:{key}"
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value == _TOMBSTONE:
+            metrics.inc("cache_misses_total", cache=self.name, tier="local")
+            return None
+        if value is not None:
+            metrics.inc("cache_hits_total", cache=self.name, tier="local")
+            return value
+        metrics.inc("cache_misses_total", cache=self.name, tier="local")
+
+        store = get_shared_store()
+        if store is None:
+            return None
+        try:
+            raw = store.get(self._shared_key(key))
+        except Exception as e:
+            metrics.inc("cache_errors_total", cache=self.name, tier="shared")
+            logger.warning("Error leyendo caché compartido", extra={"error": str(e)})
+            return None
+
+        if raw is None or raw in (_TOMBSTONE, _TOMBSTONE.encode()):
+            metrics.inc("cache_misses_total", cache=self.name, tier="shared")
+            return None
+
+        metrics.inc("cache_hits_total", cache=self.name, tier="shared")
+        value = json.loads(raw)
+        self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        """Guarda `value` salvo que la llave se haya invalidado hace poco."""
+        if self.local.get(key) == _TOMBSTONE:
+            return
+        store = get_shared_store()
+        if store is None:
+            self.local.set(key, value)
+            return
+        try:
+            # NX: no pisar la lápida ni una copia más nueva
+            if store.set(self._shared_key(key), json.dumps(value, default=str),
+                         ex=self.shared_ttl, nx=True):
+                self.local.set(key, value)
+        except Exception as e:
+            metrics.inc("cache_errors_total", cache=self.name, tier="shared")
+            logger.warning("Error escribiendo caché compartido", extra={"error": str(e)})
+
+    def invalidate(self, *keys):
+        if not keys:
+            return
+        for key in keys:
+            self.local.set(key, _TOMBSTONE, ttl=self.tombstone_ttl)
+        metrics.inc("cache_invalidations_total", len(keys), cache=self.name)
+        store = get_shared_store()
+        if store is None:
+            return
+        try:
+            for key in keys:
+                store.set(self._shared_key(key), _TOMBSTONE, ex=int(math.ceil(self.tombstone_ttl)))
+        except Exception as e:
+            metrics.inc("cache_errors_total", cache=self.name, tier="shared")
+            logger.warning("Error invalidando caché compartido", extra={"error": str(e)})
@@ -0,0 +1,90 @@
+import gzip
+import os
+
+from flask import request
+
+from config import metrics
+
+try:
+    import brotli
+except ImportError:  # está en requirements; si falta solo se usa gzip
+    brotli = None
+
+# Compresión de respuestas JSON grandes (listas de servicios, reseñas,
+# transacciones). Las respuestas pequeñas no se comprimen: el costo de CPU
+# no compensa los pocos bytes que se ahorran.
+
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+# niveles medios: casi la misma proporción que el máximo con mucho menos CPU
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson")
+
+
+def parse_accept_encoding(header):
+    """Regresa {codificación: q} a partir del encabezado Accept-Encoding."""
+    encodings = {}
+    for item in (header or "").split(","):
+        parts = [p.strip() for p in item.split(";")]
+        if not parts[0]:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        encodings[parts[0].lower()] = q
+    return encodings
+
+
+def choose_encoding(header):
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_q = None, 0.0
+    for encoding in candidates:
+        q = accepted.get(encoding, wildcard)
+        # en empate se queda el primero (br comprime mejor)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def init_compression(app):
+
+    @app.after_request
+    def _compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or "Content-Encoding" in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+
+        response.vary.add("Accept-Encoding")
+
+        data = response.get_data()
+        if len(data) < MIN_SIZE:
+            return response
+
+        encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+        if encoding is None:
+            return response
+
+        compressed = compress(data, encoding)
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+
+        metrics.inc("compression_responses_total", encoding=encoding)
+        metrics.inc("compression_bytes_in_total", len(data))
+        metrics.inc("compression_bytes_out_total", len(compressed))
+        return response
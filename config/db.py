@@ -1,22 +1,147 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, monitoring
+from pymongo.errors import ConnectionFailure
+from flask import jsonify
+import logging
 import os
+import threading
 from dotenv import load_dotenv
 
+from config.breaker import CircuitBreaker, CircuitOpen
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Sin esto el driver espera 30s para elegir servidor cuando Mongo no responde
+SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+
+breaker = CircuitBreaker(
+    "mongodb",
+    failure_threshold=int(os.getenv("DB_BREAKER_FAILURES", "3")),
+    reset_timeout=float(os.getenv("DB_BREAKER_RESET_SECONDS", "10"))
+)
+
+
+class DatabaseUnavailable(CircuitOpen):
+
+    def __init__(self, retry_after):
+        super().__init__("Base de datos no disponible", retry_after)
+
+
+# servidores que aceptan escrituras según la última descripción de la topología
+_writable_servers = frozenset()
+
+
+class _TopologyListener(monitoring.TopologyListener):
+
+    def opened(self, event):
+        pass
+
+    def description_changed(self, event):
+        global _writable_servers
+        _writable_servers = frozenset(
+            s.address for s in event.new_description.known_servers if s.is_writable)
+
+    def closed(self, event):
+        pass
+
+
+class _HeartbeatListener(monitoring.ServerHeartbeatListener):
+    """
+    Los heartbeats del driver alimentan el circuit breaker. En un replica
+    set solo cuenta el primario: un secundario caído no deja a la app sin
+    base de datos.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if event.reply.is_writable:
+            breaker.record_success()
+
+    def failed(self, event):
+        logger.warning("Heartbeat de MongoDB falló", extra={
+                       "server": str(event.connection_id), "error": str(event.reply)})
+        # falla si no queda otro servidor que acepte escrituras
+        if not _writable_servers - {event.connection_id}:
+            breaker.record_failure()
+
+
+# Un solo MongoClient por proceso (tiene su propio pool de conexiones)
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def _get_client():
+    global _client, _client_pid
+
+    # después de un fork (p. ej. gunicorn) el cliente heredado no sirve
+    if _client is not None and _client_pid == os.getpid():
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = MongoClient(
+                os.getenv("MONGO_URI"),
+                serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+                connectTimeoutMS=CONNECT_TIMEOUT_MS,
+                event_listeners=[_HeartbeatListener(), _TopologyListener()]
+            )
+            _client_pid = os.getpid()
+        return _client
+
 
 def get_db():
+    """
+    Regresa la base de datos. Si el circuit breaker está abierto lanza
+    DatabaseUnavailable de inmediato (se responde 503 con Retry-After).
+    """
+    allowed, probe, retry_after = breaker.before_call()
+    if not allowed:
+        raise DatabaseUnavailable(retry_after)
 
-    uri = os.getenv("MONGO_URI")
     db_name = os.getenv("DB_NAME")
 
-    print("Uri cargada:", uri)
-
     try:
-        client = MongoClient(uri)
-        db = client[db_name]
-        print("Conectado a la base de datos")
-        return db
-    except Exception as e:
-        print(f"1. Error al conectar a la base de datos: {e}")
+        db = _get_client()[db_name]
+    except Exception:
+        logger.exception("Error al conectar a la base de datos")
         return None
+
+    if probe:
+        # half-open: una sola petición verifica que Mongo ya responde
+        try:
+            db.command("ping")
+        except ConnectionFailure:
+            breaker.record_failure()
+            logger.warning("MongoDB sigue sin responder")
+            raise DatabaseUnavailable(int(breaker.reset_timeout))
+        breaker.record_success()
+        logger.info("MongoDB disponible de nuevo")
+
+    logger.debug("Conectado a la base de datos", extra={"db_name": db_name})
+    return db
+
+
+def _unavailable_response(retry_after):
+    response = jsonify({"error": "Base de datos no disponible, intenta más tarde"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def init_db(app):
+
+    @app.errorhandler(DatabaseUnavailable)
+    def _database_unavailable(e):
+        return _unavailable_response(e.retry_after)
+
+    # errores de conexión que los handlers no atraparon
+    @app.errorhandler(ConnectionFailure)
+    def _connection_failure(e):
+        breaker.record_failure()
+        logger.warning("Error de conexión con MongoDB", extra={"error": str(e)})
+        return _unavailable_response(int(breaker.reset_timeout))
@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+import os
+
+from flask import Response, stream_with_context
+
+from config import metrics
+
+# Exportaciones en streaming (NDJSON o CSV). Se itera el cursor de Mongo por
+# lotes y se emiten trozos de texto, así la memoria del worker no depende
+# del tamaño de la colección.
+
+BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+# tamaño aproximado de cada trozo enviado al cliente
+CHUNK_BYTES = 64 * 1024
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+
+def _ndjson_lines(docs):
+    for doc in docs:
+        yield json.dumps(doc, default=str, ensure_ascii=False) + "\n"
+
+
+def _csv_lines(docs, columns):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+
+    writer.writeheader()
+    yield buffer.getvalue()
+
+    for doc in docs:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(doc)
+        yield buffer.getvalue()
+
+
+def _chunks(lines, name):
+    parts, size, rows = [], 0, 0
+    for line in lines:
+        parts.append(line)
+        size += len(line)
+        rows += 1
+        if size >= CHUNK_BYTES:
+            yield "".join(parts)
+            parts, size = [], 0
+    if parts:
+        yield "".join(parts)
+    metrics.inc("export_rows_total", rows, export=name)
+
+
+def stream_export(cursors, serialize, fmt, columns, name):
+    """
+    `cursors` es una lista de cursores de pymongo (p. ej. colección
+    principal y archivo); cada documento pasa por `serialize` antes de
+    escribirse. Regresa un Response en streaming.
+    """
+    def docs():
+        for cursor in cursors:
+            for doc in cursor.batch_size(BATCH_SIZE):
+                yield serialize(doc)
+
+    lines = _ndjson_lines(docs()) if fmt == "ndjson" else _csv_lines(docs(), columns)
+
+    response = Response(stream_with_context(_chunks(lines, name)),
+                        mimetype=FORMATS[fmt])
+    response.headers["Content-Disposition"] = f'attachment; filename="{name}.{fmt}"'
+    metrics.inc("exports_total", export=name, format=fmt)
+    return response
@@ -0,0 +1,53 @@
+from flask import request
+
+# Soporte para ?fields=a,b,c (sparse fieldsets). Los campos pedidos se
+# validan contra una lista permitida por recurso y se traducen a una
+# proyección de Mongo, así solo viajan los bytes necesarios.
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def requested_fields(allowed, default=None):
+    """
+    Lee ?fields= de la petición. Regresa la lista de campos pedidos, o
+    `default` (por defecto todos los permitidos) si no se mandó el parámetro.
+    Lanza InvalidFields si se pide un campo fuera de `allowed` o si la lista
+    queda vacía (una proyección vacía regresaría el documento completo).
+    """
+    raw = request.args.get("fields")
+    if raw is None:
+        return list(default if default is not None else allowed)
+
+    fields = []
+    for field in raw.split(","):
+        field = field.strip()
+        if field and field not in fields:
+            fields.append(field)
+
+    invalid = [f for f in fields if f not in allowed]
+    if invalid:
+        raise InvalidFields(
+            f"Campos no permitidos en 'fields': {', '.join(invalid)}")
+    if not fields:
+        raise InvalidFields("'fields' debe incluir al menos un campo")
+    return fields
+
+
+def projection(fields):
+    """Proyección para find(); _id siempre se incluye."""
+    # {} regresaría todos los campos, incluidos los privados
+    return {field: 1 for field in fields} or {"_id": 1}
+
+
+def project_stage(fields, expressions=None):
+    """
+    Etapa $project para aggregate(). `expressions` permite mapear un campo a
+    una expresión (p. ej. {"owner_id": {"$toString": "$owner_id"}}).
+    """
+    expressions = expressions or {}
+    stage = {"_id": expressions.get("_id", 1)}
+    for field in fields:
+        stage[field] = expressions.get(field, 1)
+    return {"$project": stage}
@@ -0,0 +1,211 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import Response, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from pymongo.errors import DuplicateKeyError
+
+from config import metrics
+from config.budget import remaining_seconds
+from config.db import get_db
+from config.indexes import register_index
+
+# Soporte para el encabezado Idempotency-Key en los POST que crean
+# documentos. La primera petición con una llave se ejecuta y su respuesta se
+# guarda; las repeticiones reciben la misma respuesta. Si llega un duplicado
+# mientras la primera sigue en curso, espera a que termine.
+#
+# Las rutas que pueden tardar más que LOCK_SECONDS usan
+# @idempotent(renew_lock=True): la llave se renueva mientras la vista corre,
+# así un reintento nunca la toma como abandonada y repite la operación.
+
+TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# tiempo máximo que un duplicado espera a la petición original
+WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+# si la petición original no terminó en este tiempo se da por perdida
+LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "30"))
+POLL_SECONDS = 0.05
+MAX_KEY_LENGTH = 255
+
+# las llaves se borran solas al vencer
+register_index("idempotency_keys", [("created_at", 1)],
+               expireAfterSeconds=TTL_SECONDS)
+
+# peticiones en curso en este proceso: los duplicados locales esperan el
+# evento en lugar de consultar Mongo
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _fingerprint():
+    return hashlib.sha256(request.get_data()).hexdigest()
+
+
+def _replay(record, key):
+    metrics.inc("idempotency_replays_total", route=request.endpoint)
+    response = Response(record["body"], status=record["status_code"],
+                        content_type=record.get("content_type", "application/json"))
+    response.headers["Idempotency-Key"] = key
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _claim_stale(db, record_id, fingerprint, owner):
+    """Toma una llave cuya petición original murió sin terminar."""
+    now = datetime.utcnow()
+    return db.idempotency_keys.find_one_and_update(
+        {"_id": record_id, "status": "in_progress",
+         "fingerprint": fingerprint, "locked_until": {"$lt": now}},
+        {"$set": {"owner": owner,
+                  "locked_until": now + timedelta(seconds=LOCK_SECONDS)}}
+    )
+
+
+def _wait_for_original(db, record_id, fingerprint, key, owner):
+    """
+    Regresa la respuesta para el duplicado, o None si la llave quedó libre
+    o fue tomada por `owner` (en ese caso hay que ejecutar la vista).
+    """
+    # nunca esperar más de lo que le queda a la petición
+    deadline = time.monotonic() + min(WAIT_SECONDS, remaining_seconds(WAIT_SECONDS))
+    metrics.inc("idempotency_coalesced_total", route=request.endpoint)
+
+    while True:
+        record = db.idempotency_keys.find_one({"_id": record_id})
+
+        if record is None:
+            # la original falló y liberó la llave
+            return None
+        if record["fingerprint"] != fingerprint:
+            return jsonify({"error": "Idempotency-Key ya se usó con otra petición"}), 422
+        if record["status"] == "completed":
+            return _replay(record, key)
+        if _claim_stale(db, record_id, fingerprint, owner):
+            return None
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            response = jsonify({"error": "Hay una petición con esta Idempotency-Key en proceso"})
+            response.headers["Retry-After"] = "1"
+            return response, 409
+
+        with _inflight_lock:
+            event = _inflight.get(record_id)
+        if event is not None:
+            event.wait(remaining)
+        else:
+            time.sleep(min(POLL_SECONDS, remaining))
+
+
+class _LockKeeper:
+    """Extiende locked_until de la llave mientras la petición original corre."""
+
+    def __init__(self, db, record_id, owner):
+        self.db = db
+        self.record_id = record_id
+        self.owner = owner
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="idempotency-lock", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(LOCK_SECONDS / 3):
+            try:
+                self.db.idempotency_keys.update_one(
+                    {"_id": self.record_id, "owner": self.owner, "status": "in_progress"},
+                    {"$set": {"locked_until": datetime.utcnow() + timedelta(seconds=LOCK_SECONDS)}})
+            except Exception:
+                # la llave sigue bloqueada un rato; se reintenta en la siguiente vuelta
+                continue
+
+
+def idempotent(view=None, renew_lock=False):
+    """
+    Decorador para rutas POST. Va debajo de @jwt_required() para que la
+    llave quede asociada al usuario autenticado. Se usa como @idempotent o
+    @idempotent(renew_lock=True) en rutas largas.
+    """
+    if view is None:
+        return lambda view: idempotent(view, renew_lock=renew_lock)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({"error": "Idempotency-Key demasiado larga"}), 400
+
+        db = get_db()
+        if db is None:
+            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+        record_id = f"{request.endpoint}:{get_jwt_identity() or '-'}:{key}"
+        fingerprint = _fingerprint()
+        owner = uuid.uuid4().hex
+
+        while True:
+            now = datetime.utcnow()
+            try:
+                db.idempotency_keys.insert_one({
+                    "_id": record_id,
+                    "status": "in_progress",
+                    "fingerprint": fingerprint,
+                    "owner": owner,
+                    "created_at": now,
+                    "locked_until": now + timedelta(seconds=LOCK_SECONDS)
+                })
+                break
+            except DuplicateKeyError:
+                result = _wait_for_original(db, record_id, fingerprint, key, owner)
+                if result is not None:
+                    return result
+                # si no la tomamos nosotros, la original falló: reintentar
+                if db.idempotency_keys.find_one({"_id": record_id, "owner": owner}):
+                    break
+
+        event = threading.Event()
+        with _inflight_lock:
+            _inflight[record_id] = event
+
+        try:
+            if renew_lock:
+                with _LockKeeper(db, record_id, owner):
+                    response = make_response(view(*args, **kwargs))
+            else:
+                response = make_response(view(*args, **kwargs))
+
+            if response.status_code >= 500:
+                # errores del servidor no se guardan: el cliente puede reintentar
+                db.idempotency_keys.delete_one({"_id": record_id, "owner": owner})
+            else:
+                db.idempotency_keys.update_one({"_id": record_id, "owner": owner}, {"$set": {
+                    "status": "completed",
+                    "status_code": response.status_code,
+                    "body": response.get_data(as_text=True),
+                    "content_type": response.content_type
+                }, "$unset": {"locked_until": ""}})
+        except Exception:
+            db.idempotency_keys.delete_one({"_id": record_id, "owner": owner})
+            raise
+        finally:
+            with _inflight_lock:
+                _inflight.pop(record_id, None)
+            event.set()
+
+        response.headers["Idempotency-Key"] = key
+        return response
+
+    return wrapper
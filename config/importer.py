@@ -0,0 +1,172 @@
+import csv
+import json
+import logging
+import os
+import time
+
+import click
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError
+
+from config import metrics
+
+# Importación masiva desde NDJSON o CSV (comandos `flask ... import`).
+#
+# El archivo se lee en streaming y se inserta por lotes con
+# insert_many(ordered=False). Antes de cada lote se guarda un checkpoint con
+# las filas ya terminadas y los _id asignados al lote en curso; si el proceso
+# se cae, la siguiente corrida salta las filas terminadas y reusa esos _id,
+# así un lote insertado a medias no se duplica (los repetidos dan 11000 en
+# _id y se cuentan como ya importados).
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+
+class ImportReport:
+
+    def __init__(self):
+        self.inserted = 0
+        self.already_imported = 0
+        self.failures = []
+
+    def fail(self, row, error):
+        self.failures.append((row, error))
+
+
+def read_rows(source, fmt):
+    """Regresa (fila, dict) por cada registro; fila es 1-based sin encabezado."""
+    if fmt == "csv":
+        for row, record in enumerate(csv.DictReader(source), start=1):
+            yield row, record
+        return
+
+    row = 0
+    for line in source:
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield row, record
+
+
+def detect_format(path):
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+def _load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json_util.loads(f.read())
+    except FileNotFoundError:
+        return {"rows_done": 0, "pending_ids": []}
+
+
+def _save_checkpoint(path, checkpoint):
+    # escribir y renombrar: un checkpoint nunca queda a medias
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(json_util.dumps(checkpoint))
+    os.replace(tmp, path)
+
+
+def run_import(db, collection, source, fmt, prepare_batch,
+               batch_size=DEFAULT_BATCH_SIZE, checkpoint_path=None):
+    """
+    Importa `source` (archivo de texto abierto) en `collection`.
+    `prepare_batch(db, rows)` recibe [(fila, dict o None)] y regresa
+    [(fila, documento o None, error)] con las mismas reglas que la API.
+    """
+    checkpoint = _load_checkpoint(checkpoint_path) if checkpoint_path else {
+        "rows_done": 0, "pending_ids": []}
+    report = ImportReport()
+    started = time.perf_counter()
+
+    def flush(rows):
+        first_row = rows[0][0]
+        pending_ids = checkpoint["pending_ids"]
+        ids = [None] * len(rows)
+        prepared = prepare_batch(db, rows)
+
+        # filas que un intento anterior ya insertó pueden fallar la validación
+        # (p. ej. "email ya registrado"); si su _id existe, ya se importaron
+        retried = {pending_ids[row - first_row] for row, _, error in prepared
+                   if error and row - first_row < len(pending_ids) and pending_ids[row - first_row]}
+        already = {d["_id"] for d in db[collection].find(
+            {"_id": {"$in": list(retried)}}, {"_id": 1})} if retried else set()
+
+        docs, doc_rows = [], []
+        for row, doc, error in prepared:
+            offset = row - first_row
+            if error:
+                if offset < len(pending_ids) and pending_ids[offset] in already:
+                    ids[offset] = pending_ids[offset]
+                    report.already_imported += 1
+                else:
+                    report.fail(row, error)
+                continue
+            # reusar el _id del intento anterior de este mismo lote
+            if offset < len(pending_ids) and pending_ids[offset]:
+                doc["_id"] = pending_ids[offset]
+            else:
+                doc["_id"] = ObjectId()
+            ids[offset] = doc["_id"]
+            docs.append(doc)
+            doc_rows.append(row)
+
+        if checkpoint_path:
+            _save_checkpoint(checkpoint_path, {"rows_done": checkpoint["rows_done"],
+                                               "pending_ids": ids})
+
+        inserted = len(docs)
+        if docs:
+            try:
+                db[collection].insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                for err in e.details.get("writeErrors", []):
+                    inserted -= 1
+                    duplicate_id = err.get("keyPattern") == {"_id": 1} or \
+                        "index: _id_ " in err.get("errmsg", "")
+                    if err.get("code") == 11000 and duplicate_id:
+                        report.already_imported += 1
+                    else:
+                        report.fail(doc_rows[err["index"]], err.get("errmsg", "Error al insertar"))
+        report.inserted += inserted
+
+        checkpoint["rows_done"] = rows[-1][0]
+        checkpoint["pending_ids"] = []
+        if checkpoint_path:
+            _save_checkpoint(checkpoint_path, checkpoint)
+        logger.info("Lote importado", extra={
+                    "collection": collection, "rows_done": checkpoint["rows_done"]})
+
+    batch = []
+    for row, record in read_rows(source, fmt):
+        if row <= checkpoint["rows_done"]:
+            continue
+        batch.append((row, record))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    metrics.inc("import_rows_total", report.inserted, collection=collection)
+    metrics.observe("import_seconds", time.perf_counter() - started, collection=collection)
+    return report
+
+
+def print_import_report(report):
+    click.echo(f"Insertados: {report.inserted}")
+    if report.already_imported:
+        click.echo(f"Ya importados en una corrida anterior: {report.already_imported}")
+    for row, error in report.failures:
+        click.echo(f"Fila {row}: {error}", err=True)
+    click.echo(f"Filas con error: {len(report.failures)}")
@@ -0,0 +1,33 @@
+import logging
+
+import click
+
+from config.db import get_db
+
+# Registro de índices: cada módulo declara los índices que usan sus consultas
+# y `flask ensure-indexes` los crea todos (create_index es idempotente).
+
+logger = logging.getLogger(__name__)
+
+_indexes = []
+
+
+def register_index(collection, keys, **options):
+    _indexes.append((collection, keys, options))
+
+
+def ensure_indexes(db):
+    created = []
+    for collection, keys, options in _indexes:
+        name = db[collection].create_index(keys, **options)
+        created.append(f"{collection}.{name}")
+        logger.info("Índice asegurado", extra={
+                    "collection": collection, "index": name})
+    return created
+
+
+@click.command("ensure-indexes")
+def ensure_indexes_command():
+    """Crea los índices registrados por los módulos de la app."""
+    for name in ensure_indexes(get_db()):
+        click.echo(name)
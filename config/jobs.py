@@ -0,0 +1,406 @@
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from pymongo import ReturnDocument
+from pymongo.errors import ConnectionFailure, DuplicateKeyError
+
+from config import metrics
+from config.db import DatabaseUnavailable, breaker, get_db
+from config.indexes import register_index
+from config.logger import get_request_id, request_id_var
+
+# Cola de trabajos en MongoDB para el trabajo secundario de los handlers
+# (recalcular ratings, refrescar copias denormalizadas, etc.).
+#
+# Estados: queued -> leased -> done. Mientras el handler corre, el worker
+# renueva la concesión (lease_until); si el worker muere, la concesión vence
+# y otro worker lo toma. Tras max_attempts fallos el trabajo se mueve a la
+# colección jobs_dead.
+#
+# Los workers arrancan con la primera petición HTTP, no al importar la app:
+# los comandos `flask ...` no levantan hilos.
+#
+# Cada tipo de trabajo pertenece a una cola. Los workers del proceso web solo
+# toman la cola "default"; los trabajos pesados (cola "batch") los procesa
+# un proceso aparte: `flask jobs work --queue batch` o `flask jobs run
+# --queue batch` desde cron.
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = int(os.getenv("JOBS_LEASE_SECONDS", "60"))
+MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+BACKOFF_SECONDS = float(os.getenv("JOBS_BACKOFF_SECONDS", "2"))
+POLL_SECONDS = float(os.getenv("JOBS_POLL_SECONDS", "1"))
+DONE_TTL_SECONDS = int(os.getenv("JOBS_DONE_TTL_SECONDS", "86400"))
+
+DEFAULT_QUEUE = "default"
+
+register_index("jobs", [("status", 1), ("queue", 1), ("run_at", 1)])
+register_index("jobs", [("status", 1), ("queue", 1), ("lease_until", 1)])
+# a lo más un trabajo en cola por dedupe_key (respalda el upsert de enqueue;
+# uno en curso no cuenta, sus cambios pueden necesitar otra corrida)
+register_index("jobs", [("dedupe_key", 1)], name="dedupe_key_queued", unique=True,
+               partialFilterExpression={"status": "queued", "dedupe_key": {"$exists": True}})
+# los trabajos terminados se borran solos
+register_index("jobs", [("finished_at", 1)],
+               expireAfterSeconds=DONE_TTL_SECONDS,
+               partialFilterExpression={"status": "done"})
+
+_handlers = {}
+_queues = {}
+_wakeup = threading.Event()
+
+
+def job_handler(job_type, queue=DEFAULT_QUEUE):
+    """Registra la función que procesa los trabajos de `job_type`: fn(db, payload)."""
+    def decorator(fn):
+        _handlers[job_type] = fn
+        _queues[job_type] = queue
+        return fn
+    return decorator
+
+
+def _queue_filter(queues):
+    # los trabajos encolados antes de las colas no tienen el campo
+    values = list(queues) + ([None] if DEFAULT_QUEUE in queues else [])
+    return {"$in": values}
+
+
+def enqueue(db, job_type, payload=None, delay=0, max_attempts=None, dedupe_key=None):
+    """
+    Encola un trabajo y regresa su _id. Con `dedupe_key`, si ya hay uno igual
+    esperando en la cola no se crea otro (útil para recálculos idempotentes).
+    """
+    now = datetime.utcnow()
+    job = {
+        "type": job_type,
+        "queue": _queues.get(job_type, DEFAULT_QUEUE),
+        "payload": payload or {},
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts or MAX_ATTEMPTS,
+        "run_at": now + timedelta(seconds=delay),
+        "created_at": now,
+        "request_id": get_request_id()
+    }
+
+    if dedupe_key:
+        job["dedupe_key"] = dedupe_key
+        try:
+            result = db.jobs.update_one(
+                {"dedupe_key": dedupe_key, "status": "queued"},
+                {"$setOnInsert": job},
+                upsert=True
+            )
+            job_id = result.upserted_id
+        except DuplicateKeyError:
+            # otro proceso insertó el mismo trabajo entre la búsqueda y el upsert
+            job_id = None
+        if job_id is None:
+            metrics.inc("jobs_deduplicated_total", type=job_type)
+            return None
+    else:
+        job_id = db.jobs.insert_one(job).inserted_id
+
+    metrics.inc("jobs_enqueued_total", type=job_type)
+    _wakeup.set()
+    return job_id
+
+
+def _lease(db, worker_id, queues=(DEFAULT_QUEUE,)):
+    now = datetime.utcnow()
+    queue = _queue_filter(queues)
+    return db.jobs.find_one_and_update(
+        {"$or": [
+            {"status": "queued", "queue": queue, "run_at": {"$lte": now}},
+            # concesiones vencidas (worker caído)
+            {"status": "leased", "queue": queue, "lease_until": {"$lt": now}}
+        ]},
+        {
+            "$set": {
+                "status": "leased",
+                "leased_by": worker_id,
+                "lease_until": now + timedelta(seconds=LEASE_SECONDS)
+            },
+            "$inc": {"attempts": 1}
+        },
+        sort=[("run_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+class _LeaseKeeper:
+    """
+    Renueva la concesión de un trabajo mientras su handler corre, así un
+    trabajo largo no se entrega a otro worker a la mitad.
+    """
+
+    def __init__(self, db, job, worker_id, lease_seconds=None):
+        self.db = db
+        self.job = job
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds or LEASE_SECONDS
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(
+            target=self._run, name=f"job-lease-{self.job['_id']}", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                result = self.db.jobs.update_one(
+                    {"_id": self.job["_id"], "status": "leased", "leased_by": self.worker_id},
+                    {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}}
+                )
+            except Exception as e:
+                # la concesión sigue vigente un rato; se reintenta en la siguiente vuelta
+                logger.warning("No se pudo renovar la concesión", extra={
+                               "job_id": str(self.job["_id"]), "error": str(e)})
+                continue
+            if result.matched_count == 0:
+                self.lost = True
+                metrics.inc("jobs_lease_lost_total", type=self.job["type"])
+                logger.warning("Se perdió la concesión del trabajo", extra={
+                               "job_id": str(self.job["_id"]), "job_type": self.job["type"]})
+                return
+
+
+def _dead_letter(db, job, error):
+    job = dict(job, status="dead", last_error=error,
+               finished_at=datetime.utcnow())
+    db.jobs_dead.replace_one({"_id": job["_id"]}, job, upsert=True)
+    db.jobs.delete_one({"_id": job["_id"]})
+    metrics.inc("jobs_dead_total", type=job["type"])
+    logger.error("Trabajo movido a jobs_dead", extra={
+                 "job_id": str(job["_id"]), "job_type": job["type"], "error": error})
+
+
+def _execute(db, job, worker_id):
+    job_type = job["type"]
+    handler = _handlers.get(job_type)
+
+    if handler is None:
+        _dead_letter(db, job, f"Sin handler para '{job_type}'")
+        return
+
+    if job["attempts"] > job.get("max_attempts", MAX_ATTEMPTS):
+        _dead_letter(db, job, job.get("last_error") or "Concesión vencida")
+        return
+
+    token = request_id_var.set(job.get("request_id") or "-")
+    started = time.perf_counter()
+    try:
+        with _LeaseKeeper(db, job, worker_id):
+            handler(db, job.get("payload") or {})
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        metrics.inc("jobs_failed_total", type=job_type)
+        logger.exception("Falló trabajo", extra={
+                         "job_id": str(job["_id"]), "job_type": job_type, "attempt": job["attempts"]})
+
+        if job["attempts"] >= job.get("max_attempts", MAX_ATTEMPTS):
+            _dead_letter(db, job, error)
+        else:
+            backoff = BACKOFF_SECONDS * (2 ** (job["attempts"] - 1))
+            try:
+                db.jobs.update_one(
+                    {"_id": job["_id"], "leased_by": worker_id},
+                    {
+                        "$set": {
+                            "status": "queued",
+                            "run_at": datetime.utcnow() + timedelta(seconds=backoff),
+                            "last_error": error
+                        },
+                        "$unset": {"leased_by": "", "lease_until": ""}
+                    }
+                )
+            except DuplicateKeyError:
+                # ya hay otro igual en cola (dedupe_key); ese hará el trabajo
+                db.jobs.delete_one({"_id": job["_id"], "leased_by": worker_id})
+        return
+    finally:
+        metrics.observe("job_run_seconds", time.perf_counter() - started, type=job_type)
+        request_id_var.reset(token)
+
+    finished_at = datetime.utcnow()
+    result = db.jobs.update_one(
+        {"_id": job["_id"], "leased_by": worker_id},
+        {
+            "$set": {"status": "done", "finished_at": finished_at},
+            "$unset": {"lease_until": "", "dedupe_key": ""}
+        }
+    )
+    if result.matched_count == 0:
+        logger.warning("El trabajo terminó sin concesión; otro worker lo tomó", extra={
+                       "job_id": str(job["_id"]), "job_type": job_type})
+    metrics.inc("jobs_completed_total", type=job_type)
+    # latencia de punta a punta: desde que se encoló hasta que terminó
+    metrics.observe("job_latency_seconds",
+                    (finished_at - job["created_at"]).total_seconds(), type=job_type)
+
+
+def run_pending(db, worker_id="cli", limit=None, queues=(DEFAULT_QUEUE,)):
+    """Procesa trabajos disponibles hasta vaciar la cola (o llegar a `limit`)."""
+    processed = 0
+    while limit is None or processed < limit:
+        job = _lease(db, worker_id, queues)
+        if job is None:
+            break
+        _execute(db, job, worker_id)
+        processed += 1
+    return processed
+
+
+class WorkerPool:
+    """Hilos del proceso que consumen la cola de trabajos."""
+
+    def __init__(self, size, queues=(DEFAULT_QUEUE,)):
+        self.size = size
+        self.queues = tuple(queues)
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        for i in range(self.size):
+            thread = threading.Thread(
+                target=self._run, args=(f"{prefix}:{i}",),
+                name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Workers de trabajos iniciados",
+                    extra={"workers": self.size, "queues": list(self.queues)})
+
+    def stop(self):
+        self._stop.set()
+        _wakeup.set()
+
+    def _run(self, worker_id):
+        while not self._stop.is_set():
+            try:
+                # get_db en cada vuelta: consulta el circuit breaker
+                db = get_db()
+                job = _lease(db, worker_id, self.queues) if db is not None else None
+            except (DatabaseUnavailable, ConnectionFailure) as e:
+                breaker.backoff(e, self._stop)
+                continue
+            except Exception:
+                logger.exception("Error al tomar trabajo de la cola")
+                job = None
+
+            if job is None:
+                _wakeup.wait(POLL_SECONDS)
+                _wakeup.clear()
+                continue
+
+            try:
+                _execute(db, job, worker_id)
+            except Exception:
+                # errores al registrar el resultado; la concesión vencerá
+                logger.exception("Error al procesar trabajo",
+                                 extra={"job_id": str(job["_id"])})
+
+
+@metrics.register_collector
+def _queue_depth():
+    db = get_db()
+    if db is None:
+        return {}
+    gauges = {"jobs_queue_depth{status=queued}": 0,
+              "jobs_queue_depth{status=leased}": 0}
+    for row in db.jobs.aggregate([
+        {"$match": {"status": {"$in": ["queued", "leased"]}}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ]):
+        gauges[f"jobs_queue_depth{{status={row['_id']}}}"] = row["count"]
+    gauges["jobs_dead_count"] = db.jobs_dead.estimated_document_count()
+    return gauges
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _start_pool(workers):
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(workers)
+            _pool.start()
+
+
+def init_jobs(app):
+    app.cli.add_command(jobs_cli)
+
+    workers = int(os.getenv("JOBS_WORKERS", "2"))
+    if workers > 0:
+        # solo en procesos que atienden HTTP (y después del fork de gunicorn)
+        @app.before_request
+        def _start_workers():
+            if _pool is None:
+                _start_pool(workers)
+
+
+jobs_cli = AppGroup("jobs", help="Administración de la cola de trabajos.")
+
+
+@jobs_cli.command("run")
+@click.option("--limit", type=int, default=None, help="Máximo de trabajos a procesar.")
+@click.option("--queue", "queues", multiple=True, default=[DEFAULT_QUEUE],
+              help="Cola a procesar (se puede repetir).")
+def run_command(limit, queues):
+    """Procesa los trabajos pendientes en este proceso y termina."""
+    processed = run_pending(get_db(), limit=limit, queues=queues)
+    click.echo(f"Trabajos procesados: {processed}")
+
+
+@jobs_cli.command("work")
+@click.option("--workers", type=int, default=1, help="Hilos consumidores.")
+@click.option("--queue", "queues", multiple=True, default=[DEFAULT_QUEUE],
+              help="Cola a procesar (se puede repetir).")
+def work_command(workers, queues):
+    """Worker dedicado: procesa la cola hasta que se detenga el proceso."""
+    pool = WorkerPool(workers, queues)
+    pool.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
+
+
+@jobs_cli.command("retry-dead")
+@click.option("--type", "job_type", default=None, help="Solo trabajos de este tipo.")
+def retry_dead_command(job_type):
+    """Regresa a la cola los trabajos de jobs_dead."""
+    db = get_db()
+    query = {"type": job_type} if job_type else {}
+    retried = 0
+    for job in db.jobs_dead.find(query):
+        job.update(status="queued", attempts=0, run_at=datetime.utcnow())
+        for field in ("finished_at", "leased_by", "lease_until"):
+            job.pop(field, None)
+        try:
+            db.jobs.replace_one({"_id": job["_id"]}, job, upsert=True)
+            retried += 1
+        except DuplicateKeyError:
+            # ya hay uno igual en cola (dedupe_key)
+            pass
+        db.jobs_dead.delete_one({"_id": job["_id"]})
+    click.echo(f"Trabajos reencolados: {retried}")
@@ -0,0 +1,197 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+
+# Logging estructurado (JSON) sin bloquear a los hilos de las peticiones:
+# los handlers solo encolan el registro y un QueueListener escribe a stdout
+# desde su propio hilo.
+
+request_id_var = ContextVar("request_id", default="-")
+
+_listener = None
+
+REDACTED = "***"
+
+# llaves cuyo valor nunca debe llegar a los logs
+_SENSITIVE_KEYS = {
+    "password", "password_hash", "current_password", "new_password",
+    "token", "reset_token", "access_token", "refresh_token",
+    "authorization", "secret", "jwt_secret", "mongo_uri", "uri"
+}
+
+_SENSITIVE_PATTERNS = [
+    # credenciales dentro de un URI de mongo
+    (re.compile(r"(mongodb(?:\+srv)?://)[^:@/\s]+:[^@/\s]+@"), r"\1" + REDACTED + "@"),
+    # encabezados Authorization
+    (re.compile(r"(?i)(bearer\s+)[A-Za-z0-9\-_.=]+"), r"\1" + REDACTED),
+    # JWTs sueltos
+    (re.compile(r"eyJ[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+"), REDACTED),
+    # pares llave=valor o "llave": "valor"
+    (re.compile(r"(?i)(\"?(?:password|token|secret|reset_token)\"?\s*[:=]\s*\"?)[^\",\s}]+"), r"\1" + REDACTED),
+]
+
+# atributos propios de LogRecord; lo demás viene de extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "request_id", "route"
+}
+
+
+def redact(value):
+    if isinstance(value, str):
+        for pattern, replacement in _SENSITIVE_PATTERNS:
+            value = pattern.sub(replacement, value)
+        return value
+    if isinstance(value, dict):
+        return {
+            k: REDACTED if str(k).lower() in _SENSITIVE_KEYS else redact(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    return value
+
+
+def get_request_id():
+    return request_id_var.get()
+
+
+class RequestContextFilter(logging.Filter):
+    """Agrega request_id y ruta a cada registro (corre en el hilo que loguea)."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.route = request.endpoint if has_request_context() else None
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    Muestreo por ruta de los mensajes DEBUG. La decisión se toma una vez por
+    petición para que una petición muestreada quede completa en los logs.
+    """
+
+    def __init__(self, default_rate, route_rates):
+        super().__init__()
+        self.default_rate = default_rate
+        self.route_rates = route_rates
+
+    def filter(self, record):
+        if record.levelno != logging.DEBUG or not has_request_context():
+            return True
+        sampled = g.get("_log_debug_sampled")
+        if sampled is None:
+            rate = self.route_rates.get(request.endpoint, self.default_rate)
+            sampled = random.random() < rate
+            g._log_debug_sampled = sampled
+        return sampled
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        route = getattr(record, "route", None)
+        if route:
+            entry["route"] = route
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(redact(entry), default=str, ensure_ascii=False)
+
+
+def _parse_route_rates(raw):
+    # formato: "reviews.new_review=0.1,services.get_all_services=0.01"
+    rates = {}
+    for item in (raw or "").split(","):
+        if "=" not in item:
+            continue
+        route, rate = item.split("=", 1)
+        try:
+            rates[route.strip()] = float(rate)
+        except ValueError:
+            continue
+    return rates
+
+
+def _start_listener():
+    global _listener
+
+    log_queue = queue.Queue(-1)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+    _listener = logging.handlers.QueueListener(
+        log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return log_queue
+
+
+def init_logging(app):
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+
+    if _listener is None:
+        log_queue = _start_listener()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        # el JSON se arma antes de encolar; el listener solo escribe
+        queue_handler.setFormatter(JsonFormatter())
+        queue_handler.addFilter(RequestContextFilter())
+        queue_handler.addFilter(DebugSamplingFilter(
+            float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0")),
+            _parse_route_rates(os.getenv("LOG_DEBUG_SAMPLING"))
+        ))
+
+        root = logging.getLogger()
+        root.handlers = [queue_handler]
+        root.setLevel(level)
+
+    @app.before_request
+    def _bind_request_id():
+        incoming = request.headers.get("X-Request-ID", "")
+        # solo aceptamos ids razonables del cliente
+        if not re.fullmatch(r"[A-Za-z0-9\-_.]{1,64}", incoming):
+            incoming = uuid.uuid4().hex
+        g._request_id_token = request_id_var.set(incoming)
+        g._request_started = time.perf_counter()
+
+    @app.after_request
+    def _log_request(response):
+        response.headers["X-Request-ID"] = request_id_var.get()
+        started = g.get("_request_started")
+        if started is not None:
+            logging.getLogger("request").info("request", extra={
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+            })
+        return response
+
+    @app.teardown_request
+    def _unbind_request_id(exc):
+        token = g.pop("_request_id_token", None)
+        if token is not None:
+            try:
+                request_id_var.reset(token)
+            except ValueError:
+                # el token se creó en otro contexto (p. ej. respuestas en streaming)
+                request_id_var.set("-")
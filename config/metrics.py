@@ -0,0 +1,73 @@
+import logging
+import threading
+from collections import defaultdict
+
+# Métricas en memoria del proceso: contadores, gauges y tiempos (count/sum/max).
+# Se consultan en GET /api/metrics/.
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = {}
+_timings = {}
+_collectors = []
+
+
+def _key(name, labels):
+    if not labels:
+        return name
+    rendered = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{rendered}}}"
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] += value
+
+
+def set_gauge(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        timing = _timings.get(key)
+        if timing is None:
+            timing = _timings[key] = {"count": 0, "sum": 0.0, "max": 0.0}
+        timing["count"] += 1
+        timing["sum"] += seconds
+        timing["max"] = max(timing["max"], seconds)
+
+
+def register_collector(collector):
+    """
+    Registra una función que regresa {nombre: valor} al momento de leer las
+    métricas (útil para valores que hay que consultar, como tamaños de colas).
+    """
+    _collectors.append(collector)
+    return collector
+
+
+def snapshot():
+    with _lock:
+        data = {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": {
+                k: dict(v, avg=v["sum"] / v["count"] if v["count"] else 0.0)
+                for k, v in _timings.items()
+            }
+        }
+
+    for collector in _collectors:
+        try:
+            data["gauges"].update(collector())
+        except Exception:
+            logger.exception("Error en collector de métricas",
+                             extra={"collector": getattr(collector, "__name__", "?")})
+    return data
@@ -0,0 +1,99 @@
+import base64
+from datetime import datetime, timedelta, timezone
+
+from bson import json_util
+from flask import request
+
+# Paginación por llave (keyset): el cursor guarda los valores de orden del
+# último elemento de la página, así la siguiente consulta usa el índice en
+# lugar de saltarse documentos con skip().
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class InvalidQueryArgs(ValueError):
+    pass
+
+
+class InvalidCursor(InvalidQueryArgs):
+    pass
+
+
+def encode_cursor(values):
+    raw = json_util.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise InvalidCursor("Cursor inválido")
+    if not isinstance(values, dict):
+        raise InvalidCursor("Cursor inválido")
+    return values
+
+
+def page_args(default_limit=DEFAULT_LIMIT, max_limit=MAX_LIMIT, cursor_fields=()):
+    """
+    Lee ?limit= y ?cursor= de la petición. Regresa (limit, valores del cursor
+    o None). Un cursor sin alguno de `cursor_fields` es inválido.
+    """
+    try:
+        limit = int(request.args.get("limit", default_limit))
+    except ValueError:
+        raise InvalidQueryArgs("'limit' debe ser un número entero")
+    limit = max(1, min(limit, max_limit))
+
+    token = request.args.get("cursor")
+    if not token:
+        return limit, None
+    cursor = decode_cursor(token)
+    if any(field not in cursor for field in cursor_fields):
+        raise InvalidCursor("Cursor inválido")
+    return limit, cursor
+
+
+def split_page(docs, limit, cursor_fields):
+    """
+    Recibe hasta limit + 1 documentos; regresa (página, siguiente cursor).
+    Pedir uno de más evita una consulta extra para saber si hay otra página.
+    """
+    if len(docs) <= limit:
+        return docs, None
+    page = docs[:limit]
+    last = page[-1]
+    return page, encode_cursor({field: last[field] for field in cursor_fields})
+
+
+def _parse_date(value, name):
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise InvalidQueryArgs(f"'{name}' debe ser una fecha ISO 8601 (p. ej. 2025-11-30)")
+    # en la base las fechas se guardan en UTC sin zona
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def date_range_args():
+    """
+    Lee ?from= y ?to= (ISO 8601). `from` es inclusivo y `to` exclusivo; si
+    `to` es solo una fecha se incluye ese día completo. Regresa un filtro
+    para Mongo ({"$gte": ..., "$lt": ...}) o None.
+    """
+    raw_from = request.args.get("from")
+    raw_to = request.args.get("to")
+
+    date_filter = {}
+    if raw_from:
+        date_filter["$gte"] = _parse_date(raw_from, "from")
+    if raw_to:
+        to = _parse_date(raw_to, "to")
+        if len(raw_to) == 10:
+            to += timedelta(days=1)
+        date_filter["$lt"] = to
+    return date_filter or None
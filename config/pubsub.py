@@ -0,0 +1,155 @@
+import logging
+import queue
+import threading
+import time
+
+from pymongo.errors import OperationFailure
+
+from config import metrics
+
+# Pub/sub en memoria para empujar eventos a conexiones abiertas (SSE).
+#
+# Cada suscripción tiene una cola acotada: si el cliente no consume a tiempo
+# la suscripción se cierra con OVERFLOW en lugar de crecer sin límite, y el
+# cliente debe volver a pedir el estado completo.
+#
+# Con varios workers cada proceso tiene su propio broker. Contra un replica
+# set, ChangeStreamSource alimenta a todos los procesos desde MongoDB y la
+# publicación local se desactiva para no duplicar eventos.
+
+logger = logging.getLogger(__name__)
+
+# se entrega cuando la cola de la suscripción se llenó
+OVERFLOW = object()
+
+
+class Subscription:
+
+    def __init__(self, broker, topics, max_queue):
+        self.broker = broker
+        self.topics = topics
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.closed = False
+
+    def _offer(self, event):
+        if self.closed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.closed = True
+            metrics.inc("pubsub_overflow_total", broker=self.broker.name)
+            # dejar lugar para el aviso de desbordamiento
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._queue.put_nowait(OVERFLOW)
+
+    def get(self, timeout):
+        """Siguiente evento, OVERFLOW, o None si pasó `timeout` sin eventos."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+
+    def __init__(self, name, max_queue=100):
+        self.name = name
+        self.max_queue = max_queue
+        # False mientras un change stream entrega los eventos
+        self.local_publish = True
+        self._lock = threading.Lock()
+        self._topics = {}
+
+    def subscribe(self, topics):
+        subscription = Subscription(self, set(topics), self.max_queue)
+        with self._lock:
+            for topic in subscription.topics:
+                self._topics.setdefault(topic, set()).add(subscription)
+            self._publish_count()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._topics.get(topic)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[topic]
+            self._publish_count()
+
+    def publish(self, topics, event):
+        with self._lock:
+            subscriptions = set()
+            for topic in topics:
+                subscriptions.update(self._topics.get(topic, ()))
+        for subscription in subscriptions:
+            subscription._offer(event)
+        metrics.inc("pubsub_events_total", broker=self.name)
+
+    def _publish_count(self):
+        count = len({s for subscribers in self._topics.values() for s in subscribers})
+        metrics.set_gauge("pubsub_subscribers", count, broker=self.name)
+
+
+class ChangeStreamSource:
+    """
+    Hilo que sigue un change stream de MongoDB y publica en `broker`.
+    `to_event(change)` regresa (topics, evento) o None para ignorar el cambio.
+    Si el servidor no soporta change streams (no es replica set) se detiene
+    y el broker sigue con la publicación local.
+    """
+
+    def __init__(self, broker, get_collection, pipeline, to_event, retry_seconds=5):
+        self.broker = broker
+        self.get_collection = get_collection
+        self.pipeline = pipeline
+        self.to_event = to_event
+        self.retry_seconds = retry_seconds
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f"changestream-{self.broker.name}", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        resume_token = None
+        while True:
+            try:
+                collection = self.get_collection()
+                with collection.watch(self.pipeline, full_document="updateLookup",
+                                      resume_after=resume_token) as stream:
+                    self.broker.local_publish = False
+                    logger.info("Change stream activo", extra={"broker": self.broker.name})
+                    for change in stream:
+                        resume_token = stream.resume_token
+                        published = self.to_event(change)
+                        if published:
+                            self.broker.publish(*published)
+            except OperationFailure as e:
+                if e.code in (40573, 40324):
+                    # standalone: no hay change streams
+                    logger.info("Change streams no disponibles, se usa publicación local",
+                                extra={"broker": self.broker.name})
+                    self.broker.local_publish = True
+                    return
+                logger.warning("Error en change stream", extra={"error": str(e)})
+                resume_token = None
+            except Exception as e:
+                logger.warning("Error en change stream", extra={"error": str(e)})
+            # mientras se reconecta, publicar localmente para no perder eventos
+            self.broker.local_publish = True
+            metrics.inc("pubsub_source_errors_total", broker=self.broker.name)
+            time.sleep(self.retry_seconds)
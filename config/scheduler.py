@@ -0,0 +1,118 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+import click
+from pymongo.errors import ConnectionFailure, DuplicateKeyError
+
+from config import metrics
+from config.db import DatabaseUnavailable, breaker, get_db
+from config.jobs import enqueue
+
+# Tareas periódicas. El scheduler no ejecuta nada: cuando una tarea toca,
+# encola un trabajo en la cola de config/jobs y los workers lo procesan.
+#
+# Cada proceso que atiende HTTP corre su propio hilo (arranca con la primera
+# petición), pero la colección `schedules` ({_id: nombre, next_run_at})
+# funciona como candado: solo el proceso que logra mover next_run_at encola
+# el trabajo en ese periodo.
+
+logger = logging.getLogger(__name__)
+
+TICK_SECONDS = float(os.getenv("SCHEDULER_TICK_SECONDS", "30"))
+
+_schedules = {}
+
+
+def register_schedule(name, job_type, every_seconds, payload=None):
+    """Encola `job_type` cada `every_seconds` (0 o menos lo desactiva)."""
+    if every_seconds > 0:
+        _schedules[name] = (job_type, every_seconds, payload or {})
+
+
+def _claim(db, name, every_seconds):
+    now = datetime.utcnow()
+    try:
+        db.schedules.find_one_and_update(
+            {"_id": name, "next_run_at": {"$lte": now}},
+            {"$set": {"next_run_at": now + timedelta(seconds=every_seconds),
+                      "last_run_at": now}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # ya existe y todavía no toca (el upsert intentó insertar otro)
+        return False
+    return True
+
+
+def run_due(db):
+    """Encola las tareas que ya tocan. Regresa cuántas se encolaron."""
+    enqueued = 0
+    for name, (job_type, every_seconds, payload) in _schedules.items():
+        if _claim(db, name, every_seconds):
+            enqueue(db, job_type, payload, dedupe_key=f"schedule:{name}")
+            metrics.inc("scheduler_runs_total", schedule=name)
+            logger.info("Tarea periódica encolada", extra={"schedule": name})
+            enqueued += 1
+    return enqueued
+
+
+class Scheduler:
+
+    def __init__(self, tick_seconds=TICK_SECONDS):
+        self.tick_seconds = tick_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+        logger.info("Scheduler iniciado", extra={"schedules": sorted(_schedules)})
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                # get_db en cada vuelta: consulta el circuit breaker
+                db = get_db()
+                if db is not None:
+                    run_due(db)
+            except (DatabaseUnavailable, ConnectionFailure) as e:
+                breaker.backoff(e, self._stop)
+                continue
+            except Exception:
+                logger.exception("Error en el scheduler")
+            self._stop.wait(self.tick_seconds)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _start_scheduler():
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+            _scheduler.start()
+
+
+def init_scheduler(app):
+    app.cli.add_command(run_schedules_command)
+
+    if os.getenv("SCHEDULER_ENABLED", "1") == "1":
+        # no en los comandos `flask ...`: solo en procesos que atienden HTTP
+        @app.before_request
+        def _start_schedules():
+            if _scheduler is None and _schedules:
+                _start_scheduler()
+
+
+@click.command("run-schedules")
+def run_schedules_command():
+    """Encola una vez las tareas periódicas que ya tocan (para cron)."""
+    click.echo(f"Tareas encoladas: {run_due(get_db())}")
@@ -0,0 +1,23 @@
+from datetime import datetime
+
+from pymongo import ReturnDocument
+
+# Secuencias monótonas guardadas en la colección `counters`
+# ({_id: nombre, seq: n}). Un $inc atómico garantiza que dos escrituras nunca
+# reciben el mismo número, aun entre procesos.
+
+
+def next_sequence(db, name, count=1):
+    """Reserva `count` números seguidos; regresa el último."""
+    counter = db.counters.find_one_and_update(
+        {"_id": name},
+        {"$inc": {"seq": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+
+def change_fields(db, name):
+    """Campos para marcar un documento como modificado (sincronización delta)."""
+    return {"updated_at": datetime.utcnow(), "change_seq": next_sequence(db, name)}
@@ -0,0 +1,91 @@
+import math
+import re
+import unicodedata
+
+import numpy as np
+from scipy import sparse
+
+# Similitud de textos con TF-IDF y coseno (servicios relacionados).
+#
+# Se usa solo desde trabajos en segundo plano: importar este módulo carga
+# NumPy/SciPy, por eso los handlers web lo importan dentro de la función
+# que lo necesita.
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# palabras demasiado comunes para distinguir un servicio de otro
+STOPWORDS = frozenset("""
+a al algo ante como con de del desde e el en entre es esta este esto la las
+le lo los mas me mi muy no o para pero por que se si sin sobre su sus te tu
+un una uno unos y ya yo
+""".split())
+
+# celdas (filas x servicios) de la matriz densa de similitudes por bloque
+CHUNK_CELLS = 4_000_000
+
+
+def tokenize(text):
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return [t for t in _TOKEN.findall(text) if len(t) > 1 and t not in STOPWORDS]
+
+
+def tfidf_matrix(documents):
+    """
+    `documents` es una lista de listas de tokens. Regresa una matriz CSR
+    (documentos x vocabulario) con filas normalizadas (norma L2), así el
+    producto punto entre filas es la similitud coseno.
+    """
+    vocabulary = {}
+    rows, cols, values = [], [], []
+    for row, tokens in enumerate(documents):
+        counts = {}
+        for token in tokens:
+            col = vocabulary.setdefault(token, len(vocabulary))
+            counts[col] = counts.get(col, 0) + 1
+        for col, count in counts.items():
+            rows.append(row)
+            cols.append(col)
+            # tf sublineal: repetir una palabra 10 veces no la hace 10 veces más importante
+            values.append(1.0 + math.log(count))
+
+    shape = (len(documents), max(len(vocabulary), 1))
+    tf = sparse.csr_matrix((values, (rows, cols)), shape=shape, dtype=np.float32)
+
+    # idf suavizado: log((1 + n) / (1 + df)) + 1
+    df = np.bincount(np.asarray(cols, dtype=np.int64), minlength=shape[1])
+    idf = np.log((1 + shape[0]) / (1 + df)) + 1
+    matrix = tf @ sparse.diags(idf.astype(np.float32))
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix)
+
+
+def top_k(matrix, rows, k, candidates=None, min_score=0.0):
+    """
+    Vecinos más cercanos de las filas `rows` entre `candidates` (por defecto
+    todas las filas). Regresa {fila: [(columna candidata, score), ...]}
+    ordenado de mayor a menor; una fila nunca es vecina de sí misma.
+    """
+    candidates = np.arange(matrix.shape[0]) if candidates is None else np.asarray(candidates)
+    target = matrix[candidates].T.tocsc()
+    chunk = max(1, CHUNK_CELLS // max(len(candidates), 1))
+
+    neighbours = {}
+    rows = list(rows)
+    for start in range(0, len(rows), chunk):
+        block_rows = rows[start:start + chunk]
+        scores = (matrix[block_rows] @ target).toarray()
+        for i, row in enumerate(block_rows):
+            row_scores = scores[i]
+            row_scores[candidates == row] = -1
+            count = min(k, len(candidates))
+            if count <= 0:
+                neighbours[row] = []
+                continue
+            best = np.argpartition(-row_scores, count - 1)[:count]
+            best = best[np.argsort(-row_scores[best])]
+            neighbours[row] = [(int(candidates[j]), float(row_scores[j]))
+                               for j in best if row_scores[j] > min_score]
+    return neighbours
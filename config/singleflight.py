@@ -0,0 +1,68 @@
+import threading
+
+from flask import request
+
+from config import metrics
+from config.budget import remaining_seconds
+
+# Single-flight: si llegan varias lecturas idénticas al mismo tiempo en un
+# proceso, solo la primera va a la base de datos y las demás esperan y
+# comparten su resultado. El resultado se comparte tal cual, así que quien
+# lo reciba no debe modificarlo.
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.inc("singleflight_collapsed_total", group=self.name)
+            # no esperar más que el presupuesto de la petición; si se acaba,
+            # hacer la consulta por cuenta propia
+            if call.done.wait(remaining_seconds()):
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            return fn()
+
+        metrics.inc("singleflight_calls_total", group=self.name)
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+
+def request_key():
+    """Llave de la petición actual: ruta + parámetros normalizados."""
+    params = []
+    for name in sorted(request.args):
+        values = request.args.getlist(name)
+        if name == "fields":
+            # ?fields=b,a es lo mismo que ?fields=a,b
+            values = [",".join(sorted(set(",".join(values).split(","))))]
+        params.append((name, tuple(sorted(values))))
+    return (request.endpoint, tuple(params))
@@ -5,6 +5,10 @@
 from bson import ObjectId
 from flask import Blueprint, jsonify, request
 from config.db import get_db
+from config.singleflight import SingleFlight, request_key
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 # función para convertir objectId a string
@@ -26,6 +30,9 @@ def serialize_doc(doc):
 # Crear blueprint
 categories_bp = Blueprint('categories', __name__)
 
+# lecturas concurrentes idénticas comparten una consulta
+categories_flight = SingleFlight("categories")
+
 # Crear categoría
 
 
@@ -40,9 +47,8 @@ def new_category():
     if db is None:
         return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
 
-    print(type(db))
-
     name = data.get('name')
+    logger.debug("Creando categoría", extra={"category_name": name})
 
     # validación
     if not name:
@@ -73,11 +79,15 @@ def get_categories():
     if db is None:
         return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
 
-    categories = list(db.categories.find({}))
+    def load_categories():
+        categories = list(db.categories.find({}))
+
+        # Convertir ObjectId a string para JSON
+        for category in categories:
+            category['_id'] = str(category['_id'])
+        return categories
 
-    # Convertir ObjectId a string para JSON
-    for category in categories:
-        category['_id'] = str(category['_id'])
+    categories = categories_flight.do(request_key(), load_categories)
 
     return jsonify(categories), 200
 
@@ -0,0 +1,10 @@
+from flask import Blueprint, jsonify
+from config import metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+# Métricas del proceso (colas, tiempos, contadores)
+@metrics_bp.route('/', methods=['GET'])
+def get_metrics():
+    return jsonify(metrics.snapshot()), 200
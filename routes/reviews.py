@@ -1,11 +1,33 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from config.db import get_db
+from config.export import FORMATS, stream_export
+from config.fields import InvalidFields, project_stage, projection, requested_fields
+from config.idempotency import idempotent
+from config.indexes import register_index
+from config.jobs import enqueue, job_handler
+from config.pagination import InvalidQueryArgs, date_range_args, page_args, split_page
+from config.sequence import change_fields
+from routes.users import invalidate_user_card, is_admin, update_leaderboard_entry
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateMany
+import click
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Crear blueprint
 reviews_bp = Blueprint('reviews', __name__)
 
+# Campos que se pueden pedir con ?fields=
+REVIEW_FIELDS = ["service_id", "user_id", "owner_id", "rating", "comment"]
+
+# reseñas recibidas por un proveedor, más nuevas primero
+register_index("reviews", [("owner_id", 1), ("_id", -1)])
+# reseñas sin owner_id (anteriores a backfill-owner-ids), por servicio del dueño
+register_index("reviews", [("service_id", 1)])
+register_index("services", [("owner_id", 1)])
+
 # función para convertir objectId a string
 
 
@@ -21,18 +43,126 @@ def serialize_doc(doc):
             serialized[key] = value
     return serialized
 
+# resumen de calificaciones guardado en cada servicio (count, avg, histograma)
+
+
+def empty_rating_summary():
+    return {
+        "count": 0,
+        "sum": 0,
+        "avg": 0.0,
+        "histogram": {str(star): 0 for star in range(1, 6)}
+    }
+
+
+def apply_rating_delta(db, service_obj_id, added=None, removed=None):
+    """
+    Actualiza de forma incremental el rating_summary del servicio al crear
+    (added), editar (added y removed) o borrar (removed) una reseña.
+    """
+    deltas = {}
+    count = total = 0
+    if added:
+        deltas[str(added)] = deltas.get(str(added), 0) + 1
+        count += 1
+        total += added
+    if removed:
+        deltas[str(removed)] = deltas.get(str(removed), 0) - 1
+        count -= 1
+        total -= removed
+
+    changes = {
+        **change_fields(db, "services"),
+        "rating_summary.count": {"$add": [{"$ifNull": ["$rating_summary.count", 0]}, count]},
+        "rating_summary.sum": {"$add": [{"$ifNull": ["$rating_summary.sum", 0]}, total]}
+    }
+    for star, delta in deltas.items():
+        if delta:
+            changes[f"rating_summary.histogram.{star}"] = {
+                "$add": [{"$ifNull": [f"$rating_summary.histogram.{star}", 0]}, delta]}
+
+    # una sola actualización (pipeline) para que el promedio sea consistente
+    db.services.update_one({"_id": service_obj_id}, [
+        {"$set": changes},
+        {"$set": {"rating_summary.avg": {"$cond": [
+            {"$gt": ["$rating_summary.count", 0]},
+            {"$round": [{"$divide": ["$rating_summary.sum", "$rating_summary.count"]}, 1]},
+            0.0
+        ]}}}
+    ])
+
+
+def rating_summary_response(summary):
+    summary = summary or empty_rating_summary()
+    histogram = empty_rating_summary()["histogram"]
+    histogram.update(summary.get("histogram") or {})
+    return {
+        "count": summary.get("count", 0),
+        "avg": summary.get("avg", 0.0),
+        "histogram": histogram
+    }
+
+
+def owner_reviews_query(db, owner_obj_id):
+    """
+    Reseñas recibidas por `owner_obj_id`. owner_id está denormalizado en cada
+    reseña (índice owner_id); las anteriores a backfill-owner-ids se buscan
+    por los servicios del dueño.
+    """
+    service_ids = [s["_id"] for s in db.services.find({"owner_id": owner_obj_id}, {"_id": 1})]
+    return {"$or": [
+        {"owner_id": owner_obj_id},
+        {"owner_id": {"$exists": False}, "service_id": {"$in": service_ids}}
+    ]}
+
+
+# recalcular el rating promedio del dueño de un servicio (trabajo en segundo plano)
+
+
+@job_handler("recompute_owner_rating")
+def recompute_owner_rating(db, payload):
+    owner_obj_id = ObjectId(payload["owner_id"])
+
+    stats = list(db.reviews.aggregate([
+        {"$match": owner_reviews_query(db, owner_obj_id)},
+        {"$group": {"_id": None, "avg": {"$avg": "$rating"}, "count": {"$sum": 1}}}
+    ]))
+
+    avg = round(stats[0]["avg"], 1) if stats else 0.0
+    count = stats[0]["count"] if stats else 0
+
+    db.users.update_one(
+        {"_id": owner_obj_id},
+        {"$set": {"rating_avg": avg, "rating_count": count}}
+    )
+    invalidate_user_card(owner_obj_id)
+    update_leaderboard_entry(db, owner_obj_id)
+
+
+def enqueue_owner_rating(db, review):
+    owner_id = review.get("owner_id")
+    if not owner_id:
+        # reseñas anteriores a owner_id (antes de backfill-owner-ids)
+        service = db.services.find_one({"_id": review["service_id"]}, {"owner_id": 1})
+        owner_id = service.get("owner_id") if service else None
+    if owner_id:
+        enqueue(db, "recompute_owner_rating", {"owner_id": str(owner_id)},
+                dedupe_key=f"rating:{owner_id}")
+
+
 # crear review
 
 
 @reviews_bp.route('/new', methods=['POST'])
 @jwt_required()
+@idempotent
 def new_review():
     # obtener datos
     data = request.get_json()
 
     # obtener token
     current_user = get_jwt_identity()
-    print("Usuario actual desde token:", current_user)
+    logger.debug("Creando reseña", extra={"user_id": current_user})
 
     if not current_user:
         return jsonify({"error": "Usuario no autenticado"}), 401
@@ -71,7 +201,8 @@ def new_review():
         return jsonify({"error": "El usuario no existe"}), 400
 
     # checar si existe el servicio (CORREGIDO: _id no service_id)
-    if not db.services.find_one({"_id": service_obj_id}):
+    service = db.services.find_one({"_id": service_obj_id}, {"owner_id": 1})
+    if not service:
         return jsonify({"error": "El servicio no existe"}), 400
 
     # checar que el rating esté entre 1 y 5
@@ -83,34 +214,16 @@ def new_review():
         "service_id": service_obj_id,
         "user_id": user_obj_id,
         "rating": rating,
-        "comment": comment
+        "comment": comment,
+        # dueño del servicio, para consultar las reseñas recibidas
+        "owner_id": service.get("owner_id")
     }
 
     result = db.reviews.insert_one(review)
+    apply_rating_delta(db, service_obj_id, added=rating)
 
-    # actualizar el avg_rating del usuario
-    service = db.services.find_one({"_id": service_obj_id})
-    owner_id = service.get("owner_id")
-    if owner_id:
-        try:
-            owner_obj_id = ObjectId(owner_id)
-        except:
-            owner_obj_id = None
-
-        if owner_obj_id:  # obtener todas las reviews del usuario
-            all_reviews = list(db.reviews.find({"service_id": {"$in": [
-                s["_id"] for s in db.services.find({"owner_id": owner_id})
-            ]}}))
-
-            if all_reviews:  # calcular promedio
-                avg = sum(r["rating"] for r in all_reviews) / len(all_reviews)
-                avg = round(avg, 1)
-
-                # guardar en el usuario
-                db.users.update_one(
-                    {"_id": owner_obj_id},
-                    {"$set": {"rating_avg": avg}}
-                )
+    # el rating del proveedor se recalcula en segundo plano
+    enqueue_owner_rating(db, review)
 
     return jsonify({
         "mensaje": "Reseña creada",
@@ -126,6 +239,11 @@ def new_review():
 
 @reviews_bp.route('/', methods=['GET'])
 def get_all_reviews():
+    try:
+        fields = requested_fields(REVIEW_FIELDS)
+    except InvalidFields as e:
+        return jsonify({"error": str(e)}), 400
+
     # obtener base de datos
     db = get_db()
 
@@ -133,7 +251,7 @@ def get_all_reviews():
         return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
 
     try:
-        reviews = list(db.reviews.find({}))
+        reviews = list(db.reviews.find({}, projection(fields)))
 
         serialized_reviews = [serialize_doc(review) for review in reviews]
 
@@ -142,11 +260,55 @@ def get_all_reviews():
     except Exception as e:
         return jsonify({"error": f"Error al obtener reseñas: {str(e)}"}), 500
 
+# Admin: exportar reseñas en streaming (NDJSON o CSV)
+# ?format=ndjson|csv ?from= ?to= (fecha de creación, tomada del _id) ?rating=
+
+
+@reviews_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_reviews():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return jsonify({"error": "format debe ser ndjson o csv"}), 400
+
+    try:
+        date_filter = date_range_args()
+    except InvalidQueryArgs as e:
+        return jsonify({"error": str(e)}), 400
+
+    query = {}
+    # las reseñas no tienen created_at; el _id lleva la fecha de creación
+    if date_filter:
+        query["_id"] = {op: ObjectId.from_datetime(value)
+                        for op, value in date_filter.items()}
+    rating = request.args.get('rating')
+    if rating:
+        try:
+            query["rating"] = {"$in": [int(r) for r in rating.split(",")]}
+        except ValueError:
+            return jsonify({"error": "rating debe ser una lista de enteros"}), 400
+
+    db = get_db()
+    if db is None:
+        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+    if not is_admin(db, get_jwt_identity()):
+        return jsonify({"error": "No autorizado"}), 403
+
+    cursor = db.reviews.find(query, projection(REVIEW_FIELDS))
+    return stream_export([cursor], serialize_doc, fmt,
+                         ['_id'] + REVIEW_FIELDS, 'reviews')
+
 # obtener reviews de un servicio
 
 
 @reviews_bp.route('/service/<service_id>', methods=['GET'])
 def get_reviews_by_service(service_id):
+    try:
+        fields = requested_fields(REVIEW_FIELDS + ["owner_name"])
+    except InvalidFields as e:
+        return jsonify({"error": str(e)}), 400
+
     db = get_db()
     if db is None:
         return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
@@ -171,20 +333,17 @@ def get_reviews_by_service(service_id):
                     "from": "users",
                     "localField": "user_id",
                     "foreignField": "_id",
-                    "as": "user_info"
+                    "as": "user_info",
+                    "pipeline": [{"$project": {"_id": 0, "name": 1}}]
                 }
             },
             {"$unwind": "$user_info"},
-            {
-                "$project": {
-                    "_id": {"$toString": "$_id"},
-                    "comment": 1,
-                    "rating": 1,
-                    "service_id": {"$toString": "$service_id"},
-                    "user_id": {"$toString": "$user_id"},
-                    "owner_name": "$user_info.name"
-                }
-            }
+            project_stage(fields, {
+                "_id": {"$toString": "$_id"},
+                "service_id": {"$toString": "$service_id"},
+                "user_id": {"$toString": "$user_id"},
+                "owner_name": "$user_info.name"
+            })
         ]
 
         reviews = list(db.reviews.aggregate(pipeline))
@@ -195,9 +354,38 @@ def get_reviews_by_service(service_id):
         return jsonify({"error": f"Error al obtener reseñas: {str(e)}"}), 500
 
 
+# resumen de calificaciones de un servicio (no consulta la colección de reviews)
+
+
+@reviews_bp.route('/service/<service_id>/summary', methods=['GET'])
+def get_service_rating_summary(service_id):
+    db = get_db()
+    if db is None:
+        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+    try:
+        service_obj_id = ObjectId(service_id)
+    except:
+        return jsonify({"error": "ID de servicio inválido"}), 400
+
+    service = db.services.find_one({"_id": service_obj_id}, {"rating_summary": 1})
+    if not service:
+        return jsonify({"error": "El servicio no existe"}), 404
+
+    return jsonify({
+        "service_id": service_id,
+        "rating_summary": rating_summary_response(service.get("rating_summary"))
+    }), 200
+
+
 # obtener reviews de un usuario
 @reviews_bp.route('/user/<user_id>', methods=['GET'])
 def get_reviews_by_user(user_id):
+    try:
+        fields = requested_fields(REVIEW_FIELDS + ["service_title"])
+    except InvalidFields as e:
+        return jsonify({"error": str(e)}), 400
+
     # obtener base de datos
     db = get_db()
 
@@ -222,19 +410,17 @@ def get_reviews_by_user(user_id):
                     "from": "services",
                     "localField": "service_id",
                     "foreignField": "_id",
-                    "as": "service_info"
+                    "as": "service_info",
+                    "pipeline": [{"$project": {"_id": 0, "title": 1}}]
                 }
             },
             {"$unwind": "$service_info"},
-            {"$project": {
+            project_stage(fields, {
                 "_id": 0,
                 "service_id": {"$toString": "$service_id"},
                 "user_id": {"$toString": "$user_id"},
-                "rating": 1,
-                "comment": 1,
                 "service_title": "$service_info.title"
-            }
-            }
+            })
         ]
         reviews = list(db.reviews.aggregate(pipeline))
         return jsonify({"reviews": reviews}), 200
@@ -242,6 +428,80 @@ def get_reviews_by_user(user_id):
         return jsonify({"error": f"Error al obtener reseñas: {str(e)}"}), 500
 
 
+# reviews recibidas por un usuario (en sus servicios), paginadas por _id
+
+
+@reviews_bp.route('/received/<user_id>', methods=['GET'])
+def get_reviews_received(user_id):
+    try:
+        fields = requested_fields(REVIEW_FIELDS + ["reviewer_name", "service_title"])
+        limit, cursor = page_args(cursor_fields=["_id"])
+    except (InvalidFields, InvalidQueryArgs) as e:
+        return jsonify({"error": str(e)}), 400
+
+    db = get_db()
+    if db is None:
+        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+    try:
+        owner_obj_id = ObjectId(user_id)
+    except:
+        return jsonify({"error": "ID de usuario inválido"}), 400
+
+    match = owner_reviews_query(db, owner_obj_id)
+    if cursor:
+        match["_id"] = {"$lt": cursor["_id"]}
+
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"_id": -1}},
+        {"$limit": limit + 1}
+    ]
+    # los lookups se hacen sobre la página ya recortada
+    if "reviewer_name" in fields:
+        pipeline += [
+            {
+                "$lookup": {
+                    "from": "users",
+                    "localField": "user_id",
+                    "foreignField": "_id",
+                    "as": "user_info",
+                    "pipeline": [{"$project": {"_id": 0, "name": 1}}]
+                }
+            },
+            {"$unwind": {"path": "$user_info", "preserveNullAndEmptyArrays": True}}
+        ]
+    if "service_title" in fields:
+        pipeline += [
+            {
+                "$lookup": {
+                    "from": "services",
+                    "localField": "service_id",
+                    "foreignField": "_id",
+                    "as": "service_info",
+                    "pipeline": [{"$project": {"_id": 0, "title": 1}}]
+                }
+            },
+            {"$unwind": {"path": "$service_info", "preserveNullAndEmptyArrays": True}}
+        ]
+    pipeline.append(project_stage(fields, {
+        "reviewer_name": "$user_info.name",
+        "service_title": "$service_info.title"
+    }))
+
+    try:
+        reviews, next_cursor = split_page(
+            list(db.reviews.aggregate(pipeline)), limit, ["_id"])
+
+        return jsonify({
+            "reviews": [serialize_doc(review) for review in reviews],
+            "next_cursor": next_cursor
+        }), 200
+
+    except Exception as e:
+        return jsonify({"error": f"Error al obtener reseñas: {str(e)}"}), 500
+
+
 # update review
 
 
@@ -273,6 +533,9 @@ def update_review(review_id):
         else:
             return jsonify({"error": "El rating debe ser un número entero"}), 400
 
+        if rating < 1 or rating > 5:
+            return jsonify({"error": "El rating debe estar entre 1 y 5"}), 400
+
     try:
         review_obj_id = ObjectId(review_id)
     except:
@@ -293,12 +556,28 @@ def update_review(review_id):
     if str(review['user_id']) != current_user:
         return jsonify({"error": "No tienes permiso para actualizar esta reseña"}), 403
 
-    # actualizar review (CORREGIDO: usando ObjectId)
-    db.reviews.update_one({"_id": review_obj_id}, {
-                          "$set": {"rating": rating, "comment": comment}})
+    # actualizar solo los campos enviados
+    update_fields = {}
+    if rating:
+        update_fields["rating"] = rating
+    if comment:
+        update_fields["comment"] = comment
+
+    # el rating anterior sale de la misma escritura atómica: con `review`
+    # dos ediciones simultáneas aplicarían el delta desde el mismo valor
+    previous = db.reviews.find_one_and_update(
+        {"_id": review_obj_id}, {"$set": update_fields},
+        return_document=ReturnDocument.BEFORE)
+    if previous is None:
+        return jsonify({"error": "La reseña no existe"}), 400
+
+    previous_rating = previous.get("rating")
+    updated_review = dict(previous, **update_fields)
 
-    # obtener la reseña actualizada
-    updated_review = db.reviews.find_one({"_id": review_obj_id})
+    if rating and rating != previous_rating:
+        apply_rating_delta(db, review["service_id"],
+                           added=rating, removed=previous_rating)
+        enqueue_owner_rating(db, review)
 
     return jsonify({"mensaje": "Reseña actualizada", "reseña": serialize_doc(updated_review)}), 200
 
@@ -335,6 +614,68 @@ def delete_review(review_id):
         return jsonify({"error": "No tienes permiso para eliminar esta reseña"}), 403
 
     # borrar review (CORREGIDO: usando ObjectId)
-    db.reviews.delete_one({"_id": review_obj_id})
+    deleted = db.reviews.find_one_and_delete({"_id": review_obj_id})
+
+    # si otra petición ya la borró, el resumen ya se ajustó
+    if deleted:
+        apply_rating_delta(db, deleted["service_id"], removed=deleted.get("rating"))
+        enqueue_owner_rating(db, deleted)
 
     return jsonify({"mensaje": "Reseña eliminada"}), 200
+
+
+# flask reviews rebuild-rating-summaries
+@reviews_bp.cli.command('rebuild-rating-summaries')
+def rebuild_rating_summaries():
+    """Recalcula desde cero el rating_summary de todos los servicios."""
+    db = get_db()
+
+    summaries = {}
+    for row in db.reviews.aggregate([
+        {"$group": {"_id": {"service_id": "$service_id", "rating": "$rating"},
+                    "count": {"$sum": 1}}}
+    ]):
+        service_id = row["_id"]["service_id"]
+        summary = summaries.setdefault(service_id, empty_rating_summary())
+        rating = row["_id"]["rating"]
+        summary["histogram"][str(rating)] = row["count"]
+        summary["count"] += row["count"]
+        summary["sum"] += rating * row["count"]
+
+    for summary in summaries.values():
+        summary["avg"] = round(summary["sum"] / summary["count"], 1)
+
+    # servicios sin reseñas quedan en cero
+    db.services.update_many(
+        {"_id": {"$nin": list(summaries)}},
+        {"$set": {"rating_summary": empty_rating_summary()}}
+    )
+    for service_id, summary in summaries.items():
+        db.services.update_one({"_id": service_id},
+                               {"$set": {"rating_summary": summary}})
+
+    click.echo(f"Servicios con reseñas actualizados: {len(summaries)}")
+
+
+# flask reviews backfill-owner-ids
+@reviews_bp.cli.command('backfill-owner-ids')
+@click.option('--batch-size', default=500, help='Servicios por lote.')
+def backfill_owner_ids(batch_size):
+    """Agrega owner_id a las reseñas creadas antes de denormalizarlo."""
+    db = get_db()
+
+    updated = 0
+    batch = []
+    services = db.services.find({}, {"owner_id": 1}).batch_size(batch_size)
+    for service in services:
+        batch.append(UpdateMany(
+            {"service_id": service["_id"], "owner_id": {"$exists": False}},
+            {"$set": {"owner_id": service["owner_id"]}}
+        ))
+        if len(batch) >= batch_size:
+            updated += db.reviews.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += db.reviews.bulk_write(batch, ordered=False).modified_count
+
+    click.echo(f"Reseñas actualizadas: {updated}")
@@ -1,20 +1,60 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from config import metrics
 from config.db import get_db
+from config.idempotency import idempotent
+from config.fields import InvalidFields, project_stage, projection, requested_fields
+from config.importer import DEFAULT_BATCH_SIZE, detect_format, print_import_report, run_import
+from config.indexes import register_index
+from config.jobs import job_handler
+from config.pagination import (MAX_LIMIT, InvalidQueryArgs, decode_cursor,
+                               encode_cursor, page_args)
+from config.scheduler import register_schedule
+from config.sequence import change_fields, next_sequence
+from config.singleflight import SingleFlight, request_key
+from routes.reviews import empty_rating_summary, rating_summary_response, serialize_doc
+from routes.users import USER_CARD_DEFAULTS
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+import click
+import logging
+import math
+import os
+import time
 
 # Crear blueprint
 services_bp = Blueprint('services', __name__)
 
+logger = logging.getLogger(__name__)
+
+# Sincronización delta: cada escritura a un servicio le asigna updated_at y
+# un change_seq (secuencia "services" en counters); los borrados dejan una
+# lápida en service_tombstones durante la ventana de retención.
+SERVICES_SEQUENCE = "services"
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("SERVICES_TOMBSTONE_RETENTION_DAYS", "30"))
+# los cambios más recientes que esto no se entregan todavía: un change_seq se
+# reserva antes de escribir, así que uno menor podría seguir en vuelo
+CHANGES_SETTLE_SECONDS = float(os.getenv("SERVICES_CHANGES_SETTLE_SECONDS", "5"))
+
+register_index("services", [("change_seq", 1)])
+register_index("service_tombstones", [("change_seq", 1)])
+register_index("service_tombstones", [("deleted_at", 1)],
+               expireAfterSeconds=TOMBSTONE_RETENTION_DAYS * 86400)
+
 # Serialización de servicios
 
 
 def serialize_service(service):
-    if service and '_id' in service:
-        service = service.copy()
+    if not service:
+        return service
+    service = service.copy()
+    if '_id' in service:
         service['_id'] = str(service['_id'])
         service['owner_id'] = str(service['owner_id'])
+    # lista interna de relacionados; se expone en /<id>/similar
+    service.pop('similar', None)
+    service.pop('similar_updated_at', None)
     for key, value in service.items():
         if isinstance(value, datetime):
             service[key] = value.isoformat()
@@ -23,30 +63,64 @@ def serialize_service(service):
 # Crear servicio
 
 
-@services_bp.route('/crear', methods=['POST'])
-@jwt_required()
-def create_service():
-    current_user = get_jwt_identity()
-    data = request.get_json() or {}
-
-    # no jwt
-    if not current_user:
-        return jsonify({"error": "Usuario no autenticado"}), 401
-
+# Reglas de creación (las usan /crear y flask services import). Regresa
+# (documento sin change_seq, error).
+def new_service_doc(data, owner_id):
     # Validación de campos requeridos
     required_fields = ['title', 'description',
                        'categories', 'hours', 'contact', 'location']
     missing = [field for field in required_fields if not data.get(field)]
     if missing:
-        return jsonify({"error": f"Faltan campos: {', '.join(missing)}"}), 400
+        return None, f"Faltan campos: {', '.join(missing)}"
+
+    # el JSON (o NDJSON del importador) puede traer números, listas, etc.
+    not_text = [field for field in required_fields
+                if field != 'hours' and not isinstance(data[field], str)]
+    if not_text:
+        return None, f"Deben ser texto: {', '.join(not_text)}"
 
     # Validación de horas
+    if isinstance(data['hours'], bool):
+        return None, "'hours' debe ser un número válido"
     try:
         hours = float(data['hours'])
-        if hours <= 0:
-            return jsonify({"error": "El valor de 'hours' debe ser mayor a 0"}), 400
-    except ValueError:
-        return jsonify({"error": "'hours' debe ser un número válido"}), 400
+    except (TypeError, ValueError):
+        return None, "'hours' debe ser un número válido"
+    if not math.isfinite(hours):
+        return None, "'hours' debe ser un número válido"
+    if hours <= 0:
+        return None, "El valor de 'hours' debe ser mayor a 0"
+
+    service_doc = {
+        "owner_id": owner_id,
+        "title": data['title'].strip(),
+        "description": data['description'].strip(),
+        "categories": [c.strip() for c in data['categories'].split(",") if c.strip()],
+        "hours": hours,
+        "contact": data['contact'].strip(),
+        "date_created": datetime.utcnow(),
+        "location": data['location'].strip(),
+        "rating_summary": empty_rating_summary()
+    }
+    return service_doc, None
+
+
+@services_bp.route('/crear', methods=['POST'])
+@jwt_required()
+@idempotent
+def create_service():
+    current_user = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Se esperaba un objeto JSON"}), 400
+
+    # no jwt
+    if not current_user:
+        return jsonify({"error": "Usuario no autenticado"}), 401
+
+    service_doc, error = new_service_doc(data, ObjectId(current_user))
+    if error:
+        return jsonify({"error": error}), 400
 
     db = get_db()
     if db is None:
@@ -63,16 +137,8 @@ def create_service():
         #     return jsonify({"error": f"La categoría '{data['category']}' no existe"}), 400
 
         # Crear servicio
-        service_doc = {
-            "owner_id": ObjectId(current_user),
-            "title": data['title'].strip(),
-            "description": data['description'].strip(),
-            "categories": [c.strip() for c in data['categories'].split(",") if c.strip()],
-            "hours": hours,
-            "contact": data['contact'].strip(),
-            "date_created": datetime.utcnow(),
-            "location": data['location'].strip()
-        }
+        service_doc.update(change_fields(db, SERVICES_SEQUENCE))
+        service_doc["content_seq"] = service_doc["change_seq"]
 
         result = db.services.insert_one(service_doc)
         new_service = db.services.find_one({"_id": result.inserted_id})
@@ -85,23 +151,29 @@ def create_service():
     except Exception as e:
         return jsonify({"error": f"Error al crear servicio: {str(e)}"}), 500
 
-# Obtener todos los servicios
+# lecturas concurrentes idénticas del catálogo comparten una consulta
+services_flight = SingleFlight("services")
 
+# Campos que se pueden pedir con ?fields=
+SERVICE_FIELDS = ["title", "description", "categories", "hours", "contact",
+                  "date_created", "location", "owner_id", "owner_name",
+                  "rating_summary", "updated_at"]
 
-@services_bp.route('/', methods=['GET'])
-def get_all_services():
-    db = get_db()
-    if db is None:
-        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
 
-    try:
-        pipeline = [
+def services_pipeline(match, fields):
+    pipeline = [{"$match": match}] if match else []
+
+    # solo hacemos el lookup de usuarios si se pidió el nombre del dueño
+    if "owner_name" in fields:
+        pipeline += [
             {
                 "$lookup": {
                     "from": "users",
                     "localField": "owner_id",
                     "foreignField": "_id",
-                    "as": "owner"
+                    "as": "owner",
+                    # traer solo el nombre (no contraseñas, email, etc)
+                    "pipeline": [{"$project": {"_id": 0, "name": 1}}]
                 }
             },
             {
@@ -109,24 +181,33 @@ def get_all_services():
                     "path": "$owner",
                     "preserveNullAndEmptyArrays": True
                 }
-            },
-            # usar project para pasar solo ciertos campos (no contraseñas, email, etc)
-            {
-                "$project": {
-                    "_id": {"$toString": "$_id"},
-                    "title": 1,
-                    "description": 1,
-                    "categories": 1,
-                    "hours": 1,
-                    "contact": 1,
-                    "date_created": 1,
-                    "location": 1,
-                    "owner_id": {"$toString": "$owner_id"},
-                    "owner_name": "$owner.name"
-                }
             }
         ]
-        services = list(db.services.aggregate(pipeline))
+
+    pipeline.append(project_stage(fields, {
+        "_id": {"$toString": "$_id"},
+        "owner_id": {"$toString": "$owner_id"},
+        "owner_name": "$owner.name"
+    }))
+    return pipeline
+
+# Obtener todos los servicios
+
+
+@services_bp.route('/', methods=['GET'])
+def get_all_services():
+    try:
+        fields = requested_fields(SERVICE_FIELDS)
+    except InvalidFields as e:
+        return jsonify({"error": str(e)}), 400
+
+    db = get_db()
+    if db is None:
+        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+    try:
+        services = services_flight.do(request_key(), lambda: list(
+            db.services.aggregate(services_pipeline(None, fields))))
 
         return jsonify(services), 200
 
@@ -138,52 +219,270 @@ def get_all_services():
 
 @services_bp.route('/user/<user_id>', methods=['GET'])
 def get_services_by_user(user_id):
+    try:
+        fields = requested_fields(SERVICE_FIELDS)
+    except InvalidFields as e:
+        return jsonify({"error": str(e)}), 400
+
     db = get_db()
     if db is None:
         return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
 
     try:
-        {
-            "$match": {"owner_id": ObjectId(user_id)}
-        }
-        pipeline = [
-            {
-                "$lookup": {
-                    "from": "users",
-                    "localField": "owner_id",
-                    "foreignField": "_id",
-                    "as": "owner"
-                }
-            },
-            {
-                "$unwind": {
-                    "path": "$owner",
-                    "preserveNullAndEmptyArrays": True
-                }
-            },
-            # usar project para pasar solo ciertos campos (no contraseñas, email, etc)
-            {
-                "$project": {
-                    "_id": {"$toString": "$_id"},
-                    "title": 1,
-                    "description": 1,
-                    "categories": 1,
-                    "hours": 1,
-                    "contact": 1,
-                    "date_created": 1,
-                    "location": 1,
-                    "owner_id": {"$toString": "$owner_id"},
-                    "owner_name": "$owner.name"
-                }
-            }
-        ]
-        services = list(db.services.aggregate(pipeline))
+        user_obj_id = ObjectId(user_id)
+    except Exception:
+        return jsonify({"error": "ID de usuario inválido"}), 400
+
+    try:
+        services = list(db.services.aggregate(
+            services_pipeline({"owner_id": user_obj_id}, fields)))
 
         return jsonify(services), 200
 
     except Exception as e:
         return jsonify({"error": f"Error al obtener servicios: {str(e)}"}), 500
 
+# Cambios del catálogo desde un token (sincronización delta). Sin ?since=
+# se empieza desde cero; se sigue pidiendo con next_token mientras has_more.
+
+
+@services_bp.route('/changes', methods=['GET'])
+def get_service_changes():
+    try:
+        fields = requested_fields(SERVICE_FIELDS)
+        limit, _ = page_args(default_limit=MAX_LIMIT, max_limit=5 * MAX_LIMIT)
+        token = request.args.get("since")
+        since = decode_cursor(token) if token else {"seq": 0, "ts": None}
+        if not isinstance(since.get("seq"), int) or not isinstance(
+                since.get("ts"), (datetime, type(None))):
+            raise InvalidQueryArgs("Token 'since' inválido")
+    except (InvalidFields, InvalidQueryArgs) as e:
+        return jsonify({"error": str(e)}), 400
+
+    now = datetime.utcnow()
+    # las lápidas anteriores a la retención ya se borraron: hay que resincronizar
+    if since["ts"] is not None and since["ts"] < now - timedelta(days=TOMBSTONE_RETENTION_DAYS):
+        return jsonify({"error": "Token expirado, descarga el catálogo completo"}), 410
+
+    db = get_db()
+    if db is None:
+        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+    try:
+        seq_filter = {"change_seq": {"$gt": since["seq"]}}
+        upserts = list(db.services.aggregate(
+            [{"$match": seq_filter}, {"$sort": {"change_seq": 1}}, {"$limit": limit + 1}]
+            + services_pipeline(None, fields + ["change_seq", "updated_at"])))
+        tombstones = list(db.service_tombstones.find(seq_filter)
+                          .sort("change_seq", 1).limit(limit + 1))
+    except Exception as e:
+        return jsonify({"error": f"Error al obtener cambios: {str(e)}"}), 500
+
+    # sin updated_at (escritos antes de backfill-change-seq) cuentan como asentados
+    events = sorted(
+        [(doc["change_seq"], doc.get("updated_at"), doc) for doc in upserts]
+        + [(doc["change_seq"], doc["deleted_at"], {"_id": str(doc["_id"]), "deleted": True})
+           for doc in tombstones],
+        key=lambda event: event[0])
+
+    settled_before = now - timedelta(seconds=CHANGES_SETTLE_SECONDS)
+    changed, deleted = [], []
+    last_seq = since["seq"]
+    # el token lleva la fecha del primer cambio no entregado: ninguna lápida
+    # pendiente es más vieja, así el 410 solo salta si de verdad se purgó algo
+    horizon = settled_before
+    has_more = False
+    for seq, changed_at, doc in events:
+        changed_at = changed_at or settled_before
+        if changed_at > settled_before:
+            horizon = changed_at
+            break
+        if len(changed) + len(deleted) == limit:
+            horizon = changed_at
+            has_more = True
+            break
+        last_seq = seq
+        if doc.pop("deleted", False):
+            deleted.append(doc["_id"])
+        else:
+            doc.pop("change_seq")
+            if "updated_at" not in fields:
+                doc.pop("updated_at", None)
+            changed.append(doc)
+
+    return jsonify({
+        "upserts": changed,
+        "deletes": deleted,
+        "next_token": encode_cursor({"seq": last_seq, "ts": min(horizon, settled_before)}),
+        "has_more": has_more
+    }), 200
+
+# Servicios relacionados: vecinos más cercanos por TF-IDF de título,
+# descripción y categorías, guardados en services.similar por un trabajo
+# periódico (los handlers solo leen la lista). El trabajo va en la cola
+# "batch", fuera de los procesos web, y solo recalcula los servicios con
+# content_seq nuevo: el change_seq de la última escritura que tocó el texto
+# (las calificaciones también mueven change_seq, pero no el TF-IDF).
+SIMILAR_K = int(os.getenv("SIMILAR_SERVICES_K", "10"))
+SIMILAR_MIN_SCORE = float(os.getenv("SIMILAR_SERVICES_MIN_SCORE", "0.05"))
+SIMILAR_REFRESH_SECONDS = int(os.getenv("SIMILAR_SERVICES_REFRESH_SECONDS", "3600"))
+SIMILAR_FIELDS = [f for f in SERVICE_FIELDS if f != "owner_name"]
+SIMILAR_DEFAULT_FIELDS = ["title", "categories", "hours", "location", "rating_summary"]
+SIMILAR_CONTENT_FIELDS = ("title", "description", "categories", "category")
+
+# Reseñas que se incluyen en el detalle del servicio
+DETAIL_REVIEWS_LIMIT = 5
+
+# Detalle de un servicio: servicio, tarjeta del dueño, resumen de
+# calificaciones y primera página de reseñas en una sola agregación
+
+
+@services_bp.route('/<service_id>', methods=['GET'])
+def get_service_detail(service_id):
+    try:
+        reviews_limit = int(request.args.get('reviews_limit', DETAIL_REVIEWS_LIMIT))
+    except ValueError:
+        return jsonify({"error": "'reviews_limit' debe ser un número entero"}), 400
+    reviews_limit = max(0, min(reviews_limit, MAX_LIMIT))
+
+    db = get_db()
+    if db is None:
+        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+    try:
+        service_obj_id = ObjectId(service_id)
+    except Exception:
+        return jsonify({"error": "ID de servicio inválido"}), 400
+
+    owner_projection = {field: 1 for field in USER_CARD_DEFAULTS}
+
+    pipeline = [
+        {"$match": {"_id": service_obj_id}},
+        {
+            "$lookup": {
+                "from": "users",
+                "localField": "owner_id",
+                "foreignField": "_id",
+                "as": "owner",
+                # solo campos públicos de la tarjeta
+                "pipeline": [{"$project": owner_projection}]
+            }
+        },
+        {
+            "$lookup": {
+                "from": "reviews",
+                "localField": "_id",
+                "foreignField": "service_id",
+                "as": "reviews",
+                "pipeline": [
+                    {"$sort": {"_id": -1}},
+                    # uno de más para saber si hay otra página
+                    {"$limit": reviews_limit + 1},
+                    {
+                        "$lookup": {
+                            "from": "users",
+                            "localField": "user_id",
+                            "foreignField": "_id",
+                            "as": "user_info",
+                            "pipeline": [{"$project": {"_id": 0, "name": 1}}]
+                        }
+                    },
+                    {
+                        "$project": {
+                            "_id": {"$toString": "$_id"},
+                            "user_id": {"$toString": "$user_id"},
+                            "rating": 1,
+                            "comment": 1,
+                            "reviewer_name": {"$first": "$user_info.name"}
+                        }
+                    }
+                ]
+            }
+        },
+        {
+            "$project": {
+                "title": 1,
+                "description": 1,
+                "categories": 1,
+                "hours": 1,
+                "contact": 1,
+                "date_created": 1,
+                "location": 1,
+                "owner_id": 1,
+                "rating_summary": 1,
+                "owner": {"$first": "$owner"},
+                "reviews": 1
+            }
+        }
+    ]
+
+    try:
+        result = next(db.services.aggregate(pipeline), None)
+    except Exception as e:
+        return jsonify({"error": f"Error al obtener servicio: {str(e)}"}), 500
+
+    if not result:
+        return jsonify({"error": "Servicio no encontrado"}), 404
+
+    owner = result.pop("owner", None)
+    reviews = result.pop("reviews", [])
+    rating_summary = result.pop("rating_summary", None)
+
+    if owner:
+        owner = serialize_doc(dict(
+            USER_CARD_DEFAULTS, **owner))
+
+    return jsonify({
+        "service": serialize_service(result),
+        "owner": owner,
+        "rating_summary": rating_summary_response(rating_summary),
+        "reviews": reviews[:reviews_limit],
+        "has_more_reviews": len(reviews) > reviews_limit
+    }), 200
+
+# Servicios relacionados (precalculados por refresh_similar_services)
+@services_bp.route('/<service_id>/similar', methods=['GET'])
+def get_similar_services(service_id):
+    try:
+        fields = requested_fields(SIMILAR_FIELDS, default=SIMILAR_DEFAULT_FIELDS)
+        limit, _ = page_args(default_limit=SIMILAR_K, max_limit=SIMILAR_K)
+    except (InvalidFields, InvalidQueryArgs) as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        service_obj_id = ObjectId(service_id)
+    except Exception:
+        return jsonify({"error": "ID de servicio inválido"}), 400
+
+    db = get_db()
+    if db is None:
+        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+    try:
+        service = db.services.find_one({"_id": service_obj_id}, {"similar": 1})
+        if not service:
+            return jsonify({"error": "Servicio no encontrado"}), 404
+
+        neighbours = (service.get("similar") or [])[:limit]
+        docs = {doc["_id"]: doc for doc in db.services.find(
+            {"_id": {"$in": [n["_id"] for n in neighbours]}}, projection(fields))}
+    except Exception as e:
+        return jsonify({"error": f"Error al obtener servicios relacionados: {str(e)}"}), 500
+
+    similar = []
+    for neighbour in neighbours:
+        doc = docs.get(neighbour["_id"])
+        # pudo borrarse después del último cálculo
+        if doc is None:
+            continue
+        doc["_id"] = str(doc["_id"])
+        if "owner_id" in doc:
+            doc["owner_id"] = str(doc["owner_id"])
+        doc["score"] = round(neighbour["score"], 4)
+        similar.append(doc)
+
+    return jsonify({"similar": similar}), 200
+
 # Actualizar servicio
 
 
@@ -231,6 +530,9 @@ def update_service(service_id):
         return jsonify({"error": "No hay campos para actualizar"}), 400
 
     try:
+        update_fields.update(change_fields(db, SERVICES_SEQUENCE))
+        if any(field in update_fields for field in SIMILAR_CONTENT_FIELDS):
+            update_fields["content_seq"] = update_fields["change_seq"]
         db.services.update_one({"_id": ObjectId(service_id)}, {
                                "$set": update_fields})
         updated_service = db.services.find_one({"_id": ObjectId(service_id)})
@@ -258,7 +560,190 @@ def delete_service(service_id):
         return jsonify({"error": "No tienes permisos para eliminar este servicio"}), 403
 
     try:
-        db.services.delete_one({"_id": ObjectId(service_id)})
+        result = db.services.delete_one({"_id": ObjectId(service_id)})
+        if result.deleted_count:
+            changes = change_fields(db, SERVICES_SEQUENCE)
+            db.service_tombstones.replace_one(
+                {"_id": service["_id"]},
+                {"change_seq": changes["change_seq"], "deleted_at": changes["updated_at"]},
+                upsert=True
+            )
         return jsonify({"message": "Servicio eliminado"}), 200
     except Exception as e:
         return jsonify({"error": f"Error al eliminar servicio: {str(e)}"}), 500
+
+
+# flask services backfill-change-seq
+@services_bp.cli.command('backfill-change-seq')
+@click.option('--batch-size', default=500, help='Servicios por lote.')
+def backfill_change_seq(batch_size):
+    """Asigna updated_at y change_seq a los servicios creados antes de la sincronización delta."""
+    db = get_db()
+
+    updated = 0
+    while True:
+        batch = list(db.services.find(
+            {"change_seq": {"$exists": False}}, {"date_created": 1}).limit(batch_size))
+        if not batch:
+            break
+        # reservar un bloque de la secuencia para todo el lote
+        last = next_sequence(db, SERVICES_SEQUENCE, len(batch))
+        for offset, service in enumerate(batch):
+            seq = last - len(batch) + 1 + offset
+            db.services.update_one(
+                {"_id": service["_id"], "change_seq": {"$exists": False}},
+                {"$set": {
+                    "change_seq": seq,
+                    "content_seq": seq,
+                    "updated_at": service.get("date_created") or datetime.utcnow()
+                }}
+            )
+        updated += len(batch)
+
+    click.echo(f"Servicios actualizados: {updated}")
+
+
+def _prepare_service_rows(db, rows):
+    prepared = []
+    for row, record in rows:
+        if not isinstance(record, dict):
+            prepared.append((row, None, "Registro inválido"))
+            continue
+        owner_id = record.get("owner_id")
+        if not isinstance(owner_id, str) or not ObjectId.is_valid(owner_id):
+            prepared.append((row, None, "owner_id inválido"))
+            continue
+        service_doc, error = new_service_doc(record, ObjectId(owner_id))
+        prepared.append((row, service_doc, error))
+
+    # dueños en una sola consulta
+    owner_ids = {doc["owner_id"] for _, doc, _ in prepared if doc}
+    existing = {u["_id"] for u in db.users.find({"_id": {"$in": list(owner_ids)}}, {"_id": 1})}
+
+    valid = []
+    for index, (row, service_doc, error) in enumerate(prepared):
+        if service_doc and service_doc["owner_id"] not in existing:
+            prepared[index] = (row, None, "Usuario no encontrado")
+        elif service_doc:
+            valid.append(service_doc)
+
+    # un bloque de la secuencia de cambios para todo el lote
+    if valid:
+        last = next_sequence(db, SERVICES_SEQUENCE, len(valid))
+        now = datetime.utcnow()
+        for offset, service_doc in enumerate(valid):
+            seq = last - len(valid) + 1 + offset
+            service_doc.update(updated_at=now, change_seq=seq, content_seq=seq)
+    return prepared
+
+
+# flask services import servicios.ndjson|servicios.csv
+@services_bp.cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True)
+@click.option('--restart', is_flag=True, help='Ignora el checkpoint y empieza de cero.')
+def import_services_command(path, batch_size, restart):
+    """Crea servicios (con owner_id) desde NDJSON o CSV con las reglas de /crear."""
+    checkpoint_path = f"{path}.checkpoint"
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    with open(path, newline="", encoding="utf-8") as source:
+        report = run_import(get_db(), "services", source, detect_format(path),
+                            _prepare_service_rows, batch_size, checkpoint_path)
+    print_import_report(report)
+
+
+def _service_text(service):
+    categories = service.get("categories") or []
+    if isinstance(categories, str):
+        categories = [categories]
+    # el título y las categorías pesan más que la descripción
+    return " ".join([service.get("title") or ""] * 2
+                    + [service.get("description") or ""] + categories * 2)
+
+
+def refresh_similar_services(db, full=False, k=SIMILAR_K, min_score=SIMILAR_MIN_SCORE):
+    """
+    Recalcula services.similar. Sin `full` solo se recalculan los servicios
+    con content_seq mayor a la última corrida (job_state) y se mezclan en las
+    listas de los demás; los puntajes viejos no se ajustan a los cambios del
+    IDF hasta la siguiente corrida completa.
+    """
+    # NumPy/SciPy solo se cargan en el proceso que corre el trabajo
+    from config.similarity import tfidf_matrix, tokenize, top_k
+
+    started = time.perf_counter()
+    state = db.job_state.find_one({"_id": "similar_services"}) or {}
+    # un estado anterior a content_seq ("seq") fuerza una corrida completa
+    since = None if full or "content_seq" not in state else state["content_seq"]
+    counter = db.counters.find_one({"_id": SERVICES_SEQUENCE})
+    watermark = counter["seq"] if counter else 0
+
+    services = list(db.services.find({}, {
+        "title": 1, "description": 1, "categories": 1, "content_seq": 1, "similar": 1}))
+    ids = [service["_id"] for service in services]
+
+    if since is None:
+        changed = list(range(len(services)))
+    else:
+        changed = [i for i, service in enumerate(services)
+                   if service.get("content_seq", 0) > since]
+    deleted = set() if since is None else {t["_id"] for t in db.service_tombstones.find(
+        {"change_seq": {"$gt": since}}, {"_id": 1})}
+
+    updates = {}
+    if services and (changed or deleted):
+        matrix = tfidf_matrix([tokenize(_service_text(s)) for s in services])
+        for row, neighbours in top_k(matrix, changed, k, min_score=min_score).items():
+            updates[row] = [(ids[col], score) for col, score in neighbours]
+
+        if since is not None:
+            stale = {ids[i] for i in changed} | deleted
+            others = [i for i in range(len(services)) if ids[i] not in stale]
+            fresh = top_k(matrix, others, k, candidates=changed, min_score=min_score) \
+                if changed else {}
+            for row in others:
+                current = [(n["_id"], n["score"]) for n in services[row].get("similar") or []]
+                kept = [n for n in current if n[0] not in stale]
+                merged = kept + [(ids[col], score) for col, score in fresh.get(row, [])]
+                merged = sorted(merged, key=lambda n: -n[1])[:k]
+                if merged != current:
+                    updates[row] = merged
+
+    now = datetime.utcnow()
+    ops = [UpdateOne({"_id": ids[row]}, {"$set": {
+        "similar": [{"_id": _id, "score": score} for _id, score in neighbours],
+        "similar_updated_at": now
+    }}) for row, neighbours in updates.items()]
+    for start in range(0, len(ops), 1000):
+        db.services.bulk_write(ops[start:start + 1000], ordered=False)
+
+    db.job_state.update_one({"_id": "similar_services"},
+                            {"$set": {"content_seq": watermark, "updated_at": now},
+                             "$unset": {"seq": ""}}, upsert=True)
+
+    duration = time.perf_counter() - started
+    metrics.observe("similar_services_refresh_seconds", duration)
+    logger.info("Servicios relacionados recalculados", extra={
+                "services": len(services), "changed": len(changed), "updated": len(updates),
+                "full": since is None, "duration_ms": round(duration * 1000, 2)})
+    return len(updates)
+
+
+@job_handler("refresh_similar_services", queue="batch")
+def refresh_similar_services_job(db, payload):
+    refresh_similar_services(db, full=payload.get("full", False))
+
+
+register_schedule("refresh-similar-services", "refresh_similar_services",
+                  SIMILAR_REFRESH_SECONDS)
+
+
+# flask services similar [--full]
+@services_bp.cli.command('similar')
+@click.option('--full', is_flag=True, help='Recalcula todos los servicios.')
+def refresh_similar_command(full):
+    """Recalcula los servicios relacionados (TF-IDF)."""
+    updated = refresh_similar_services(get_db(), full=full)
+    click.echo(f"Servicios actualizados: {updated}")
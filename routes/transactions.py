@@ -1,26 +1,147 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from config import metrics
 from config.db import get_db
+from config.export import FORMATS, stream_export
+from config.indexes import register_index
+from config.jobs import job_handler
+from config.pagination import InvalidQueryArgs, date_range_args, encode_cursor, page_args
+from config.pubsub import OVERFLOW, Broker, ChangeStreamSource
+from config.scheduler import register_schedule
+from config.idempotency import idempotent
+from config.fields import InvalidFields, projection, requested_fields
+from routes.users import is_admin
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timedelta
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+import click
+import json
+import logging
+import os
+import time
 
 transactions_bp = Blueprint('transactions', __name__)
 
+logger = logging.getLogger(__name__)
+
+# Historial por participante (cliente o proveedor), más nuevas primero
+register_index("transactions", [("participants", 1), ("created_at", -1), ("_id", -1)])
+register_index("transactions", [("participants", 1), ("status_transaction", 1),
+                                ("created_at", -1), ("_id", -1)])
+# transacciones sin participants (anteriores a backfill-participants)
+register_index("transactions", [("client_id", 1), ("created_at", -1)])
+register_index("transactions", [("supplier_id", 1), ("created_at", -1)])
+
+
+def participant_query(user_id):
+    """Transacciones donde participa `user_id`, incluidas las que no tienen participants."""
+    return {"$or": [
+        {"participants": user_id},
+        {"participants": {"$exists": False}, "client_id": user_id},
+        {"participants": {"$exists": False}, "supplier_id": user_id}
+    ]}
+
+
+# Las transacciones terminadas se mueven a transactions_archive después de
+# ARCHIVE_AFTER_DAYS (ver archive_transactions); el historial lee ambas.
+ARCHIVE_AFTER_DAYS = int(os.getenv("TRANSACTIONS_ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("TRANSACTIONS_ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_MAX_BATCHES = int(os.getenv("TRANSACTIONS_ARCHIVE_MAX_BATCHES", "20"))
+ARCHIVE_SWEEP_SECONDS = int(os.getenv("TRANSACTIONS_ARCHIVE_SWEEP_SECONDS", "3600"))
+FINISHED_STATUSES = ["completed", "cancelled"]
+
+register_index("transactions", [("status_transaction", 1), ("resolved_at", 1)])
+register_index("transactions", [("status_transaction", 1), ("created_at", 1)])
+register_index("transactions_archive", [("participants", 1), ("created_at", -1), ("_id", -1)])
+register_index("transactions_archive", [("participants", 1), ("status_transaction", 1),
+                                        ("created_at", -1), ("_id", -1)])
+register_index("transactions_archive", [("service_id", 1)])
+register_index("transactions_archive", [("created_at", 1)])
+# rangos de fechas del rollup diario (ver rollup_daily)
+register_index("transactions", [("created_at", 1)])
+register_index("transactions", [("resolved_at", 1)])
+register_index("transactions_archive", [("resolved_at", 1)])
+
+# Las transacciones pendientes por más de PENDING_MAX_AGE_HOURS se cancelan
+# periódicamente (ver expire_pending_transactions); 0 desactiva la expiración.
+PENDING_MAX_AGE_HOURS = float(os.getenv("TRANSACTIONS_PENDING_MAX_AGE_HOURS", "168"))
+EXPIRY_SWEEP_SECONDS = int(os.getenv("TRANSACTIONS_EXPIRY_SWEEP_SECONDS", "300"))
+EXPIRY_BATCH_SIZE = int(os.getenv("TRANSACTIONS_EXPIRY_BATCH_SIZE", "500"))
+EXPIRY_MAX_BATCHES = int(os.getenv("TRANSACTIONS_EXPIRY_MAX_BATCHES", "20"))
+
+HISTORY_DEFAULT_LIMIT = 50
+
+# Agregados diarios para analítica (colección rollups_daily, un documento
+# por día UTC). Se recalculan los días desde la última corrida; lo escrito
+# en los últimos ROLLUP_SETTLE_SECONDS se deja para la siguiente.
+ROLLUP_REFRESH_SECONDS = int(os.getenv("TRANSACTIONS_ROLLUP_REFRESH_SECONDS", "900"))
+ROLLUP_SETTLE_SECONDS = int(os.getenv("TRANSACTIONS_ROLLUP_SETTLE_SECONDS", "60"))
+ROLLUP_WINDOW_DAYS = int(os.getenv("TRANSACTIONS_ROLLUP_WINDOW_DAYS", "31"))
+ROLLUP_COUNTERS = ["created", "completed", "cancelled", "hours_transferred"]
+
+# Máximo de transacciones en POST /bulk
+BULK_MAX_ITEMS = int(os.getenv("TRANSACTIONS_BULK_MAX_ITEMS", "100"))
+
+# Eventos en vivo (GET /stream): cada transacción se publica en los temas de
+# su cliente y su proveedor.
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+# las conexiones se cierran después de este tiempo; el navegador reconecta
+SSE_MAX_SECONDS = float(os.getenv("SSE_MAX_SECONDS", "300"))
+# "off" desactiva el change stream aunque Mongo sea replica set
+CHANGE_STREAM_MODE = os.getenv("TRANSACTIONS_CHANGE_STREAM", "auto")
+
+transaction_events = Broker("transactions", max_queue=int(os.getenv("SSE_QUEUE_SIZE", "100")))
+
 # Serialización de transacciones
 def serialize_transaction(transaction):
     transaction = transaction.copy()
-    transaction['_id'] = str(transaction['_id'])
-    transaction['service_id'] = str(transaction['service_id'])
-    transaction['supplier_id'] = str(transaction['supplier_id'])
-    transaction['client_id'] = str(transaction['client_id'])
+    for key in ('_id', 'service_id', 'supplier_id', 'client_id'):
+        if key in transaction:
+            transaction[key] = str(transaction[key])
+    transaction.pop('participants', None)
+    transaction.pop('update_id', None)
     for key, value in transaction.items():
         if isinstance(value, datetime):
             transaction[key] = value.isoformat()
     return transaction
 
+
+def transaction_event(transaction, kind):
+    topics = [str(transaction['client_id']), str(transaction['supplier_id'])]
+    return topics, {"type": kind, "transaction": serialize_transaction(transaction)}
+
+
+def publish_transaction(transaction, kind):
+    # con change stream activo el evento llega desde MongoDB a todos los workers
+    if transaction_events.local_publish:
+        transaction_events.publish(*transaction_event(transaction, kind))
+
+
+def _change_to_event(change):
+    transaction = change.get("fullDocument")
+    if not transaction:
+        return None
+    kind = "created" if change["operationType"] == "insert" else "updated"
+    return transaction_event(transaction, kind)
+
+
+transactions_change_stream = ChangeStreamSource(
+    transaction_events,
+    lambda: get_db().transactions,
+    [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}],
+    _change_to_event
+)
+
+# Campos que se pueden pedir con ?fields=
+TRANSACTION_FIELDS = ['service_id', 'supplier_id', 'client_id', 'hours',
+                      'status_supplier', 'status_client', 'status_transaction',
+                      'created_at', 'resolved_at']
+
 # Crear transacción
 @transactions_bp.route('/create', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_transaction():
     #supplier_id = get_jwt_identity()  # proveedor inicia
     data = request.get_json() or {}
@@ -61,6 +182,8 @@ def create_transaction():
         "service_id": service_id,
         "supplier_id": supplier_id_obj,
         "client_id": client_id,
+        # ambos participantes en un arreglo indexado (historial por usuario)
+        "participants": [client_id, supplier_id_obj],
         "hours": hours,
         "status_supplier": "pending", 
         "status_client": "pending",
@@ -71,6 +194,7 @@ def create_transaction():
     try:
         result = db.transactions.insert_one(transaction_doc)
         new_transaction = db.transactions.find_one({"_id": result.inserted_id})
+        publish_transaction(new_transaction, "created")
         return jsonify({
             "message": "Transacción creada, pendiente de aceptación del cliente",
             "transaction": serialize_transaction(new_transaction)
@@ -79,71 +203,32 @@ def create_transaction():
         return jsonify({"error": f"Error al crear transacción: {str(e)}"}), 500
 
 
-# Actualizar transacción
-@transactions_bp.route('/<transaction_id>', methods=['PUT'])
-@jwt_required()
-def update_transaction(transaction_id):
-    current_user = get_jwt_identity()
-    data = request.get_json() or {}
-    db = get_db()
-    if db is None:
-        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
-
-    try:
-        trans_id = ObjectId(transaction_id)
-        user_id = ObjectId(current_user)
-    except Exception:
-        return jsonify({"error": "ID inválido"}), 400
-
-    transaction = db.transactions.find_one({"_id": trans_id})
-    if not transaction:
-        return jsonify({"error": "Transacción no encontrada"}), 404
-
+# Decide los cambios de una transacción cuando `current_user` responde con
+# `data` ({status_supplier} o {status_client}). Regresa
+# (update_fields, horas a transferir del cliente al proveedor, error).
+def resolve_transaction_update(transaction, current_user, data):
     update_fields = {}
+    transfer_hours = 0
 
     # Permitir que el proveedor acepte o rechace
     if 'status_supplier' in data and str(transaction['supplier_id']) == str(current_user):
         if data['status_supplier'] not in ['accepted', 'rejected']:
-            return jsonify({"error": "status_supplier inválido"}), 400
+            return None, 0, "status_supplier inválido"
         update_fields['status_supplier'] = data['status_supplier']
 
     # Client solo puede actualizar status_client
     if 'status_client' in data and str(transaction['client_id']) == str(current_user):
         if data['status_client'] not in ['accepted', 'rejected']:
-            return jsonify({"error": "status_client inválido"}), 400
-
-        client = db.users.find_one({"_id": ObjectId(transaction['client_id'])})
-        supplier = db.users.find_one({"_id": ObjectId(transaction['supplier_id'])})
-
+            return None, 0, "status_client inválido"
+        update_fields['status_client'] = data['status_client']
         if data['status_client'] == 'accepted':
-            # Validar horas nuevamente
-            if client['hours_balance'] < transaction['hours']:
-                return jsonify({"error": "Horas insuficientes para completar la transacción"}), 400
-            # Transferir horas
-            db.users.update_one(
-                {"_id": client['_id']},
-                {"$inc": {"hours_balance": -transaction['hours']}}
-            )
-            db.users.update_one(
-                {"_id": supplier['_id']},
-                {"$inc": {"hours_balance": transaction['hours']}}
-            )
-            update_fields['status_client'] = 'accepted'
-        elif data['status_client'] == 'rejected':
-            update_fields['status_client'] = 'rejected'
+            transfer_hours = transaction['hours']
 
     # Actualizar status_transaction
-    # revisar si ambos ya respondieron
-    supplier_status = data.get('status_supplier', transaction.get('status_supplier'))
-    client_status = data.get('status_client', transaction.get('status_client'))
+    # revisar si ambos ya respondieron (solo cuentan las respuestas propias)
+    supplier_status = update_fields.get('status_supplier', transaction.get('status_supplier'))
+    client_status = update_fields.get('status_client', transaction.get('status_client'))
 
-    '''
-    if supplier_status != "pending" and client_status != "pending":
-        if supplier_status == "accepted" and client_status == "accepted":
-            update_fields["status_transaction"] = "completed"
-        else:
-            update_fields["status_transaction"] = "cancelled"
-    '''
     # Solo resolver cuando AMBOS ya respondieron
     supplier_responded = supplier_status in ["accepted", "rejected"]
     client_responded = client_status in ["accepted", "rejected"]
@@ -153,57 +238,389 @@ def update_transaction(transaction_id):
             update_fields["status_transaction"] = "completed"
         else:
             update_fields["status_transaction"] = "cancelled"
+        # momento en que se resolvió (lo usa el archivado)
+        if transaction.get("status_transaction") == "pending":
+            update_fields["resolved_at"] = datetime.utcnow()
     else:
         # Aún falta respuesta de uno → mantener pendiente
         update_fields["status_transaction"] = "pending"
 
+    return update_fields, transfer_hours, None
+
+
+INSUFFICIENT_HOURS = "Horas insuficientes para completar la transacción"
+CHANGED_WHILE_UPDATING = "La transacción cambió mientras se actualizaba, intenta de nuevo"
+
+
+def apply_transaction_updates(db, resolved):
+    """
+    Aplica respuestas ya resueltas por resolve_transaction_update.
+    `resolved` es [(transaction, update_fields, transfer_hours)]; regresa una
+    lista paralela de (status, transacción actualizada o error).
+
+    Las horas se descuentan primero, con hours_balance >= total en el filtro
+    (dos peticiones concurrentes no pueden sobregirar al cliente). Los
+    estados van en un solo bulk_write condicionado a que la transacción siga
+    como se leyó; las horas de las que otra petición resolvió antes se
+    devuelven y las de las demás se abonan al proveedor.
+    """
+    outcomes = [None] * len(resolved)
+
+    # cada parte responde una sola vez: repetir un "accepted" no transfiere de nuevo
+    for i, (transaction, update_fields, _) in enumerate(resolved):
+        own_status = [f for f in ('status_supplier', 'status_client') if f in update_fields]
+        if transaction.get('status_transaction') != "pending":
+            outcomes[i] = (409, "La transacción ya fue resuelta")
+        elif any(transaction.get(f) != "pending" for f in own_status):
+            outcomes[i] = (409, "Ya respondiste esta transacción")
+
+    # solo el cliente paga; las que no alcanzan con su saldo se rechazan en orden
+    payers = {}
+    for i, (transaction, _, hours) in enumerate(resolved):
+        if hours and outcomes[i] is None:
+            payers.setdefault(transaction['client_id'], []).append(i)
+    balances = {u['_id']: u.get('hours_balance', 0) for u in db.users.find(
+        {"_id": {"$in": list(payers)}}, {"hours_balance": 1})} if payers else {}
+    for payer, indexes in payers.items():
+        debit = 0
+        for i in indexes:
+            if balances.get(payer, 0) - debit < resolved[i][2]:
+                outcomes[i] = (400, INSUFFICIENT_HOURS)
+            else:
+                debit += resolved[i][2]
+        if debit and db.users.update_one(
+                {"_id": payer, "hours_balance": {"$gte": debit}},
+                {"$inc": {"hours_balance": -debit}}).matched_count == 0:
+            # el saldo cambió entre la lectura y el descuento
+            for i in indexes:
+                outcomes[i] = outcomes[i] or (409, CHANGED_WHILE_UPDATING)
+
+    # update_id marca las que escribió esta llamada (el resultado del
+    # bulk_write solo trae totales)
+    update_id = ObjectId()
+    pending = [i for i in range(len(resolved)) if outcomes[i] is None]
+    applied = set()
+    if pending:
+        ops = [UpdateOne({
+            "_id": resolved[i][0]['_id'],
+            "status_transaction": "pending",
+            "status_supplier": resolved[i][0].get('status_supplier'),
+            "status_client": resolved[i][0].get('status_client')
+        }, {"$set": {**resolved[i][1], "update_id": update_id}}) for i in pending]
+        try:
+            complete = db.transactions.bulk_write(ops, ordered=False).matched_count == len(ops)
+        except BulkWriteError:
+            logger.exception("Error al actualizar transacciones")
+            complete = False
+        ids = [resolved[i][0]['_id'] for i in pending]
+        applied = set(ids) if complete else set(db.transactions.distinct(
+            "_id", {"_id": {"$in": ids}, "update_id": update_id}))
+
+    hour_deltas = {}
+    for i in pending:
+        transaction, update_fields, hours = resolved[i]
+        if transaction['_id'] in applied:
+            outcomes[i] = (200, {**transaction, **update_fields})
+            owner = transaction['supplier_id']
+        else:
+            outcomes[i] = (409, CHANGED_WHILE_UPDATING)
+            owner = transaction['client_id']
+        if hours:
+            hour_deltas[owner] = hour_deltas.get(owner, 0) + hours
+    if hour_deltas:
+        db.users.bulk_write([
+            UpdateOne({"_id": owner}, {"$inc": {"hours_balance": delta}})
+            for owner, delta in hour_deltas.items()
+        ], ordered=False)
+    return outcomes
+
+
+# Actualizar transacción
+@transactions_bp.route('/<transaction_id>', methods=['PUT'])
+@jwt_required()
+def update_transaction(transaction_id):
+    current_user = get_jwt_identity()
+    data = request.get_json() or {}
+    db = get_db()
+    if db is None:
+        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+    try:
+        trans_id = ObjectId(transaction_id)
+        user_id = ObjectId(current_user)
+    except Exception:
+        return jsonify({"error": "ID inválido"}), 400
 
-    if not update_fields:
+    transaction = db.transactions.find_one({"_id": trans_id})
+    if not transaction:
+        return jsonify({"error": "Transacción no encontrada"}), 404
+    # completadas, canceladas o expiradas ya no cambian (la escritura en
+    # apply_transaction_updates también lo exige en el filtro)
+    if transaction.get('status_transaction') != "pending":
+        return jsonify({"error": "La transacción ya fue resuelta"}), 409
+
+    update_fields, transfer_hours, error = resolve_transaction_update(
+        transaction, current_user, data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    if not any(f in update_fields for f in ('status_supplier', 'status_client')):
         return jsonify({"error": "No hay campos para actualizar o no tienes permisos"}), 400
 
     try:
-        db.transactions.update_one({"_id": trans_id}, {"$set": update_fields})
-        updated_transaction = db.transactions.find_one({"_id": trans_id})
+        status, outcome = apply_transaction_updates(
+            db, [(transaction, update_fields, transfer_hours)])[0]
+        if status != 200:
+            return jsonify({"error": outcome}), status
+        updated_transaction = outcome
+        publish_transaction(updated_transaction, "updated")
         return jsonify({
             "message": "Transacción actualizada",
             "transaction": serialize_transaction(updated_transaction)
         }), 200
     except Exception as e:
         return jsonify({"error": f"Error al actualizar transacción: {str(e)}"}), 500
-    
+
+
+# Aceptar o rechazar varias transacciones en una sola petición:
+#   {"items": [{"transaction_id": "...", "status_client": "accepted"}, ...]}
+# Cada elemento tiene su propio resultado; los que fallan no detienen a los demás.
+@transactions_bp.route('/bulk', methods=['POST'])
+@jwt_required()
+@idempotent
+def bulk_update_transactions():
+    current_user = get_jwt_identity()
+    data = request.get_json() or {}
+    items = data.get('items')
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Se requiere 'items' con al menos un elemento"}), 400
+    if len(items) > BULK_MAX_ITEMS:
+        return jsonify({"error": f"Máximo {BULK_MAX_ITEMS} transacciones por petición"}), 400
+
+    try:
+        user_id = ObjectId(current_user)
+    except Exception:
+        return jsonify({"error": "ID inválido"}), 400
+
+    db = get_db()
+    if db is None:
+        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+    raw_ids = [item.get('transaction_id') if isinstance(item, dict) else None
+               for item in items]
+    results = [None] * len(items)
+    pending = {}
+    for i, raw_id in enumerate(raw_ids):
+        # ObjectId(None) genera un id nuevo en lugar de fallar
+        if not isinstance(raw_id, str) or not ObjectId.is_valid(raw_id):
+            results[i] = {"status": 400, "error": "ID de transacción inválido"}
+            continue
+        trans_id = ObjectId(raw_id)
+        if trans_id in pending:
+            results[i] = {"status": 400, "error": "Transacción repetida en la petición"}
+            continue
+        pending[trans_id] = i
+
+    # una sola consulta: solo regresan las transacciones pendientes donde
+    # participa el usuario
+    transactions = {t['_id']: t for t in db.transactions.find({"$and": [
+        {"_id": {"$in": list(pending)}, "status_transaction": "pending"},
+        participant_query(user_id)
+    ]})}
+
+    resolved, positions = [], []
+    for trans_id, i in pending.items():
+        transaction = transactions.get(trans_id)
+        if not transaction:
+            results[i] = {"status": 404, "error": "Transacción no encontrada o ya resuelta"}
+            continue
+        update_fields, transfer_hours, error = resolve_transaction_update(
+            transaction, current_user, items[i])
+        if error:
+            results[i] = {"status": 400, "error": error}
+            continue
+        resolved.append((transaction, update_fields, transfer_hours))
+        positions.append(i)
+
+    for i, (status, outcome) in zip(positions, apply_transaction_updates(db, resolved)):
+        if status != 200:
+            results[i] = {"status": status, "error": outcome}
+            continue
+        publish_transaction(outcome, "updated")
+        results[i] = {"status": 200, "transaction": serialize_transaction(outcome)}
+
+    for raw_id, result in zip(raw_ids, results):
+        result["transaction_id"] = raw_id
+
+    metrics.inc("transactions_bulk_items_total", len(items))
+    return jsonify({
+        "updated": sum(1 for r in results if r["status"] == 200),
+        "results": results
+    }), 200
+
+# Historial de un usuario, más nuevas primero, con ?from= ?to= sobre
+# created_at. Sin ?limit= ni ?cursor= regresa el historial completo (como
+# siempre); con alguno de los dos se pagina y el cursor de la siguiente
+# página va en el encabezado X-Next-Cursor. La respuesta sigue siendo un arreglo.
+def user_history_response(user_id, statuses=None):
+    paginated = "limit" in request.args or "cursor" in request.args
+    try:
+        fields = requested_fields(TRANSACTION_FIELDS)
+        date_filter = date_range_args()
+        limit, cursor = page_args(default_limit=HISTORY_DEFAULT_LIMIT,
+                                  cursor_fields=["created_at", "_id"])
+    except (InvalidFields, InvalidQueryArgs) as e:
+        return jsonify({"error": str(e)}), 400
+
+    db = get_db()
+    if db is None:
+        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+    conditions = [participant_query(user_id)]
+    if statuses:
+        conditions.append({"status_transaction": {"$in": statuses}})
+    if date_filter:
+        conditions.append({"created_at": date_filter})
+    if cursor:
+        conditions.append({"$or": [
+            {"created_at": {"$lt": cursor["created_at"]}},
+            {"created_at": cursor["created_at"], "_id": {"$lt": cursor["_id"]}}
+        ]})
+    query = {"$and": conditions}
+
+    # created_at siempre se lee porque forma parte del cursor
+    sort = [("created_at", -1), ("_id", -1)]
+    collections = [db.transactions]
+    # las pendientes nunca se archivan
+    if statuses != ["pending"]:
+        collections.append(db.transactions_archive)
+
+    transactions = []
+    for collection in collections:
+        found = collection.find(query, projection(fields + ['created_at'])).sort(sort)
+        transactions += list(found.limit(limit + 1) if paginated else found)
+    transactions.sort(key=lambda t: (t['created_at'], t['_id']), reverse=True)
+
+    next_cursor = None
+    if paginated and len(transactions) > limit:
+        transactions = transactions[:limit]
+        last = transactions[-1]
+        next_cursor = encode_cursor({"created_at": last["created_at"], "_id": last["_id"]})
+
+    if 'created_at' not in fields:
+        for t in transactions:
+            t.pop('created_at', None)
+
+    response = jsonify([serialize_transaction(t) for t in transactions])
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response, 200
+
 # Obtener transacciones del usuario
 @transactions_bp.route('/user', methods=['GET'])
 @jwt_required()
 def get_user_transactions():
     current_user = get_jwt_identity()
-    db = get_db()
     try:
         user_id = ObjectId(current_user)
     except Exception:
         return jsonify({"error": "ID de usuario inválido"}), 400
 
-    transactions = list(db.transactions.find({
-        "$or": [{"client_id": user_id}, {"supplier_id": user_id}]
-    }))
-    return jsonify([serialize_transaction(t) for t in transactions]), 200
+    return user_history_response(user_id)
+
+# Resumen mensual de las transacciones del usuario
+@transactions_bp.route('/user/summary', methods=['GET'])
+@jwt_required()
+def get_user_transaction_summary():
+    try:
+        date_filter = date_range_args()
+    except InvalidQueryArgs as e:
+        return jsonify({"error": str(e)}), 400
+
+    current_user = get_jwt_identity()
+    try:
+        user_id = ObjectId(current_user)
+    except Exception:
+        return jsonify({"error": "ID de usuario inválido"}), 400
+
+    db = get_db()
+    if db is None:
+        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+    match = participant_query(user_id)
+    if date_filter:
+        match = {"$and": [match, {"created_at": date_filter}]}
+
+    def count_status(status):
+        return {"$sum": {"$cond": [{"$eq": ["$status_transaction", status]}, 1, 0]}}
+
+    pipeline = [
+        {"$match": match},
+        # incluir las transacciones archivadas
+        {"$unionWith": {"coll": "transactions_archive", "pipeline": [{"$match": match}]}},
+        {
+            "$group": {
+                "_id": {"$dateToString": {"format": "%Y-%m", "date": "$created_at"}},
+                "total": {"$sum": 1},
+                "pending": count_status("pending"),
+                "completed": count_status("completed"),
+                "cancelled": count_status("cancelled"),
+                # horas recibidas / pagadas en transacciones completadas
+                "hours_earned": {"$sum": {"$cond": [
+                    {"$and": [{"$eq": ["$status_transaction", "completed"]},
+                              {"$eq": ["$supplier_id", user_id]}]}, "$hours", 0]}},
+                "hours_spent": {"$sum": {"$cond": [
+                    {"$and": [{"$eq": ["$status_transaction", "completed"]},
+                              {"$eq": ["$client_id", user_id]}]}, "$hours", 0]}}
+            }
+        },
+        {"$sort": {"_id": -1}},
+        {"$project": {"_id": 0, "month": "$_id", "total": 1, "pending": 1,
+                      "completed": 1, "cancelled": 1,
+                      "hours_earned": 1, "hours_spent": 1}}
+    ]
+
+    try:
+        return jsonify(list(db.transactions.aggregate(pipeline))), 200
+    except Exception as e:
+        return jsonify({"error": f"Error al obtener resumen: {str(e)}"}), 500
 
 # Obtener transacciones de un servicio
 @transactions_bp.route('/service/<service_id>', methods=['GET'])
 @jwt_required()
 def get_service_transactions(service_id):
+    try:
+        fields = requested_fields(TRANSACTION_FIELDS)
+    except InvalidFields as e:
+        return jsonify({"error": str(e)}), 400
+
     db = get_db()
     try:
         svc_id = ObjectId(service_id)
     except Exception:
         return jsonify({"error": "ID de servicio inválido"}), 400
 
-    transactions = list(db.transactions.find({"service_id": svc_id}))
+    transactions = list(db.transactions.find(
+        {"service_id": svc_id}, projection(fields)))
+    transactions += list(db.transactions_archive.find(
+        {"service_id": svc_id}, projection(fields)))
     return jsonify([serialize_transaction(t) for t in transactions]), 200
 
 # Admin: obtener todas las transacciones
 @transactions_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_all_transactions():
+    try:
+        fields = requested_fields(TRANSACTION_FIELDS)
+    except InvalidFields as e:
+        return jsonify({"error": str(e)}), 400
+
+    # ?tier=hot (por defecto), archive o all
+    tier = request.args.get('tier', 'hot')
+    if tier not in ['hot', 'archive', 'all']:
+        return jsonify({"error": "tier debe ser hot, archive o all"}), 400
+
     current_user = get_jwt_identity()
     db = get_db()
     try:
@@ -215,9 +632,106 @@ def get_all_transactions():
     if not user or user.get('role') != 'admin':
         return jsonify({"error": "No autorizado"}), 403
 
-    transactions = list(db.transactions.find())
+    transactions = []
+    if tier in ['hot', 'all']:
+        transactions += list(db.transactions.find({}, projection(fields)))
+    if tier in ['archive', 'all']:
+        transactions += list(db.transactions_archive.find({}, projection(fields)))
     return jsonify([serialize_transaction(t) for t in transactions]), 200
 
+# Admin: flujo de horas por día (?from= ?to=). Solo lee rollups_daily; los
+# totales del rango suman los días, excepto los usuarios activos, que son
+# distintos por día y no se pueden sumar.
+@transactions_bp.route('/analytics', methods=['GET'])
+@jwt_required()
+def get_transactions_analytics():
+    try:
+        date_filter = date_range_args()
+    except InvalidQueryArgs as e:
+        return jsonify({"error": str(e)}), 400
+
+    current_user = get_jwt_identity()
+    db = get_db()
+    if db is None:
+        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+    try:
+        user_id = ObjectId(current_user)
+    except Exception:
+        return jsonify({"error": "ID de usuario inválido"}), 400
+
+    user = db.users.find_one({"_id": user_id}, {"role": 1})
+    if not user or user.get('role') != 'admin':
+        return jsonify({"error": "No autorizado"}), 403
+
+    query = {"date": date_filter} if date_filter else {}
+    days = list(db.rollups_daily.find(query, {"_id": 0, "updated_at": 0}).sort("date", 1))
+
+    totals = dict.fromkeys(ROLLUP_COUNTERS, 0)
+    categories = {}
+    for day in days:
+        day["date"] = day["date"].strftime("%Y-%m-%d")
+        for key in ROLLUP_COUNTERS:
+            totals[key] += day[key]
+        for entry in day["categories"]:
+            category = categories.setdefault(
+                entry["category"], dict.fromkeys(ROLLUP_COUNTERS, 0))
+            for key in ROLLUP_COUNTERS:
+                category[key] += entry[key]
+
+    state = db.job_state.find_one({"_id": "rollups_daily"}) or {}
+    watermark = state.get("watermark")
+    return jsonify({
+        "days": days,
+        "totals": totals,
+        "categories": [dict(counters, category=name)
+                       for name, counters in sorted(categories.items())],
+        "updated_through": watermark.isoformat() if watermark else None
+    }), 200
+
+
+# Admin: exportar transacciones en streaming (NDJSON o CSV)
+# ?format=ndjson|csv ?from= ?to= (created_at) ?status= ?tier=hot|archive|all
+@transactions_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_transactions():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return jsonify({"error": "format debe ser ndjson o csv"}), 400
+
+    tier = request.args.get('tier', 'all')
+    if tier not in ['hot', 'archive', 'all']:
+        return jsonify({"error": "tier debe ser hot, archive o all"}), 400
+
+    try:
+        date_filter = date_range_args()
+    except InvalidQueryArgs as e:
+        return jsonify({"error": str(e)}), 400
+
+    db = get_db()
+    if db is None:
+        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+    if not is_admin(db, get_jwt_identity()):
+        return jsonify({"error": "No autorizado"}), 403
+
+    query = {}
+    if date_filter:
+        query["created_at"] = date_filter
+    status = request.args.get('status')
+    if status:
+        query["status_transaction"] = {"$in": status.split(",")}
+
+    fields = projection(TRANSACTION_FIELDS)
+    cursors = []
+    if tier in ['hot', 'all']:
+        cursors.append(db.transactions.find(query, fields))
+    if tier in ['archive', 'all']:
+        cursors.append(db.transactions_archive.find(query, fields))
+
+    return stream_export(cursors, serialize_transaction, fmt,
+                         ['_id'] + TRANSACTION_FIELDS, 'transactions')
+
 # Admin: eliminar transacción
 @transactions_bp.route('/<transaction_id>', methods=['DELETE'])
 @jwt_required()
@@ -234,11 +748,13 @@ def delete_transaction(transaction_id):
     if not user or user.get('role') != 'admin':
         return jsonify({"error": "No autorizado"}), 403
 
-    transaction = db.transactions.find_one({"_id": trans_id})
-    if not transaction:
+    # puede estar en la colección principal o en el archivo
+    result = db.transactions.delete_one({"_id": trans_id})
+    if result.deleted_count == 0:
+        result = db.transactions_archive.delete_one({"_id": trans_id})
+    if result.deleted_count == 0:
         return jsonify({"error": "Transacción no encontrada"}), 404
 
-    db.transactions.delete_one({"_id": trans_id})
     return jsonify({"message": "Transacción eliminada"}), 200
 
 #Endpoints para la sección de Mis transacciones
@@ -247,6 +763,11 @@ def delete_transaction(transaction_id):
 @transactions_bp.route('/user/pending', methods=['GET'])
 @jwt_required()
 def get_user_pending_transactions():
+    try:
+        fields = requested_fields(TRANSACTION_FIELDS)
+    except InvalidFields as e:
+        return jsonify({"error": str(e)}), 400
+
     current_user = get_jwt_identity()
     db = get_db()
 
@@ -260,28 +781,339 @@ def get_user_pending_transactions():
         "client_id": user_id,
         "status_client": "pending",
         "status_transaction": "pending"
-    }))
+    }, projection(fields)))
 
     return jsonify([serialize_transaction(t) for t in transactions]), 200
 
+# Eventos en vivo (server-sent events) de las transacciones del usuario:
+# reemplaza el polling a /user/pending. EventSource no manda encabezados, por
+# eso también se acepta el token en ?jwt=. Un evento "resync" indica que se
+# perdieron eventos y hay que volver a pedir /user/pending.
+@transactions_bp.route('/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_transactions():
+    current_user = get_jwt_identity()
+
+    if CHANGE_STREAM_MODE != "off":
+        transactions_change_stream.start()
+
+    subscription = transaction_events.subscribe([str(current_user)])
+
+    def generate():
+        started = time.monotonic()
+        try:
+            yield "retry: 5000\n\n"
+            while time.monotonic() - started < SSE_MAX_SECONDS:
+                event = subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ": heartbeat\n\n"
+                elif event is OVERFLOW:
+                    yield "event: resync\ndata: {}\n\n"
+                    return
+                else:
+                    yield f"event: transaction\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            subscription.close()
+
+    return Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # evita que nginx acumule los eventos
+        "X-Accel-Buffering": "no"
+    })
+
 # Obtener historial de transacciones del usuario (completadas o canceladas)
 @transactions_bp.route('/user/history', methods=['GET'])
 @jwt_required()
 def get_user_transaction_history():
     current_user = get_jwt_identity()
-    db = get_db()
 
     try:
         user_id = ObjectId(current_user)
     except Exception:
         return jsonify({"error": "ID de usuario inválido"}), 400
 
-    transactions = list(db.transactions.find({
+    return user_history_response(user_id, ["completed", "cancelled"])
+
+# flask transactions backfill-participants
+@transactions_bp.cli.command('backfill-participants')
+def backfill_participants():
+    """Agrega el arreglo participants a las transacciones anteriores."""
+    db = get_db()
+    result = db.transactions.update_many(
+        {"participants": {"$exists": False}},
+        [{"$set": {"participants": ["$client_id", "$supplier_id"]}}]
+    )
+    click.echo(f"Transacciones actualizadas: {result.modified_count}")
+
+
+# Archivado de transacciones terminadas en lotes acotados
+def archive_transactions(db, older_than_days=ARCHIVE_AFTER_DAYS,
+                         batch_size=ARCHIVE_BATCH_SIZE, max_batches=ARCHIVE_MAX_BATCHES):
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    query = {
+        "status_transaction": {"$in": FINISHED_STATUSES},
         "$or": [
-            {"client_id": user_id},
-            {"supplier_id": user_id}
-        ],
-        "status_transaction": {"$in": ["completed", "cancelled"]}
-    }))
+            {"resolved_at": {"$lt": cutoff}},
+            # transacciones resueltas antes de que existiera resolved_at
+            {"resolved_at": {"$exists": False}, "created_at": {"$lt": cutoff}}
+        ]
+    }
+
+    started = time.perf_counter()
+    moved = batches = 0
+    while max_batches is None or batches < max_batches:
+        batch = list(db.transactions.find(query).limit(batch_size))
+        if not batch:
+            break
+
+        try:
+            db.transactions_archive.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # si una corrida anterior se interrumpió, algunas ya están archivadas
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+
+        ids = [t["_id"] for t in batch]
+        db.transactions.delete_many({"_id": {"$in": ids}})
+        moved += len(ids)
+        batches += 1
+
+    metrics.inc("transactions_archived_total", moved)
+    metrics.observe("transactions_archive_seconds", time.perf_counter() - started)
+    return moved
+
+
+@job_handler("archive_transactions")
+def archive_transactions_job(db, payload):
+    archive_transactions(
+        db,
+        older_than_days=payload.get("older_than_days", ARCHIVE_AFTER_DAYS),
+        batch_size=payload.get("batch_size", ARCHIVE_BATCH_SIZE),
+        max_batches=payload.get("max_batches", ARCHIVE_MAX_BATCHES)
+    )
+
+
+register_schedule("archive-transactions", "archive_transactions", ARCHIVE_SWEEP_SECONDS)
+
+
+# flask transactions archive
+@transactions_bp.cli.command('archive')
+@click.option('--older-than-days', default=ARCHIVE_AFTER_DAYS, show_default=True)
+@click.option('--batch-size', default=ARCHIVE_BATCH_SIZE, show_default=True)
+@click.option('--max-batches', default=ARCHIVE_MAX_BATCHES, show_default=True)
+def archive_command(older_than_days, batch_size, max_batches):
+    """Mueve transacciones completadas/canceladas viejas a transactions_archive."""
+    moved = archive_transactions(get_db(), older_than_days, batch_size, max_batches)
+    click.echo(f"Transacciones archivadas: {moved}")
+
+
+# Cancela en lotes acotados las transacciones pendientes más viejas que
+# `max_age_hours` (índice status_transaction + created_at). Las que el
+# cliente ya aceptó no se tocan: sus horas ya se transfirieron.
+def expire_pending_transactions(db, max_age_hours=PENDING_MAX_AGE_HOURS,
+                                batch_size=EXPIRY_BATCH_SIZE, max_batches=EXPIRY_MAX_BATCHES):
+    cutoff = datetime.utcnow() - timedelta(hours=max_age_hours)
+    query = {
+        "status_transaction": "pending",
+        "created_at": {"$lt": cutoff},
+        "status_client": {"$ne": "accepted"}
+    }
+
+    started = time.perf_counter()
+    expired = batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = [t["_id"] for t in db.transactions.find(query, {"_id": 1})
+               .sort("created_at", 1).limit(batch_size)]
+        if not ids:
+            break
+
+        # resolved_at exacto identifica las que canceló este lote (alguna pudo
+        # resolverse entre la lectura y la escritura)
+        resolved_at = datetime.utcnow()
+        db.transactions.update_many(
+            {"_id": {"$in": ids}, **query},
+            {"$set": {
+                "status_transaction": "cancelled",
+                "cancel_reason": "expired",
+                "resolved_at": resolved_at
+            }}
+        )
+        for transaction in db.transactions.find(
+                {"_id": {"$in": ids}, "cancel_reason": "expired", "resolved_at": resolved_at}):
+            publish_transaction(transaction, "updated")
+            expired += 1
+        batches += 1
+
+    duration = time.perf_counter() - started
+    metrics.inc("transactions_expired_total", expired)
+    metrics.observe("transactions_expiry_sweep_seconds", duration)
+    logger.info("Barrido de transacciones pendientes", extra={
+                "expired": expired, "batches": batches, "duration_ms": round(duration * 1000, 2)})
+    return expired
+
+
+@job_handler("expire_pending_transactions")
+def expire_pending_transactions_job(db, payload):
+    expire_pending_transactions(
+        db,
+        max_age_hours=payload.get("max_age_hours", PENDING_MAX_AGE_HOURS),
+        batch_size=payload.get("batch_size", EXPIRY_BATCH_SIZE),
+        max_batches=payload.get("max_batches", EXPIRY_MAX_BATCHES)
+    )
+
+
+if PENDING_MAX_AGE_HOURS > 0:
+    register_schedule("expire-pending-transactions", "expire_pending_transactions",
+                      EXPIRY_SWEEP_SECONDS)
+
+
+# flask transactions expire-pending
+@transactions_bp.cli.command('expire-pending')
+@click.option('--max-age-hours', default=PENDING_MAX_AGE_HOURS, show_default=True)
+@click.option('--batch-size', default=EXPIRY_BATCH_SIZE, show_default=True)
+@click.option('--max-batches', type=int, default=None)
+def expire_pending_command(max_age_hours, batch_size, max_batches):
+    """Cancela las transacciones pendientes más viejas que --max-age-hours."""
+    expired = expire_pending_transactions(get_db(), max_age_hours, batch_size, max_batches)
+    click.echo(f"Transacciones canceladas: {expired}")
+
+
+def _day_start(moment):
+    return datetime(moment.year, moment.month, moment.day)
+
+
+def _new_rollup():
+    return {**dict.fromkeys(ROLLUP_COUNTERS, 0), "suppliers": set(), "clients": set()}
+
+
+def _count_rollup(rollup, transaction, created_day, resolved_day, day):
+    if created_day == day:
+        rollup["created"] += 1
+    if resolved_day == day:
+        status = transaction["status_transaction"]
+        rollup[status] += 1
+        if status == "completed":
+            rollup["hours_transferred"] += transaction.get("hours", 0)
+    rollup["suppliers"].add(transaction.get("supplier_id"))
+    rollup["clients"].add(transaction.get("client_id"))
+
+
+def _rollup_counters(rollup):
+    return {
+        **{key: rollup[key] for key in ROLLUP_COUNTERS},
+        "active_suppliers": len(rollup["suppliers"] - {None}),
+        "active_clients": len(rollup["clients"] - {None})
+    }
+
+
+def _rollup_window(db, start, end):
+    """
+    Recalcula los días [start, end) desde transactions y transactions_archive.
+    Una transacción cuenta como creada el día de created_at y como
+    completada/cancelada el día de resolved_at; sus participantes cuentan
+    como activos en ambos días.
+    """
+    date_range = {"$gte": start, "$lt": end}
+    query = {"$or": [{"created_at": date_range}, {"resolved_at": date_range}]}
+    fields = {"created_at": 1, "resolved_at": 1, "status_transaction": 1, "hours": 1,
+              "supplier_id": 1, "client_id": 1, "service_id": 1}
+
+    # una transacción que se archiva entre las dos consultas puede aparecer en
+    # ambas colecciones: se cuenta una sola vez por _id
+    transactions = {}
+    for collection in (db.transactions, db.transactions_archive):
+        for transaction in collection.find(query, fields):
+            transactions.setdefault(transaction["_id"], transaction)
+
+    # categorías de todos los servicios de la ventana en una sola consulta
+    service_ids = list({t.get("service_id") for t in transactions.values()} - {None})
+    service_categories = {
+        service["_id"]: service.get("categories") or []
+        for service in db.services.find({"_id": {"$in": service_ids}}, {"categories": 1})
+    }
+
+    days = {}
+    for transaction in transactions.values():
+        categories = service_categories.get(transaction.get("service_id"), [])
+        created_day = _day_start(transaction["created_at"])
+        resolved_day = None
+        if transaction.get("status_transaction") in FINISHED_STATUSES:
+            # las resueltas antes de que existiera resolved_at cuentan el día de creación
+            resolved_day = _day_start(transaction.get("resolved_at") or transaction["created_at"])
+
+        for day in {created_day, resolved_day}:
+            if day is None or not start <= day < end:
+                continue
+            rollup = days.setdefault(day, {"all": _new_rollup(), "categories": {}})
+            _count_rollup(rollup["all"], transaction, created_day, resolved_day, day)
+            for category in categories:
+                _count_rollup(rollup["categories"].setdefault(category, _new_rollup()),
+                              transaction, created_day, resolved_day, day)
+
+    now = datetime.utcnow()
+    ops = []
+    day = start
+    while day < end:
+        rollup = days.get(day, {"all": _new_rollup(), "categories": {}})
+        ops.append(ReplaceOne({"_id": day.strftime("%Y-%m-%d")}, {
+            "date": day,
+            **_rollup_counters(rollup["all"]),
+            "categories": [dict(_rollup_counters(counters), category=category)
+                           for category, counters in sorted(rollup["categories"].items())],
+            "updated_at": now
+        }, upsert=True))
+        day += timedelta(days=1)
+    if ops:
+        db.rollups_daily.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def rollup_daily(db, full=False, window_days=ROLLUP_WINDOW_DAYS):
+    """
+    Actualiza rollups_daily desde el día de la última marca de agua
+    (job_state) hasta hoy, en ventanas de `window_days`. Con `full` o en la
+    primera corrida empieza desde la transacción más vieja. Regresa los días
+    escritos.
+    """
+    started = time.perf_counter()
+    horizon = datetime.utcnow() - timedelta(seconds=ROLLUP_SETTLE_SECONDS)
+    state = db.job_state.find_one({"_id": "rollups_daily"}) or {}
+
+    if full or "watermark" not in state:
+        oldest = [t["created_at"] for collection in (db.transactions, db.transactions_archive)
+                  for t in collection.find({}, {"created_at": 1}).sort("created_at", 1).limit(1)]
+        start = _day_start(min(oldest)) if oldest else _day_start(horizon)
+    else:
+        start = _day_start(state["watermark"])
+
+    last_day = _day_start(horizon) + timedelta(days=1)
+    written = 0
+    while start < last_day:
+        end = min(start + timedelta(days=window_days), last_day)
+        written += _rollup_window(db, start, end)
+        # guardar avance por ventana: si se interrumpe, se sigue desde aquí
+        db.job_state.update_one({"_id": "rollups_daily"},
+                                {"$set": {"watermark": min(end, horizon)}}, upsert=True)
+        start = end
+
+    duration = time.perf_counter() - started
+    metrics.observe("transactions_rollup_seconds", duration)
+    logger.info("Rollup diario de transacciones", extra={
+                "days": written, "duration_ms": round(duration * 1000, 2)})
+    return written
+
+
+@job_handler("rollup_transactions_daily")
+def rollup_daily_job(db, payload):
+    rollup_daily(db, full=payload.get("full", False))
+
+
+register_schedule("rollup-transactions-daily", "rollup_transactions_daily", ROLLUP_REFRESH_SECONDS)
+
 
-    return jsonify([serialize_transaction(t) for t in transactions]), 200
\ No newline at end of file
+# flask transactions rollup [--full]
+@transactions_bp.cli.command('rollup')
+@click.option('--full', is_flag=True, help="Recalcular desde la transacción más vieja.")
+def rollup_command(full):
+    """Actualiza los agregados diarios de rollups_daily."""
+    click.echo(f"Días actualizados: {rollup_daily(get_db(), full)}")
@@ -1,12 +1,28 @@
 from flask import Blueprint, jsonify, request
+from config.cache import LocalLRU, TwoTierCache
+from config.budget import no_time_budget
 from config.db import get_db
+from config.fields import InvalidFields, projection, requested_fields
+from config.idempotency import idempotent
+from config.importer import DEFAULT_BATCH_SIZE, detect_format, print_import_report, run_import
+from config.indexes import register_index
+from config.jobs import job_handler
+from config.pagination import InvalidQueryArgs, page_args, split_page
+from config.scheduler import register_schedule
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from bson import ObjectId
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
 from werkzeug.security import generate_password_hash, check_password_hash
-import jwt
+import click
+import io
+import json
+import math
 import os
 import secrets
+import unicodedata
 
 users_bp = Blueprint('users', __name__)
 
@@ -22,13 +38,113 @@ def serialize_doc(doc):
     return doc
 
 
-@users_bp.route('/create', methods=['POST'])
-def create_user():
-    data = request.get_json() or {}
-
-    db = get_db()
-    if db is None:
-        return jsonify({"error": "Base de datos no disponible"}), 500
+# Campos públicos de la tarjeta de usuario y sus valores por defecto
+USER_CARD_DEFAULTS = {
+    "name": "",
+    "profile_image_url": None,
+    "rating_avg": 0,
+    "rating_count": 0,
+    "bio": "",
+    "skills": []
+}
+USER_CARD_FIELDS = list(USER_CARD_DEFAULTS)
+
+# Campos que el propio usuario puede leer de su perfil (?fields=)
+USER_PROFILE_FIELDS = USER_CARD_FIELDS + [
+    "email", "phone", "hours_balance", "role", "is_active",
+    "created_at", "updated_at"
+]
+
+# Búsqueda por habilidad: skills_normalized guarda las habilidades en
+# minúsculas y sin acentos ("Diseño Web" -> "diseno web"); índice multikey
+# con el mismo orden que la búsqueda (mejor calificados primero).
+SKILLS_PLACEHOLDER = "Por definir aún"
+SEARCH_MAX_SKILLS = 10
+register_index("users", [("skills_normalized", 1), ("rating_avg", -1), ("_id", -1)],
+               partialFilterExpression={"is_active": True})
+
+
+def normalize_skill(skill):
+    text = unicodedata.normalize("NFKD", str(skill))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.lower().split())
+
+
+# skills llega como lista de textos o como "a, b, c" (formularios, CSV).
+# Regresa None si no es ninguno de los dos: iterar un texto suelto lo
+# partiría en letras.
+def parse_skills(skills):
+    if skills is None:
+        return []
+    if isinstance(skills, str):
+        skills = skills.split(",")
+    if not isinstance(skills, list) or not all(isinstance(s, str) for s in skills):
+        return None
+    return [s.strip() for s in skills if s.strip()]
+
+
+def normalize_skills(skills):
+    normalized = []
+    for skill in skills or []:
+        if skill == SKILLS_PLACEHOLDER:
+            continue
+        value = normalize_skill(skill)
+        if value and value not in normalized:
+            normalized.append(value)
+    return normalized
+
+
+# Leaderboard de proveedores (ver get_leaderboard). El orden se configura
+# como "campo:dirección,..." y siempre termina en user_id para que los
+# empates tengan un orden estable.
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "50"))
+LEADERBOARD_MIN_REVIEWS = int(os.getenv("LEADERBOARD_MIN_REVIEWS", "3"))
+LEADERBOARD_REBUILD_SECONDS = int(os.getenv("LEADERBOARD_REBUILD_SECONDS", "3600"))
+LEADERBOARD_SORT_FIELDS = ("rating_avg", "rating_count", "created_at")
+
+
+def _parse_leaderboard_sort(raw):
+    sort = {}
+    for item in raw.split(","):
+        field, _, direction = item.strip().partition(":")
+        if field in LEADERBOARD_SORT_FIELDS:
+            sort[field] = 1 if direction.strip() == "1" else -1
+    sort["user_id"] = 1
+    return sort
+
+
+LEADERBOARD_SORT = _parse_leaderboard_sort(
+    os.getenv("LEADERBOARD_SORT", "rating_avg:-1,rating_count:-1"))
+leaderboard_cache = LocalLRU(
+    max_entries=1000, ttl=float(os.getenv("LEADERBOARD_CACHE_TTL", "60")))
+
+
+# Tarjetas públicas en caché (LRU por proceso + nivel compartido).
+# El TTL local es corto porque la invalidación solo limpia el LRU del proceso
+# que la hace; los demás workers se enteran por el nivel compartido.
+user_card_cache = TwoTierCache(
+    "user_card",
+    local_ttl=float(os.getenv("USER_CARD_CACHE_LOCAL_TTL", "5")),
+    shared_ttl=int(os.getenv("USER_CARD_CACHE_TTL", "300")),
+    max_entries=int(os.getenv("USER_CARD_CACHE_MAX_ENTRIES", "10000"))
+)
+
+
+def invalidate_user_card(*user_ids):
+    user_card_cache.invalidate(*[str(user_id) for user_id in user_ids])
+
+
+USER_TEXT_FIELDS = ["name", "email", "password", "role", "phone", "bio", "profile_image_url"]
+
+
+# Reglas de registro (las usan /create y flask users import). Regresa
+# (documento sin password_hash, password, error).
+def new_user_doc(data):
+    # el JSON (o NDJSON del importador) puede traer números, listas, etc.
+    not_text = [field for field in USER_TEXT_FIELDS
+                if data.get(field) is not None and not isinstance(data[field], str)]
+    if not_text:
+        return None, None, f"Deben ser texto: {', '.join(not_text)}"
 
     name = (data.get("name") or "").strip()
     email = (data.get("email") or "").strip().lower()
@@ -38,28 +154,51 @@ def create_user():
         role = "user"
 
     if not all([name, email, password]):
-        return jsonify({"error": "name, email y password son requeridos"}), 400
+        return None, None, "name, email y password son requeridos"
+
+    skills = parse_skills(data.get("skills"))
+    if skills is None:
+        return None, None, "'skills' debe ser una lista de textos"
+
+    user_doc = {
+        "name": name,
+        "email": email,
+        "phone": (data.get("phone") or "1111111").strip(),
+        "bio": (data.get("bio") or "Por definir aún"),
+        "skills": skills or [SKILLS_PLACEHOLDER],
+        "skills_normalized": normalize_skills(skills),
+        "rating_avg": 0.0,
+        "rating_count": 0,
+        "hours_balance": 1.0,
+        "role": role,
+        "is_active": True,
+        "profile_image_url": data.get("profile_image_url") or "https://res.cloudinary.com/diftcqmcr/image/upload/v1764469276/DefaultAvatar_r0blxh.png",
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
+    }
+    return user_doc, password, None
+
+
+@users_bp.route('/create', methods=['POST'])
+def create_user():
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Se esperaba un objeto JSON"}), 400
+
+    db = get_db()
+    if db is None:
+        return jsonify({"error": "Base de datos no disponible"}), 500
+
+    user_doc, password, error = new_user_doc(data)
+    if error:
+        return jsonify({"error": error}), 400
+    role = user_doc["role"]
 
     try:
-        if db.users.find_one({"email": email}):
+        if db.users.find_one({"email": user_doc["email"]}):
             return jsonify({"error": "El email ya está registrado"}), 409
 
-        user_doc = {
-            "name": name,
-            "email": email,
-            "phone": (data.get("phone") or "1111111").strip(),
-            "password_hash": generate_password_hash(password),
-            "bio": (data.get("bio") or "Por definir aún"),
-            "skills": data.get("skills") or ["Por definir aún"],
-            "rating_avg": 0.0,
-            "rating_count": 0,
-            "hours_balance": 1.0,
-            "role": role,
-            "is_active": True,
-            "profile_image_url": data.get("profile_image_url") or "https://res.cloudinary.com/diftcqmcr/image/upload/v1764469276/DefaultAvatar_r0blxh.png",
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        }
+        user_doc["password_hash"] = generate_password_hash(password)
 
         result = db.users.insert_one(user_doc)
         new_user = db.users.find_one({"_id": result.inserted_id})
@@ -72,7 +211,7 @@ def create_user():
 
         return jsonify({
             "message": "Usuario creado exitosamente",
-            "user": serialize_doc(new_user),
+            "user": serialize_user_safe(new_user),
             "token": access_token,
             "role": role
         }), 201
@@ -108,7 +247,7 @@ def login():
 
         return jsonify({
             "message": "Login exitoso",
-            "user": serialize_doc(user),
+            "user": serialize_user_safe(user),
             "token": access_token,
             "role": user.get("role", "user")
         })
@@ -120,6 +259,11 @@ def login():
 @users_bp.route('/profile', methods=['GET'])
 @jwt_required()
 def get_profile():
+    try:
+        fields = requested_fields(USER_PROFILE_FIELDS)
+    except InvalidFields as e:
+        return jsonify({"error": str(e)}), 400
+
     db = get_db()
     if db is None:
         return jsonify({"error": "Base de datos no disponible"}), 500
@@ -127,11 +271,12 @@ def get_profile():
     user_id = get_jwt_identity()
 
     try:
-        user = db.users.find_one({"_id": ObjectId(user_id)})
+        user = db.users.find_one(
+            {"_id": ObjectId(user_id)}, projection(fields))
         if not user:
             return jsonify({"error": "Usuario no encontrado"}), 404
 
-        return jsonify({"user": serialize_doc(user)})
+        return jsonify({"user": serialize_user_safe(user)})
 
     except Exception as e:
         return jsonify({"error": f"Error: {str(e)}"}), 500
@@ -190,11 +335,11 @@ def update_profile():
 
     # 5. SKILLS
     if 'skills' in data:
-        skills = data.get('skills')
-        if isinstance(skills, list) and skills:
-            update_fields['skills'] = skills
-        else:
-            update_fields['skills'] = ["Por definir aún"]
+        skills = parse_skills(data.get('skills'))
+        if skills is None:
+            return jsonify({"error": "'skills' debe ser una lista de textos"}), 400
+        update_fields['skills'] = skills or [SKILLS_PLACEHOLDER]
+        update_fields['skills_normalized'] = normalize_skills(update_fields['skills'])
 
     # 6. FOTO DE PERFIL (URL) Evita que la foto se pueda borrar por accidente al mandar "" en el body
     if 'profile_image_url' in data:
@@ -233,6 +378,8 @@ def update_profile():
         if result.modified_count == 0:
             return jsonify({"error": "No se pudo actualizar el perfil"}), 500
 
+        invalidate_user_card(user['_id'])
+
         updated_user = db.users.find_one({"_id": user['_id']})
 
         return jsonify({
@@ -244,11 +391,24 @@ def update_profile():
         return jsonify({"error": f"Error al actualizar perfil: {str(e)}"}), 500
 
 
+# El rol se lee de la base de datos y no del JWT: un token emitido antes de
+# quitarle el rol a un admin sigue siendo válido hasta que vence.
+def is_admin(db, user_id):
+    try:
+        user_obj_id = ObjectId(user_id)
+    except Exception:
+        return False
+    user = db.users.find_one({"_id": user_obj_id}, {"role": 1})
+    return bool(user) and user.get("role") == "admin"
+
+
 def serialize_user_safe(doc):
     if doc and '_id' in doc:
         doc = doc.copy()
         doc['_id'] = str(doc['_id'])
         doc.pop('password_hash', None)
+        doc.pop('reset_token', None)
+        doc.pop('reset_token_expires_at', None)
     return doc
 
 
@@ -401,6 +561,7 @@ def add_hours():
         {"_id": user_obj_id},
         {"$inc": {"hours_balance": hours_float}}
     )
+    invalidate_user_card(user_obj_id)
 
     updated_user = db.users.find_one({"_id": user_obj_id})
 
@@ -409,37 +570,468 @@ def add_hours():
         "user": serialize_user_safe(updated_user)
     }), 200
 
-# Obtener usuario por ID
+# Abono masivo de horas (campañas de bienvenida). Las filas se validan y se
+# aplican por lotes: una consulta $in para los ids y un bulk_write sin orden.
+GRANT_BATCH_SIZE = int(os.getenv("USERS_GRANT_BATCH_SIZE", "1000"))
+# tope de fallas detalladas en la respuesta; el conteo siempre es completo
+GRANT_MAX_REPORTED_FAILURES = 1000
+# marca filas que no se pudieron leer: (fila, _INVALID_ROW, mensaje)
+_INVALID_ROW = object()
+
+
+def _grant_batch(db, batch, report):
+    valid = []
+    for row, user_id, hours in batch:
+        try:
+            user_obj_id = ObjectId(user_id) if isinstance(user_id, str) else None
+        except Exception:
+            user_obj_id = None
+        if user_obj_id is None:
+            report.fail(row, user_id, "ID de usuario inválido")
+            continue
+        try:
+            hours_float = float(hours)
+            if not math.isfinite(hours_float):
+                raise ValueError(hours)
+        except (TypeError, ValueError):
+            report.fail(row, user_id, "El valor de horas debe ser numérico")
+            continue
+        if hours_float <= 0:
+            report.fail(row, user_id, "Las horas a agregar deben ser mayores a 0")
+            continue
+        valid.append((row, user_id, user_obj_id, hours_float))
 
+    existing = {u["_id"] for u in db.users.find(
+        {"_id": {"$in": list({v[2] for v in valid})}}, {"_id": 1})}
 
-@users_bp.route('/<user_id>', methods=['GET'])
-def get_user_by_id(user_id):
+    ops, applied = [], []
+    for row, user_id, user_obj_id, hours_float in valid:
+        if user_obj_id not in existing:
+            report.fail(row, user_id, "Usuario no encontrado")
+            continue
+        ops.append(UpdateOne({"_id": user_obj_id}, {"$inc": {"hours_balance": hours_float}}))
+        applied.append((row, user_id, user_obj_id, hours_float))
+
+    if not ops:
+        return
+
+    failed = {}
+    try:
+        db.users.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        failed = {err["index"]: err.get("errmsg", "Error al abonar horas")
+                  for err in e.details.get("writeErrors", [])}
+
+    for index, (row, user_id, user_obj_id, hours_float) in enumerate(applied):
+        if index in failed:
+            report.fail(row, user_id, failed[index])
+        else:
+            report.granted += 1
+            report.hours += hours_float
+    invalidate_user_card(*{user_obj_id for _, _, user_obj_id, _ in applied})
+
+
+class _GrantReport:
+
+    def __init__(self):
+        self.granted = 0
+        self.hours = 0.0
+        self.failed = 0
+        self.failures = []
+
+    def fail(self, row, user_id, error):
+        self.failed += 1
+        if len(self.failures) < GRANT_MAX_REPORTED_FAILURES:
+            self.failures.append({"row": row, "user_id": user_id, "error": error})
+
+    def to_dict(self):
+        return {"granted": self.granted, "hours": self.hours,
+                "failed": self.failed, "failures": self.failures}
+
+
+def grant_hours(db, rows, batch_size=GRANT_BATCH_SIZE):
+    """
+    Abona horas a muchos usuarios. `rows` es un iterable de
+    (número de fila, user_id, horas); se consume por lotes, así que puede ser
+    un generador sobre un archivo grande.
+    """
+    report = _GrantReport()
+    batch = []
+    for row in rows:
+        if row[1] is _INVALID_ROW:
+            report.fail(row[0], None, row[2])
+            continue
+        batch.append(row)
+        if len(batch) >= batch_size:
+            _grant_batch(db, batch, report)
+            batch = []
+    if batch:
+        _grant_batch(db, batch, report)
+    return report
+
+
+def _item_row(row, item):
+    if not isinstance(item, dict):
+        return row, _INVALID_ROW, "Cada elemento debe ser un objeto con 'user_id' y 'hours'"
+    return row, item.get("user_id"), item.get("hours")
+
+
+def ndjson_grant_rows(lines):
+    for row, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            yield row, _INVALID_ROW, "JSON inválido"
+            continue
+        yield _item_row(row, item)
+
+
+# Admin: abonar horas a muchos usuarios. Acepta JSON ({"items": [...]} o una
+# lista) o NDJSON (Content-Type: application/x-ndjson), una fila por línea:
+#   {"user_id": "...", "hours": 5}
+# Corre sin presupuesto de tiempo (cortarla dejaría lotes aplicados sin
+# reporte); con Idempotency-Key un reintento recibe el reporte original en
+# lugar de abonar otra vez.
+@users_bp.route('/add-hours/bulk', methods=['POST'])
+@jwt_required()
+@idempotent(renew_lock=True)
+@no_time_budget
+def add_hours_bulk():
     db = get_db()
+    if db is None:
+        return jsonify({"error": "Base de datos no disponible"}), 500
+
+    if not is_admin(db, get_jwt_identity()):
+        return jsonify({"error": "No autorizado"}), 403
+
+    if request.mimetype == "application/x-ndjson":
+        # con Idempotency-Key el cuerpo ya se leyó completo para la huella
+        stream = io.BytesIO(request.get_data()) if "Idempotency-Key" in request.headers \
+            else request.stream
+        rows = ndjson_grant_rows(stream)
+    else:
+        data = request.get_json(silent=True)
+        items = data.get("items") if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "Se requiere una lista de {'user_id', 'hours'}"}), 400
+        rows = (_item_row(row, item) for row, item in enumerate(items, start=1))
+
+    report = grant_hours(db, rows)
+    return jsonify(report.to_dict()), 200
+
+
+# Los mejores proveedores (general y por categoría de sus servicios). Se
+# materializa en la colección leaderboards ({_id: "overall" o
+# "category:<nombre>", entries: [...]}) y se sirve desde memoria.
+@users_bp.route('/leaderboard', methods=['GET'])
+def get_leaderboard():
+    category = (request.args.get("category") or "").strip()
+    board_id = f"category:{category}" if category else "overall"
+    try:
+        limit, _ = page_args(default_limit=LEADERBOARD_SIZE, max_limit=LEADERBOARD_SIZE)
+    except InvalidQueryArgs as e:
+        return jsonify({"error": str(e)}), 400
+
+    board = leaderboard_cache.get(board_id)
+    if board is None:
+        db = get_db()
+        if db is None:
+            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+        doc = db.leaderboards.find_one({"_id": board_id}) or {}
+        updated_at = doc.get("updated_at")
+        board = {
+            "entries": [
+                dict(entry, user_id=str(entry["user_id"]), rank=rank,
+                     created_at=entry["created_at"].isoformat()
+                     if isinstance(entry.get("created_at"), datetime) else entry.get("created_at"))
+                for rank, entry in enumerate(doc.get("entries", []), start=1)
+            ],
+            "updated_at": updated_at.isoformat() if updated_at else None
+        }
+        leaderboard_cache.set(board_id, board)
+
+    return jsonify({
+        "category": category or None,
+        "min_reviews": LEADERBOARD_MIN_REVIEWS,
+        "entries": board["entries"][:limit],
+        "updated_at": board["updated_at"]
+    }), 200
+
+
+# Buscar proveedores activos por habilidad:
+#   ?skills=python,diseño web&match=any|all&limit=&cursor=&fields=
+# Ordenados por calificación; la respuesta trae solo campos de la tarjeta.
+@users_bp.route('/search', methods=['GET'])
+def search_users_by_skill():
+    try:
+        fields = requested_fields(USER_CARD_FIELDS)
+        limit, cursor = page_args(cursor_fields=["rating_avg", "_id"])
+    except (InvalidFields, InvalidQueryArgs) as e:
+        return jsonify({"error": str(e)}), 400
 
+    skills = normalize_skills(",".join(request.args.getlist("skills")).split(","))
+    if not skills:
+        return jsonify({"error": "Se requiere al menos una habilidad en 'skills'"}), 400
+    if len(skills) > SEARCH_MAX_SKILLS:
+        return jsonify({"error": f"Máximo {SEARCH_MAX_SKILLS} habilidades por búsqueda"}), 400
+
+    match = request.args.get("match", "any")
+    if match not in ("any", "all"):
+        return jsonify({"error": "match debe ser any o all"}), 400
+
+    db = get_db()
     if db is None:
         return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
 
+    query = {
+        "skills_normalized": {"$in" if match == "any" else "$all": skills},
+        "is_active": True
+    }
+    if cursor:
+        query["$or"] = [
+            {"rating_avg": {"$lt": cursor["rating_avg"]}},
+            {"rating_avg": cursor["rating_avg"], "_id": {"$lt": cursor["_id"]}}
+        ]
+
+    try:
+        users = list(db.users.find(query, projection(fields + ["rating_avg"]))
+                     .sort([("rating_avg", -1), ("_id", -1)])
+                     .limit(limit + 1))
+        users, next_cursor = split_page(users, limit, ["rating_avg", "_id"])
+    except Exception as e:
+        return jsonify({"error": f"Error al buscar usuarios: {str(e)}"}), 500
+
+    cards = []
+    for user in users:
+        card = {"_id": str(user["_id"])}
+        for field in fields:
+            card[field] = user.get(field, USER_CARD_DEFAULTS[field])
+        cards.append(card)
+
+    return jsonify({"users": cards, "next_cursor": next_cursor}), 200
+
+
+# Obtener usuario por ID
+
+
+@users_bp.route('/<user_id>', methods=['GET'])
+def get_user_by_id(user_id):
+    try:
+        fields = requested_fields(USER_CARD_FIELDS)
+    except InvalidFields as e:
+        return jsonify({"error": str(e)}), 400
+
     try:
         user_obj_id = ObjectId(user_id)
     except:
         return jsonify({"error": "ID de usuario inválido"}), 400
 
-    # Traemos al usuario completo para poder filtrar campos
-    user = db.users.find_one({"_id": user_obj_id})
+    # en caché se guarda la tarjeta completa; ?fields= se aplica al responder
+    card = user_card_cache.get(str(user_obj_id))
 
-    if not user:
-        return jsonify({"error": "Usuario no encontrado"}), 404
+    if card is None:
+        db = get_db()
 
-    # Solo los campos necesarios para el modal
-    user_filtered = {
-        "_id": str(user["_id"]),
-        "name": user.get("name", ""),
-        "profile_image_url": user.get("profile_image_url", None),
-        "rating_avg": user.get("rating_avg", 0),
-        "rating_count": user.get("rating_count", 0),
-        "bio": user.get("bio", ""),
-        "skills": user.get("skills", [])
-    }
+        if db is None:
+            return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+        # Solo los campos necesarios para el modal
+        user = db.users.find_one({"_id": user_obj_id}, projection(USER_CARD_FIELDS))
+
+        if not user:
+            return jsonify({"error": "Usuario no encontrado"}), 404
+
+        card = {"_id": str(user["_id"])}
+        for field in USER_CARD_FIELDS:
+            card[field] = user.get(field, USER_CARD_DEFAULTS[field])
+        user_card_cache.set(str(user_obj_id), card)
+
+    user_filtered = {"_id": card["_id"]}
+    for field in fields:
+        user_filtered[field] = card[field]
 
     return jsonify({"user": user_filtered}), 200
 
+
+# flask users grant-hours archivo.ndjson (o - para stdin)
+@users_bp.cli.command('grant-hours')
+@click.argument('source', type=click.File('rb'))
+@click.option('--batch-size', default=GRANT_BATCH_SIZE, show_default=True)
+def grant_hours_command(source, batch_size):
+    """Abona horas desde un NDJSON con una fila {"user_id", "hours"} por línea."""
+    report = grant_hours(get_db(), ndjson_grant_rows(source), batch_size)
+    click.echo(f"Usuarios abonados: {report.granted} ({report.hours} horas)")
+    for failure in report.failures:
+        click.echo(f"Fila {failure['row']}: {failure['error']} ({failure['user_id']})", err=True)
+    if report.failed > len(report.failures):
+        click.echo(f"... y {report.failed - len(report.failures)} fallas más", err=True)
+
+
+def _prepare_user_rows(pool):
+    def prepare(db, rows):
+        prepared, pending = [], []
+        seen = set()
+        for row, record in rows:
+            if not isinstance(record, dict):
+                prepared.append((row, None, "Registro inválido"))
+                continue
+            user_doc, password, error = new_user_doc(record)
+            if not error and user_doc["email"] in seen:
+                error = "Email repetido en el archivo"
+            if error:
+                prepared.append((row, None, error))
+                continue
+            seen.add(user_doc["email"])
+            prepared.append((row, user_doc, None))
+            pending.append((len(prepared) - 1, password))
+
+        existing = {u["email"] for u in db.users.find(
+            {"email": {"$in": list(seen)}}, {"email": 1})}
+        # los emails ya registrados se descartan antes de calcular su hash
+        to_hash = []
+        for index, password in pending:
+            row, user_doc, _ = prepared[index]
+            if user_doc["email"] in existing:
+                prepared[index] = (row, None, "El email ya está registrado")
+            else:
+                to_hash.append((index, password))
+
+        # el hash es lo más caro de la importación: se reparte entre procesos
+        hashes = pool.map(generate_password_hash, [password for _, password in to_hash],
+                          chunksize=max(1, len(to_hash) // (4 * (os.cpu_count() or 1))))
+        for (index, _), password_hash in zip(to_hash, hashes):
+            prepared[index][1]["password_hash"] = password_hash
+        return prepared
+    return prepare
+
+
+# flask users import usuarios.ndjson|usuarios.csv
+@users_bp.cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True)
+@click.option('--workers', type=int, default=None, help='Procesos para el hash de contraseñas.')
+@click.option('--restart', is_flag=True, help='Ignora el checkpoint y empieza de cero.')
+def import_users_command(path, batch_size, workers, restart):
+    """Crea usuarios desde NDJSON o CSV con las reglas de /create."""
+    checkpoint_path = f"{path}.checkpoint"
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            open(path, newline="", encoding="utf-8") as source:
+        report = run_import(get_db(), "users", source, detect_format(path),
+                            _prepare_user_rows(pool), batch_size, checkpoint_path)
+    print_import_report(report)
+
+
+# flask users backfill-skills
+@users_bp.cli.command('backfill-skills')
+@click.option('--batch-size', default=500, show_default=True)
+def backfill_skills_command(batch_size):
+    """Calcula skills_normalized para los usuarios existentes."""
+    db = get_db()
+
+    updated = 0
+    batch = []
+    for user in db.users.find({}, {"skills": 1}).batch_size(batch_size):
+        batch.append(UpdateOne({"_id": user["_id"]},
+                               {"$set": {"skills_normalized": normalize_skills(user.get("skills"))}}))
+        if len(batch) >= batch_size:
+            updated += db.users.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += db.users.bulk_write(batch, ordered=False).modified_count
+
+    click.echo(f"Usuarios actualizados: {updated}")
+
+
+# Entradas del leaderboard a partir de usuarios: [{"$match"...}] + esto
+LEADERBOARD_ENTRY_STAGES = [
+    {"$project": {
+        "_id": 0, "user_id": "$_id", "name": 1, "profile_image_url": 1,
+        "rating_avg": 1, "rating_count": 1, "created_at": 1
+    }},
+    {"$sort": LEADERBOARD_SORT}
+]
+
+
+def _leaderboard_user_match():
+    return {"is_active": True, "rating_count": {"$gte": LEADERBOARD_MIN_REVIEWS}}
+
+
+def rebuild_leaderboards(db):
+    """Recalcula todos los leaderboards desde cero (trabajo periódico)."""
+    now = datetime.utcnow()
+    boards = {"overall": list(db.users.aggregate(
+        [{"$match": _leaderboard_user_match()}] + LEADERBOARD_ENTRY_STAGES
+        + [{"$limit": LEADERBOARD_SIZE}], allowDiskUse=True))}
+
+    # por categoría: dueños de servicios de la categoría que califican
+    for row in db.services.aggregate([
+        {"$unwind": "$categories"},
+        {"$group": {"_id": "$categories", "owners": {"$addToSet": "$owner_id"}}}
+    ], allowDiskUse=True):
+        entries = list(db.users.aggregate(
+            [{"$match": {"_id": {"$in": row["owners"]}, **_leaderboard_user_match()}}]
+            + LEADERBOARD_ENTRY_STAGES + [{"$limit": LEADERBOARD_SIZE}]))
+        if entries:
+            boards[f"category:{row['_id']}"] = entries
+
+    db.leaderboards.bulk_write([
+        ReplaceOne({"_id": board_id}, {"entries": entries, "updated_at": now}, upsert=True)
+        for board_id, entries in boards.items()
+    ], ordered=False)
+    db.leaderboards.delete_many({"_id": {"$nin": list(boards)}})
+    return len(boards)
+
+
+def update_leaderboard_entry(db, user_id):
+    """
+    Actualiza la entrada de un usuario después de recalcular su rating. Si
+    sale del top la lista queda con un lugar menos hasta la siguiente
+    reconstrucción.
+    """
+    categories = db.services.distinct("categories", {"owner_id": user_id})
+    board_ids = ["overall"] + [f"category:{c}" for c in categories]
+
+    entries = list(db.users.aggregate(
+        [{"$match": {"_id": user_id, **_leaderboard_user_match()}}] + LEADERBOARD_ENTRY_STAGES))
+
+    # $pull y $push sobre el mismo arreglo no pueden ir en una sola operación
+    db.leaderboards.update_many({"_id": {"$in": board_ids}},
+                                {"$pull": {"entries": {"user_id": user_id}}})
+    if entries:
+        # upsert por tablero: la primera entrada de una categoría nueva lo crea
+        now = datetime.utcnow()
+        db.leaderboards.bulk_write([
+            UpdateOne({"_id": board_id}, {
+                "$push": {"entries": {
+                    "$each": entries,
+                    "$sort": LEADERBOARD_SORT,
+                    "$slice": LEADERBOARD_SIZE
+                }},
+                "$set": {"updated_at": now}
+            }, upsert=True)
+            for board_id in board_ids
+        ], ordered=False)
+    leaderboard_cache.delete(*board_ids)
+
+
+@job_handler("rebuild_leaderboards")
+def rebuild_leaderboards_job(db, payload):
+    rebuild_leaderboards(db)
+
+
+register_schedule("rebuild-leaderboards", "rebuild_leaderboards", LEADERBOARD_REBUILD_SECONDS)
+
+
+# flask users rebuild-leaderboards
+@users_bp.cli.command('rebuild-leaderboards')
+def rebuild_leaderboards_command():
+    """Recalcula el leaderboard general y por categoría."""
+    click.echo(f"Leaderboards actualizados: {rebuild_leaderboards(get_db())}")
@@ -0,0 +1,63 @@
+import os
+import sys
+
+import mongomock
+import pytest
+from mongomock import collection as mongomock_collection
+
+# Las pruebas corren contra mongomock: no hace falta un MongoDB real.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.update({
+    "JWT_SECRET": "pruebas-" + "x" * 32,
+    "MONGO_URI": "mongodb://localhost",
+    "DB_NAME": "pruebas",
+    "JOBS_WORKERS": "0",
+    "SCHEDULER_ENABLED": "0",
+})
+
+import config.db  # noqa: E402
+
+
+# pymongo 4.9+ pasa `sort` a las operaciones de bulk_write; mongomock no lo acepta
+def _drop_sort(method):
+    def wrapper(self, *args, sort=None, **kwargs):
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+_builder = mongomock_collection.BulkOperationBuilder
+_builder.add_update = _drop_sort(_builder.add_update)
+_builder.add_replace = _drop_sort(_builder.add_replace)
+
+
+@pytest.fixture
+def db():
+    client = mongomock.MongoClient()
+    config.db._client = client
+    config.db._client_pid = os.getpid()
+    yield client[os.environ["DB_NAME"]]
+    config.db._client = None
+
+
+@pytest.fixture
+def app(db):
+    from app import app
+    app.config["TESTING"] = True
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth(app):
+    """auth(user_id, role="user") -> encabezados con un JWT válido."""
+    from flask_jwt_extended import create_access_token
+
+    def headers(user_id, role="user"):
+        with app.app_context():
+            token = create_access_token(identity=str(user_id), additional_claims={"role": role})
+        return {"Authorization": f"Bearer {token}"}
+    return headers
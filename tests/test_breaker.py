@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+from pymongo.errors import ConnectionFailure
+
+from config import breaker as breaker_module
+from config.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(breaker_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker("pruebas", failure_threshold=2, reset_timeout=10)
+
+
+def test_opens_after_threshold_and_rejects(breaker):
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert breaker.before_call() == (False, False, 10)
+
+
+def test_half_open_allows_a_single_probe_that_closes(breaker, clock):
+    breaker.record_failure()
+    breaker.record_failure()
+    clock[0] += 10
+
+    assert breaker.before_call() == (True, True, 0)
+    assert breaker.state == HALF_OPEN
+    assert breaker.before_call()[0] is False
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.before_call() == (True, False, 0)
+
+
+def test_failed_probe_reopens(breaker, clock):
+    breaker.record_failure()
+    breaker.record_failure()
+    clock[0] += 10
+    breaker.before_call()
+
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert breaker.before_call()[0] is False
+
+
+class RecordingStop(threading.Event):
+    def __init__(self):
+        super().__init__()
+        self.waits = []
+
+    def wait(self, timeout=None):
+        self.waits.append(timeout)
+        return False
+
+
+def test_backoff_waits_retry_after_when_open(breaker):
+    stop = RecordingStop()
+
+    breaker.backoff(CircuitOpen("abierto", 7), stop)
+
+    assert stop.waits == [7]
+    assert breaker.state == CLOSED
+
+
+def test_backoff_counts_connection_failures(breaker):
+    stop = RecordingStop()
+
+    for _ in range(2):
+        breaker.backoff(ConnectionFailure("timeout"), stop)
+
+    assert stop.waits == [10, 10]
+    assert breaker.state == OPEN
@@ -0,0 +1,72 @@
+import time
+
+import pytest
+from flask import Flask, jsonify
+from pymongo.errors import ExecutionTimeout, ServerSelectionTimeoutError
+
+from config import budget
+from config.budget import init_budgets, remaining_seconds
+
+
+def make_app(monkeypatch, default_ms=200, routes=None):
+    monkeypatch.setattr(budget, "DEFAULT_BUDGET_MS", default_ms)
+    monkeypatch.setattr(budget, "ROUTE_BUDGETS_MS", routes or {})
+    app = Flask(__name__)
+    seen = {}
+
+    @app.route("/remaining")
+    def remaining():
+        seen["remaining"] = remaining_seconds()
+        return jsonify({})
+
+    @app.route("/timeout")
+    def timeout():
+        raise ExecutionTimeout("operation exceeded time limit", 50)
+
+    @app.route("/slow-error")
+    def slow_error():
+        time.sleep(0.25)
+        return jsonify({"error": "Error: tiempo"}), 500
+
+    @app.route("/down")
+    def down():
+        raise ServerSelectionTimeoutError("sin servidores")
+
+    init_budgets(app)
+    return app.test_client(), seen
+
+
+def test_view_sees_its_remaining_budget(monkeypatch):
+    client, seen = make_app(monkeypatch)
+
+    assert client.get("/remaining").status_code == 200
+    assert 0 < seen["remaining"] <= 0.2
+
+
+def test_mongo_timeout_becomes_504(monkeypatch):
+    client, _ = make_app(monkeypatch)
+
+    assert client.get("/timeout").status_code == 504
+
+
+def test_500_after_the_deadline_becomes_504(monkeypatch):
+    client, _ = make_app(monkeypatch)
+
+    assert client.get("/slow-error").status_code == 504
+
+
+def test_unreachable_mongo_is_not_a_budget_error(monkeypatch):
+    client, _ = make_app(monkeypatch)
+    client.application.testing = True
+
+    with pytest.raises(ServerSelectionTimeoutError):
+        client.get("/down")
+
+
+def test_route_override_disables_budget(monkeypatch):
+    client, seen = make_app(monkeypatch, routes={"remaining": 0, "slow_error": 0})
+
+    client.get("/remaining")
+
+    assert seen["remaining"] is None
+    assert client.get("/slow-error").status_code == 500
@@ -0,0 +1,74 @@
+import logging
+import sys
+
+import pytest
+
+from config import cache
+from config.cache import MemoryStore, TwoTierCache
+
+
+@pytest.fixture(params=["local", "shared"])
+def card_cache(request, monkeypatch):
+    store = MemoryStore() if request.param == "shared" else None
+    monkeypatch.setattr(cache, "get_shared_store", lambda: store)
+    return TwoTierCache("pruebas", local_ttl=5, shared_ttl=300)
+
+
+def test_stale_write_after_invalidation_is_dropped(card_cache):
+    # un lector leyó la base antes de que otra petición actualizara al usuario
+    stale = {"name": "viejo"}
+    card_cache.invalidate("u1")
+    card_cache.set("u1", stale)
+
+    assert card_cache.get("u1") is None
+
+
+def test_set_and_get(card_cache):
+    card_cache.set("u1", {"name": "Ana"})
+
+    assert card_cache.get("u1") == {"name": "Ana"}
+
+
+def test_cache_accepts_writes_after_tombstone_expires(monkeypatch):
+    store = MemoryStore()
+    monkeypatch.setattr(cache, "get_shared_store", lambda: store)
+    card_cache = TwoTierCache("pruebas", local_ttl=5, shared_ttl=300, tombstone_ttl=0.01)
+
+    card_cache.invalidate("u1")
+    store._data.clear()
+    card_cache.local.delete("u1")
+    card_cache.set("u1", {"name": "nuevo"})
+
+    assert card_cache.get("u1") == {"name": "nuevo"}
+
+
+def test_user_card_is_not_recached_stale_after_update(client, auth, db, monkeypatch):
+    from routes import users
+
+    monkeypatch.setattr(cache, "get_shared_store", lambda: MemoryStore())
+    user_id = db.users.insert_one({"name": "Ana", "email": "ana@example.com"}).inserted_id
+    find_one = db.users.find_one
+
+    def find_then_update(*args, **kwargs):
+        doc = find_one(*args, **kwargs)
+        # el perfil cambia entre la lectura y el guardado en caché
+        db.users.update_one({"_id": user_id}, {"$set": {"name": "Ana María"}})
+        users.invalidate_user_card(user_id)
+        return doc
+    monkeypatch.setattr(db.users, "find_one", find_then_update)
+    client.get(f"/api/users/{user_id}")
+    monkeypatch.setattr(db.users, "find_one", find_one)
+
+    response = client.get(f"/api/users/{user_id}")
+
+    assert response.get_json()["user"]["name"] == "Ana María"
+
+
+def test_missing_redis_client_is_logged(monkeypatch, caplog):
+    monkeypatch.setattr(cache, "REDIS_URL", "redis://localhost:6379/0")
+    monkeypatch.setitem(sys.modules, "redis", None)
+
+    with caplog.at_level(logging.WARNING, logger="config.cache"):
+        assert cache._default_shared_store() is None
+
+    assert "redis no está instalado" in caplog.text
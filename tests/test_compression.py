@@ -0,0 +1,56 @@
+import gzip
+import json
+
+import brotli
+import pytest
+from flask import Flask, jsonify
+
+from config import compression
+from config.compression import choose_encoding, init_compression
+
+BIG = [{"title": f"Servicio {i}", "description": "Clases de guitarra"} for i in range(100)]
+
+
+@pytest.fixture
+def compressed_client():
+    app = Flask(__name__)
+    init_compression(app)
+
+    @app.route("/big")
+    def big():
+        return jsonify(BIG)
+
+    @app.route("/small")
+    def small():
+        return jsonify({"ok": True})
+
+    return app.test_client()
+
+
+def test_prefers_brotli_when_accepted(compressed_client):
+    response = compressed_client.get("/big", headers={"Accept-Encoding": "gzip, br"})
+
+    assert response.headers["Content-Encoding"] == "br"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert json.loads(brotli.decompress(response.get_data())) == BIG
+
+
+def test_falls_back_to_gzip(compressed_client):
+    response = compressed_client.get("/big", headers={"Accept-Encoding": "gzip, br;q=0"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.get_data())) == BIG
+
+
+def test_small_responses_are_not_compressed(compressed_client):
+    response = compressed_client.get("/small", headers={"Accept-Encoding": "gzip, br"})
+
+    assert "Content-Encoding" not in response.headers
+    assert len(response.get_data()) < compression.MIN_SIZE
+    assert response.get_json() == {"ok": True}
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None), ("identity", None), ("*", "br"), ("br;q=0.5, gzip", "gzip")])
+def test_choose_encoding(header, expected):
+    assert choose_encoding(header) == expected
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pytest
+
+import config.db
+from config import jobs
+from config.breaker import CLOSED, OPEN, CircuitBreaker
+from config.db import DatabaseUnavailable
+
+PRIMARY = ("db1", 27017)
+SECONDARY = ("db2", 27017)
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker("pruebas", failure_threshold=2, reset_timeout=60)
+    monkeypatch.setattr(config.db, "breaker", breaker)
+    return breaker
+
+
+def topology(monkeypatch, *writable):
+    monkeypatch.setattr(config.db, "_writable_servers", frozenset(writable))
+
+
+def heartbeat_failed(address):
+    config.db._HeartbeatListener().failed(
+        SimpleNamespace(connection_id=address, reply=Exception("timeout")))
+
+
+def test_dead_secondary_does_not_open_breaker(monkeypatch, breaker):
+    topology(monkeypatch, PRIMARY)
+
+    for _ in range(5):
+        heartbeat_failed(SECONDARY)
+
+    assert breaker.state == CLOSED
+
+
+def test_dead_primary_opens_breaker(monkeypatch, breaker):
+    topology(monkeypatch, PRIMARY)
+
+    heartbeat_failed(PRIMARY)
+    # el driver ya marcó al primario como desconocido
+    topology(monkeypatch)
+    heartbeat_failed(PRIMARY)
+
+    assert breaker.state == OPEN
+
+
+def test_secondary_heartbeat_does_not_reset_failures(monkeypatch, breaker):
+    topology(monkeypatch)
+    listener = config.db._HeartbeatListener()
+
+    heartbeat_failed(PRIMARY)
+    listener.succeeded(SimpleNamespace(reply=SimpleNamespace(is_writable=False)))
+    heartbeat_failed(PRIMARY)
+
+    assert breaker.state == OPEN
+
+
+def test_worker_checks_breaker_on_every_iteration(monkeypatch):
+    pool = jobs.WorkerPool(1)
+    calls = []
+
+    def unavailable():
+        calls.append(1)
+        if len(calls) >= 3:
+            pool.stop()
+        raise DatabaseUnavailable(0)
+    monkeypatch.setattr(jobs, "get_db", unavailable)
+
+    pool._run("prueba")
+
+    assert len(calls) == 3
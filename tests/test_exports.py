@@ -0,0 +1,20 @@
+import pytest
+
+
+@pytest.mark.parametrize("path", ["/api/reviews/export", "/api/transactions/export"])
+def test_export_checks_role_in_database(client, auth, db, path):
+    # el token todavía dice admin, pero ya se le quitó el rol
+    demoted = db.users.insert_one({"name": "Ex admin", "role": "user"}).inserted_id
+
+    response = client.get(path, headers=auth(demoted, role="admin"))
+
+    assert response.status_code == 403
+
+
+@pytest.mark.parametrize("path", ["/api/reviews/export", "/api/transactions/export"])
+def test_export_allows_admin(client, auth, db, path):
+    admin = db.users.insert_one({"name": "Admin", "role": "admin"}).inserted_id
+
+    response = client.get(path, headers=auth(admin, role="admin"))
+
+    assert response.status_code == 200
@@ -0,0 +1,54 @@
+from bson import ObjectId
+
+import pytest
+
+
+@pytest.fixture
+def user(db):
+    user_id = db.users.insert_one({
+        "name": "Ana", "email": "ana@example.com", "password_hash": "hash",
+        "reset_token": "secreto", "hours_balance": 5, "is_active": True
+    }).inserted_id
+    return user_id
+
+
+@pytest.mark.parametrize("fields", ["", ",", " , "])
+def test_profile_rejects_empty_fields(client, auth, user, fields):
+    response = client.get(f"/api/users/profile?fields={fields}", headers=auth(user))
+
+    assert response.status_code == 400
+
+
+def test_profile_never_returns_private_fields(client, auth, user):
+    response = client.get("/api/users/profile", headers=auth(user))
+
+    assert response.status_code == 200
+    body = response.get_json()["user"]
+    assert body["name"] == "Ana"
+    assert "password_hash" not in body
+    assert "reset_token" not in body
+
+
+def test_profile_rejects_unknown_fields(client, auth, user):
+    response = client.get("/api/users/profile?fields=password_hash", headers=auth(user))
+
+    assert response.status_code == 400
+
+
+def test_reviews_by_user_rejects_empty_fields(client, user):
+    response = client.get(f"/api/reviews/user/{user}?fields=")
+
+    assert response.status_code == 400
+
+
+def test_projection_never_empty():
+    from config.fields import projection
+
+    assert projection([]) == {"_id": 1}
+    assert projection(["name"]) == {"name": 1}
+
+
+def test_unknown_user_profile_is_404(client, auth):
+    response = client.get("/api/users/profile", headers=auth(ObjectId()))
+
+    assert response.status_code == 404
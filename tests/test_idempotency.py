@@ -0,0 +1,54 @@
+SERVICE = {"title": "Clases", "description": "Guitarra", "categories": "Música",
+           "hours": 2, "contact": "a@b.c", "location": "Centro"}
+
+
+def post(client, auth, owner, key, body=SERVICE):
+    headers = {**auth(owner), "Idempotency-Key": key}
+    return client.post("/api/services/crear", headers=headers, json=body)
+
+
+def test_repeated_key_replays_the_first_response(client, db, auth):
+    owner = db.users.insert_one({"name": "Ana"}).inserted_id
+
+    first = post(client, auth, owner, "k1")
+    again = post(client, auth, owner, "k1")
+
+    assert first.status_code == again.status_code == 201
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert again.get_json() == first.get_json()
+    assert db.services.count_documents({}) == 1
+
+
+def test_key_reused_with_another_body_is_rejected(client, db, auth):
+    owner = db.users.insert_one({"name": "Ana"}).inserted_id
+
+    post(client, auth, owner, "k1")
+    response = post(client, auth, owner, "k1", {**SERVICE, "title": "Otro"})
+
+    assert response.status_code == 422
+    assert db.services.count_documents({}) == 1
+
+
+def test_keys_are_scoped_per_user(client, db, auth):
+    owners = [db.users.insert_one({"name": n}).inserted_id for n in ("Ana", "Luis")]
+
+    for owner in owners:
+        assert post(client, auth, owner, "k1").status_code == 201
+
+    assert db.services.count_documents({}) == 2
+
+
+def test_server_errors_are_not_stored(client, db, auth, monkeypatch):
+    owner = db.users.insert_one({"name": "Ana"}).inserted_id
+    insert_one = db.services.insert_one
+
+    def failing_insert(*args, **kwargs):
+        raise RuntimeError("sin conexión")
+    monkeypatch.setattr(db.services, "insert_one", failing_insert)
+    assert post(client, auth, owner, "k1").status_code == 500
+
+    monkeypatch.setattr(db.services, "insert_one", insert_one)
+    retry = post(client, auth, owner, "k1")
+
+    assert retry.status_code == 201
+    assert "Idempotent-Replayed" not in retry.headers
@@ -0,0 +1,62 @@
+import threading
+import time
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+from config import jobs
+
+
+def test_enqueue_dedupes_queued_jobs(db):
+    first = jobs.enqueue(db, "recalc", {"id": 1}, dedupe_key="recalc:1")
+    second = jobs.enqueue(db, "recalc", {"id": 1}, dedupe_key="recalc:1")
+
+    assert first is not None
+    assert second is None
+    assert db.jobs.count_documents({"dedupe_key": "recalc:1"}) == 1
+
+
+def test_enqueue_treats_duplicate_key_race_as_deduplicated(db, monkeypatch):
+    def racing_upsert(*args, **kwargs):
+        raise DuplicateKeyError("E11000 duplicate key")
+
+    monkeypatch.setattr(db.jobs, "update_one", racing_upsert)
+    assert jobs.enqueue(db, "recalc", dedupe_key="recalc:1") is None
+
+
+def test_lease_is_renewed_while_handler_runs(db, monkeypatch):
+    release = threading.Event()
+    renewed = []
+
+    @jobs.job_handler("slow")
+    def slow(db, payload):
+        lease_until = db.jobs.find_one({"type": "slow"})["lease_until"]
+        # esperar a que el keeper renueve la concesión al menos una vez
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            current = db.jobs.find_one({"type": "slow"})["lease_until"]
+            if current > lease_until:
+                renewed.append(current)
+                break
+            time.sleep(0.01)
+        release.set()
+
+    monkeypatch.setattr(jobs, "LEASE_SECONDS", 0.06)
+    jobs.enqueue(db, "slow")
+
+    assert jobs.run_pending(db) == 1
+    assert release.is_set()
+    assert renewed
+    assert db.jobs.find_one({"type": "slow"})["status"] == "done"
+
+
+def test_lost_lease_is_reported(db):
+    job = {"_id": 1, "type": "x", "status": "leased", "leased_by": "otro",
+           "lease_until": datetime.utcnow()}
+    db.jobs.insert_one(job)
+
+    keeper = jobs._LeaseKeeper(db, job, "yo", lease_seconds=0.03)
+    with keeper:
+        time.sleep(0.1)
+
+    assert keeper.lost
@@ -0,0 +1,46 @@
+import json
+import logging
+
+from config.logger import REDACTED, JsonFormatter, redact
+
+
+def test_redact_masks_sensitive_keys_and_credentials():
+    value = redact({
+        "email": "ana@x.com",
+        "password": "secreta",
+        "nested": [{"token": "abc"}],
+        "uri": "mongodb://admin:clave@db:27017/app",
+        "msg": "Authorization: Bearer abc.def.ghi",
+    })
+
+    assert value["email"] == "ana@x.com"
+    assert value["password"] == REDACTED
+    assert value["nested"] == [{"token": REDACTED}]
+    assert value["uri"] == REDACTED
+    assert "abc.def.ghi" not in value["msg"]
+    assert redact("mongodb://admin:clave@db:27017") == f"mongodb://{REDACTED}@db:27017"
+
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.LogRecord("routes.users", logging.INFO, __file__, 1,
+                               "Usuario creado", (), None)
+    record.user_id = "u1"
+    record.password = "secreta"
+    record.request_id = "req-1"
+
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert entry["msg"] == "Usuario creado"
+    assert entry["level"] == "INFO"
+    assert entry["request_id"] == "req-1"
+    assert entry["user_id"] == "u1"
+    assert entry["password"] == REDACTED
+
+
+def test_request_id_is_echoed_or_generated(client):
+    echoed = client.get("/api/services/changes?fields=title", headers={"X-Request-ID": "abc-123"})
+    generated = client.get("/api/services/changes?fields=title",
+                           headers={"X-Request-ID": "no válido!"})
+
+    assert echoed.headers["X-Request-ID"] == "abc-123"
+    assert generated.headers["X-Request-ID"] not in ("", "no válido!")
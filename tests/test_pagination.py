@@ -0,0 +1,31 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from config.pagination import InvalidCursor, decode_cursor, encode_cursor, split_page
+
+
+def test_cursor_round_trip_keeps_bson_types():
+    values = {"created_at": datetime(2026, 3, 4, 5, 6, 7), "_id": ObjectId(), "rating_avg": 4.5}
+
+    token = encode_cursor(values)
+
+    assert "=" not in token
+    assert decode_cursor(token) == values
+
+
+def test_split_page_cursor_points_at_last_item():
+    docs = [{"_id": ObjectId(), "created_at": datetime(2026, 1, day)} for day in (3, 2, 1)]
+
+    page, cursor = split_page(docs, 2, ["created_at", "_id"])
+
+    assert page == docs[:2]
+    assert decode_cursor(cursor) == {"created_at": docs[1]["created_at"], "_id": docs[1]["_id"]}
+    assert split_page(docs, 3, ["_id"]) == (docs, None)
+
+
+@pytest.mark.parametrize("token", ["no-es-base64!", encode_cursor([1, 2])])
+def test_invalid_cursor(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token)
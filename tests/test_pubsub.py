@@ -0,0 +1,53 @@
+from bson import ObjectId
+
+from config.pubsub import OVERFLOW, Broker
+from routes import transactions
+
+
+def test_events_reach_only_subscribed_topics():
+    broker = Broker("pruebas")
+    ana = broker.subscribe(["ana"])
+    luis = broker.subscribe(["luis"])
+
+    broker.publish(["ana"], {"n": 1})
+
+    assert ana.get(timeout=0) == {"n": 1}
+    assert luis.get(timeout=0) is None
+
+    ana.close()
+    broker.publish(["ana"], {"n": 2})
+    assert ana.get(timeout=0) is None
+
+
+def test_slow_subscriber_gets_overflow():
+    broker = Broker("pruebas", max_queue=2)
+    slow = broker.subscribe(["ana"])
+
+    for n in range(5):
+        broker.publish(["ana"], {"n": n})
+
+    assert slow.closed
+    # el aviso ocupa el lugar del evento más viejo
+    assert slow.get(timeout=0) == {"n": 1}
+    assert slow.get(timeout=0) is OVERFLOW
+    assert slow.get(timeout=0) is None
+
+
+def test_stream_pushes_transactions_of_the_user(client, auth, monkeypatch):
+    monkeypatch.setattr(transactions, "CHANGE_STREAM_MODE", "off")
+    monkeypatch.setattr(transactions, "SSE_HEARTBEAT_SECONDS", 0.01)
+    monkeypatch.setattr(transactions, "SSE_MAX_SECONDS", 0.1)
+    client_id, supplier_id = ObjectId(), ObjectId()
+
+    response = client.get("/api/transactions/stream", headers=auth(client_id), buffered=False)
+    transactions.publish_transaction({"_id": ObjectId(), "client_id": client_id,
+                                      "supplier_id": supplier_id, "hours": 2}, "created")
+    transactions.publish_transaction({"_id": ObjectId(), "client_id": ObjectId(),
+                                      "supplier_id": supplier_id, "hours": 1}, "created")
+    body = b"".join(response.response).decode()
+
+    assert response.mimetype == "text/event-stream"
+    assert body.startswith("retry: 5000\n\n")
+    assert body.count("event: transaction") == 1
+    assert f'"client_id": "{client_id}"' in body
+    assert ": heartbeat" in body
@@ -0,0 +1,103 @@
+import pytest
+from bson import ObjectId
+
+from routes import reviews
+
+
+@pytest.fixture
+def deltas(monkeypatch):
+    """Reemplaza apply_rating_delta (usa updates con pipeline) y registra las llamadas."""
+    calls = []
+
+    def record(db, service_id, added=None, removed=None):
+        calls.append((added, removed))
+    monkeypatch.setattr(reviews, "apply_rating_delta", record)
+    return calls
+
+
+@pytest.fixture
+def review(db):
+    owner_id, author_id = ObjectId(), ObjectId()
+    service_id = db.services.insert_one({"title": "Clases", "owner_id": owner_id}).inserted_id
+    review_id = db.reviews.insert_one({
+        "service_id": service_id, "user_id": author_id, "owner_id": owner_id,
+        "rating": 3, "comment": "bien"
+    }).inserted_id
+    return {"_id": review_id, "user_id": author_id}
+
+
+def test_edit_applies_delta_from_previous_rating(client, auth, review, deltas):
+    response = client.put(f"/api/reviews/{review['_id']}", json={"rating": 5},
+                          headers=auth(review["user_id"]))
+
+    assert response.status_code == 200
+    assert response.get_json()["reseña"]["rating"] == 5
+    assert deltas == [(5, 3)]
+
+
+def test_concurrent_edit_uses_rating_from_atomic_update(client, auth, db, review, deltas, monkeypatch):
+    find_one_and_update = db.reviews.find_one_and_update
+
+    def concurrent_edit_then_update(*args, **kwargs):
+        # otra edición termina entre la lectura y la escritura de esta petición
+        db.reviews.update_one({"_id": review["_id"]}, {"$set": {"rating": 5}})
+        return find_one_and_update(*args, **kwargs)
+    monkeypatch.setattr(db.reviews, "find_one_and_update", concurrent_edit_then_update)
+
+    response = client.put(f"/api/reviews/{review['_id']}", json={"rating": 4},
+                          headers=auth(review["user_id"]))
+
+    assert response.status_code == 200
+    # 3 -> 5 lo aplicó la otra edición; esta debe quitar el 5, no el 3
+    assert deltas == [(4, 5)]
+
+
+def test_edit_with_same_rating_has_no_delta(client, auth, review, deltas):
+    response = client.put(f"/api/reviews/{review['_id']}", json={"rating": 3},
+                          headers=auth(review["user_id"]))
+
+    assert response.status_code == 200
+    assert deltas == []
+
+
+def test_owner_rating_includes_reviews_without_owner_id(db):
+    owner_id = db.users.insert_one({"name": "Prov", "is_active": True}).inserted_id
+    service_id = db.services.insert_one({"title": "Clases", "owner_id": owner_id}).inserted_id
+    db.reviews.insert_many([
+        {"service_id": service_id, "owner_id": owner_id, "rating": 5},
+        # anterior a backfill-owner-ids
+        {"service_id": service_id, "rating": 2},
+        # de otro proveedor
+        {"service_id": ObjectId(), "rating": 1},
+    ])
+
+    reviews.recompute_owner_rating(db, {"owner_id": str(owner_id)})
+
+    owner = db.users.find_one({"_id": owner_id})
+    assert owner["rating_count"] == 2
+    assert owner["rating_avg"] == 3.5
+
+
+@pytest.mark.parametrize("cursor", ["no-es-base64!", "e30", "eyJ4IjogMX0"])
+def test_received_rejects_invalid_cursor(client, cursor):
+    # e30 = {} y eyJ4IjogMX0 = {"x": 1}: JSON válido pero sin _id
+    response = client.get(f"/api/reviews/received/{ObjectId()}?cursor={cursor}")
+
+    assert response.status_code == 400
+
+
+def test_received_includes_reviews_without_owner_id(client, db):
+    owner_id = ObjectId()
+    service_id = db.services.insert_one({"title": "Clases", "owner_id": owner_id}).inserted_id
+    other_service = db.services.insert_one({"title": "Otro", "owner_id": ObjectId()}).inserted_id
+    db.reviews.insert_many([
+        # anterior a owner_id
+        {"service_id": service_id, "user_id": ObjectId(), "rating": 4},
+        {"service_id": service_id, "user_id": ObjectId(), "owner_id": owner_id, "rating": 5},
+        {"service_id": other_service, "user_id": ObjectId(), "rating": 1},
+    ])
+
+    response = client.get(f"/api/reviews/received/{owner_id}?fields=rating")
+
+    assert response.status_code == 200
+    assert sorted(r["rating"] for r in response.get_json()["reviews"]) == [4, 5]
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from config import jobs
+from config.sequence import change_fields
+from routes.services import refresh_similar_services, serialize_service
+
+
+def test_changes_accepts_services_without_updated_at(client, db):
+    old = datetime.utcnow() - timedelta(hours=1)
+    db.services.insert_many([
+        # change_seq sin updated_at: anterior a backfill-change-seq
+        {"title": "Sin fecha", "owner_id": ObjectId(), "change_seq": 1},
+        {"title": "Con fecha", "owner_id": ObjectId(), "change_seq": 2, "updated_at": old},
+    ])
+
+    response = client.get("/api/services/changes?fields=title")
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [s["title"] for s in body["upserts"]] == ["Sin fecha", "Con fecha"]
+    assert body["has_more"] is False
+
+
+VALID_SERVICE = {"title": "Clases", "description": "Guitarra", "categories": "Música",
+                 "hours": 2, "contact": "a@b.c", "location": "Centro"}
+
+
+def test_create_rejects_non_text_fields(client, db, auth):
+    owner = ObjectId()
+
+    response = client.post("/api/services/crear", headers=auth(owner),
+                           json={**VALID_SERVICE, "title": 5})
+
+    assert response.status_code == 400
+    assert "title" in response.get_json()["error"]
+    assert db.services.count_documents({}) == 0
+
+
+def test_create_rejects_non_numeric_hours(client, db, auth):
+    for hours in ([2], True, "inf"):
+        response = client.post("/api/services/crear", headers=auth(ObjectId()),
+                               json={**VALID_SERVICE, "hours": hours})
+        assert response.status_code == 400
+
+
+def make_services(client, auth, owner, *titles):
+    ids = []
+    for title in titles:
+        response = client.post("/api/services/crear", headers=auth(owner),
+                               json={**VALID_SERVICE, "title": title})
+        ids.append(ObjectId(response.get_json()["service"]["_id"]))
+    return ids
+
+
+def test_similar_refresh_ignores_rating_only_changes(client, db, auth):
+    owner = db.users.insert_one({"name": "Ana"}).inserted_id
+    guitar, piano = make_services(client, auth, owner, "Clases de guitarra", "Clases de piano")
+    refresh_similar_services(db)
+
+    # una reseña solo mueve change_seq (apply_rating_delta)
+    db.services.update_one({"_id": guitar}, {"$set": change_fields(db, "services")})
+    assert refresh_similar_services(db) == 0
+
+    client.put(f"/api/services/{piano}", headers=auth(owner),
+               json={"title": "Clases de piano y guitarra"})
+    assert refresh_similar_services(db) > 0
+
+
+def test_similar_refresh_job_skips_web_workers(db):
+    jobs.enqueue(db, "refresh_similar_services")
+
+    assert jobs.run_pending(db) == 0
+    assert jobs.run_pending(db, queues=["batch"]) == 1
+
+
+def test_serialize_service_does_not_mutate_its_input():
+    doc = {"title": "Clases", "similar": [], "created_at": datetime(2026, 1, 1)}
+
+    assert serialize_service(doc) == {"title": "Clases", "created_at": "2026-01-01T00:00:00"}
+    assert "similar" in doc
+    assert serialize_service(None) is None
+
+
+def test_detail_is_assembled_from_one_aggregation(client, db, monkeypatch):
+    service_id, owner_id = ObjectId(), ObjectId()
+    pipelines = []
+
+    def aggregate(pipeline, *args, **kwargs):
+        pipelines.append(pipeline)
+        return iter([{
+            "_id": service_id, "owner_id": owner_id, "title": "Clases",
+            "owner": {"_id": owner_id, "name": "Ana"},
+            "rating_summary": {"count": 2, "sum": 9, "avg": 4.5, "histogram": {"5": 1, "4": 1}},
+            "reviews": [{"_id": "r3", "rating": 5}, {"_id": "r2", "rating": 4},
+                        {"_id": "r1", "rating": 5}],
+        }])
+    monkeypatch.setattr(db.services, "aggregate", aggregate)
+
+    response = client.get(f"/api/services/{service_id}?reviews_limit=2")
+
+    assert response.status_code == 200
+    assert len(pipelines) == 1
+    body = response.get_json()
+    assert body["service"]["title"] == "Clases"
+    assert body["owner"]["name"] == "Ana"
+    assert body["owner"]["skills"] == []
+    assert body["rating_summary"]["avg"] == 4.5
+    assert body["rating_summary"]["histogram"]["1"] == 0
+    assert [r["_id"] for r in body["reviews"]] == ["r3", "r2"]
+    assert body["has_more_reviews"] is True
+
+
+def test_detail_validates_input(client, db, monkeypatch):
+    monkeypatch.setattr(db.services, "aggregate", lambda *args, **kwargs: iter([]))
+
+    assert client.get(f"/api/services/{ObjectId()}?reviews_limit=x").status_code == 400
+    assert client.get("/api/services/no-es-id").status_code == 400
+    assert client.get(f"/api/services/{ObjectId()}").status_code == 404
@@ -0,0 +1,48 @@
+import threading
+import time
+
+import pytest
+
+from config import singleflight
+from config.singleflight import SingleFlight
+
+
+def test_concurrent_misses_share_one_call(monkeypatch):
+    group = SingleFlight("pruebas")
+    collapsed = []
+    monkeypatch.setattr(singleflight.metrics, "inc",
+                        lambda name, *args, **kwargs: collapsed.append(name))
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        release.wait(2)
+        return {"items": [1, 2]}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(group.do("k", load)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    # los otros cuatro ya esperan al líder
+    while collapsed.count("singleflight_collapsed_total") < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"items": [1, 2]}] * 5
+
+
+def test_error_is_shared_and_key_is_released():
+    group = SingleFlight("pruebas")
+
+    def fail():
+        raise RuntimeError("sin conexión")
+
+    with pytest.raises(RuntimeError):
+        group.do("k", fail)
+
+    assert group.do("k", lambda: "ok") == "ok"
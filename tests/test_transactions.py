@@ -0,0 +1,258 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from config import jobs, scheduler
+from config.pagination import encode_cursor
+from routes.transactions import archive_transactions, expire_pending_transactions, rollup_daily
+
+
+def make_transaction(db, client_id, supplier_id, hours=1, age_minutes=0,
+                     legacy=False, collection="transactions", **fields):
+    doc = {
+        "service_id": ObjectId(),
+        "client_id": client_id,
+        "supplier_id": supplier_id,
+        "hours": hours,
+        "status_supplier": "pending",
+        "status_client": "pending",
+        "status_transaction": "pending",
+        "created_at": datetime.utcnow() - timedelta(minutes=age_minutes),
+        **fields
+    }
+    if not legacy:
+        doc["participants"] = [client_id, supplier_id]
+    return db[collection].insert_one(doc).inserted_id
+
+
+@pytest.fixture
+def users(db):
+    client_id = db.users.insert_one({"name": "Cliente", "hours_balance": 10}).inserted_id
+    supplier_id = db.users.insert_one({"name": "Proveedor", "hours_balance": 0}).inserted_id
+    return client_id, supplier_id
+
+
+def test_user_history_without_limit_returns_everything(client, auth, db, users):
+    client_id, supplier_id = users
+    for minutes in range(60):
+        make_transaction(db, client_id, supplier_id, age_minutes=minutes)
+
+    response = client.get("/api/transactions/user", headers=auth(client_id))
+
+    assert response.status_code == 200
+    assert len(response.get_json()) == 60
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_user_history_includes_transactions_without_participants(client, auth, db, users):
+    client_id, supplier_id = users
+    make_transaction(db, client_id, supplier_id, legacy=True)
+    make_transaction(db, client_id, supplier_id, legacy=True, collection="transactions_archive",
+                     status_transaction="completed", age_minutes=5)
+    make_transaction(db, ObjectId(), ObjectId(), legacy=True)
+
+    for user_id in users:
+        response = client.get("/api/transactions/user", headers=auth(user_id))
+        assert len(response.get_json()) == 2
+
+
+def test_user_history_paginates_with_limit(client, auth, db, users):
+    client_id, supplier_id = users
+    ids = [make_transaction(db, client_id, supplier_id, age_minutes=m) for m in range(5)]
+
+    first = client.get("/api/transactions/user?limit=3", headers=auth(client_id))
+    cursor = first.headers["X-Next-Cursor"]
+    second = client.get(f"/api/transactions/user?limit=3&cursor={cursor}", headers=auth(client_id))
+
+    assert [t["_id"] for t in first.get_json()] == [str(i) for i in ids[:3]]
+    assert [t["_id"] for t in second.get_json()] == [str(i) for i in ids[3:]]
+    assert "X-Next-Cursor" not in second.headers
+
+
+@pytest.mark.parametrize("values", [{"_id": ObjectId()}, {"created_at": datetime.utcnow()}])
+def test_user_history_rejects_incomplete_cursor(client, auth, users, values):
+    response = client.get(f"/api/transactions/user?cursor={encode_cursor(values)}",
+                          headers=auth(users[0]))
+
+    assert response.status_code == 400
+
+
+def accept_bulk(client, auth, user_id, *transaction_ids):
+    items = [{"transaction_id": str(t), "status_client": "accepted"} for t in transaction_ids]
+    return client.post("/api/transactions/bulk", json={"items": items}, headers=auth(user_id))
+
+
+def balances(db, *user_ids):
+    return [db.users.find_one({"_id": u})["hours_balance"] for u in user_ids]
+
+
+def test_bulk_accept_transfers_hours_once(client, auth, db, users):
+    client_id, supplier_id = users
+    transaction_id = make_transaction(db, client_id, supplier_id, hours=3)
+
+    first = accept_bulk(client, auth, client_id, transaction_id)
+    again = accept_bulk(client, auth, client_id, transaction_id)
+
+    assert first.get_json()["results"][0]["status"] == 200
+    assert again.get_json()["results"][0]["status"] == 409
+    assert balances(db, client_id, supplier_id) == [7, 3]
+
+
+def test_bulk_does_not_touch_resolved_transactions(client, auth, db, users):
+    client_id, supplier_id = users
+    transaction_id = make_transaction(db, client_id, supplier_id, hours=3,
+                                      status_transaction="cancelled")
+
+    response = accept_bulk(client, auth, client_id, transaction_id)
+
+    assert response.get_json()["results"][0]["status"] == 404
+    assert balances(db, client_id, supplier_id) == [10, 0]
+
+
+def test_bulk_concurrent_accept_does_not_double_credit(client, auth, db, users, monkeypatch):
+    client_id, supplier_id = users
+    transaction_id = make_transaction(db, client_id, supplier_id, hours=3)
+    find = db.transactions.find
+
+    def find_then_concurrent_accept(*args, **kwargs):
+        docs = list(find(*args, **kwargs))
+        monkeypatch.setattr(db.transactions, "find", find)
+        # otra petición acepta (y transfiere) entre la lectura y la escritura
+        db.transactions.update_one({"_id": transaction_id}, {"$set": {"status_client": "accepted"}})
+        db.users.update_one({"_id": client_id}, {"$inc": {"hours_balance": -3}})
+        db.users.update_one({"_id": supplier_id}, {"$inc": {"hours_balance": 3}})
+        return docs
+    monkeypatch.setattr(db.transactions, "find", find_then_concurrent_accept)
+
+    response = accept_bulk(client, auth, client_id, transaction_id)
+
+    assert response.get_json()["results"][0]["status"] == 409
+    assert balances(db, client_id, supplier_id) == [7, 3]
+
+
+def test_bulk_finds_transactions_without_participants(client, auth, db, users):
+    client_id, supplier_id = users
+    transaction_id = make_transaction(db, client_id, supplier_id, hours=2, legacy=True)
+
+    response = accept_bulk(client, auth, client_id, transaction_id)
+
+    assert response.get_json()["results"][0]["status"] == 200
+    assert balances(db, client_id, supplier_id) == [8, 2]
+
+
+def test_rollup_counts_archived_copy_once_and_batches_categories(db, users, monkeypatch):
+    client_id, supplier_id = users
+    service_id = db.services.insert_one({"title": "Clases", "categories": ["Música"]}).inserted_id
+    transaction_id = make_transaction(db, client_id, supplier_id, age_minutes=2 * 24 * 60,
+                                      service_id=service_id)
+    # a medio archivar: la copia ya está en transactions_archive
+    db.transactions_archive.insert_one(db.transactions.find_one({"_id": transaction_id}))
+
+    def n_plus_one(*args, **kwargs):
+        raise AssertionError("una consulta por servicio")
+    monkeypatch.setattr(db.services, "find_one", n_plus_one)
+
+    rollup_daily(db, full=True)
+
+    day = db.transactions.find_one({"_id": transaction_id})["created_at"].strftime("%Y-%m-%d")
+    rollup = db.rollups_daily.find_one({"_id": day})
+    assert rollup["created"] == 1
+    assert [(c["category"], c["created"]) for c in rollup["categories"]] == [("Música", 1)]
+
+
+def test_bulk_debit_is_guarded_against_stale_balance(client, auth, db, users, monkeypatch):
+    client_id, supplier_id = users
+    transaction_id = make_transaction(db, client_id, supplier_id, hours=8)
+    find = db.users.find
+
+    def find_then_concurrent_spend(*args, **kwargs):
+        docs = list(find(*args, **kwargs))
+        monkeypatch.setattr(db.users, "find", find)
+        # otra petición gasta el saldo después de que se leyó
+        db.users.update_one({"_id": client_id}, {"$inc": {"hours_balance": -5}})
+        return docs
+    monkeypatch.setattr(db.users, "find", find_then_concurrent_spend)
+
+    response = accept_bulk(client, auth, client_id, transaction_id)
+
+    assert response.get_json()["results"][0]["status"] == 409
+    assert balances(db, client_id, supplier_id) == [5, 0]
+    assert db.transactions.find_one({"_id": transaction_id})["status_client"] == "pending"
+
+
+def test_bulk_rejects_items_beyond_balance(client, auth, db, users):
+    client_id, supplier_id = users
+    first = make_transaction(db, client_id, supplier_id, hours=6)
+    second = make_transaction(db, client_id, supplier_id, hours=6)
+
+    response = accept_bulk(client, auth, client_id, first, second)
+
+    assert [r["status"] for r in response.get_json()["results"]] == [200, 400]
+    assert balances(db, client_id, supplier_id) == [4, 6]
+
+
+def test_update_does_not_transfer_twice(client, auth, db, users):
+    client_id, supplier_id = users
+    transaction_id = make_transaction(db, client_id, supplier_id, hours=3)
+
+    for expected in (200, 409):
+        response = client.put(f"/api/transactions/{transaction_id}", headers=auth(client_id),
+                              json={"status_client": "accepted"})
+        assert response.status_code == expected
+    assert balances(db, client_id, supplier_id) == [7, 3]
+
+
+def test_expired_transaction_cannot_be_accepted(client, auth, db, users):
+    client_id, supplier_id = users
+    old = make_transaction(db, client_id, supplier_id, hours=3, age_minutes=3 * 24 * 60)
+    recent = make_transaction(db, client_id, supplier_id, hours=3)
+
+    assert expire_pending_transactions(db, max_age_hours=24) == 1
+
+    expired = db.transactions.find_one({"_id": old})
+    assert (expired["status_transaction"], expired["cancel_reason"]) == ("cancelled", "expired")
+    assert db.transactions.find_one({"_id": recent})["status_transaction"] == "pending"
+    for _ in range(2):
+        response = client.put(f"/api/transactions/{old}", headers=auth(client_id),
+                              json={"status_client": "accepted"})
+        assert response.status_code == 409
+    assert balances(db, client_id, supplier_id) == [10, 0]
+    assert db.transactions.find_one({"_id": old})["status_transaction"] == "cancelled"
+
+
+def test_expiry_skips_transactions_the_client_already_paid(db, users):
+    client_id, supplier_id = users
+    make_transaction(db, client_id, supplier_id, age_minutes=3 * 24 * 60,
+                     status_client="accepted")
+
+    assert expire_pending_transactions(db, max_age_hours=24) == 0
+
+
+def test_archive_runs_from_the_scheduler_in_bounded_batches(db, users, monkeypatch):
+    client_id, supplier_id = users
+    for _ in range(3):
+        make_transaction(db, client_id, supplier_id, age_minutes=200 * 24 * 60,
+                         status_transaction="completed")
+
+    assert archive_transactions(db, batch_size=1, max_batches=2) == 2
+
+    monkeypatch.setattr(scheduler, "_schedules",
+                        {"archive-transactions": scheduler._schedules["archive-transactions"]})
+    assert scheduler.run_due(db) == 1
+    assert jobs.run_pending(db) == 1
+    assert db.transactions.count_documents({}) == 0
+    assert db.transactions_archive.count_documents({}) == 3
+
+
+def test_analytics_returns_iso_dates(client, auth, db, users):
+    client_id, supplier_id = users
+    admin = db.users.insert_one({"name": "Admin", "role": "admin"}).inserted_id
+    make_transaction(db, client_id, supplier_id, age_minutes=2 * 24 * 60)
+    rollup_daily(db, full=True)
+
+    body = client.get("/api/transactions/analytics", headers=auth(admin)).get_json()
+
+    watermark = db.job_state.find_one({"_id": "rollups_daily"})["watermark"]
+    assert body["updated_through"] == watermark.isoformat()
+    datetime.strptime(body["days"][0]["date"], "%Y-%m-%d")
@@ -0,0 +1,159 @@
+import json
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from flask import Flask
+
+from config.budget import init_budgets, no_time_budget
+from config.pagination import encode_cursor
+from routes.users import _prepare_user_rows, update_leaderboard_entry
+
+
+@pytest.fixture
+def admin(db):
+    return db.users.insert_one({"name": "Admin", "role": "admin"}).inserted_id
+
+
+@pytest.fixture
+def members(db):
+    return [db.users.insert_one({"name": f"u{i}", "hours_balance": 0}).inserted_id
+            for i in range(3)]
+
+
+def hours(db, user_ids):
+    return [db.users.find_one({"_id": u})["hours_balance"] for u in user_ids]
+
+
+def test_bulk_grant_with_idempotency_key_credits_once(client, auth, db, admin, members):
+    headers = {**auth(admin, role="admin"), "Idempotency-Key": "grant-1"}
+    items = [{"user_id": str(u), "hours": 2} for u in members]
+
+    first = client.post("/api/users/add-hours/bulk", json={"items": items}, headers=headers)
+    retry = client.post("/api/users/add-hours/bulk", json={"items": items}, headers=headers)
+
+    assert first.status_code == 200
+    assert retry.headers.get("Idempotent-Replayed") == "true"
+    assert retry.get_json() == first.get_json()
+    assert hours(db, members) == [2, 2, 2]
+
+
+def test_bulk_grant_ndjson_with_idempotency_key(client, auth, db, admin, members):
+    body = "\n".join(json.dumps({"user_id": str(u), "hours": 1}) for u in members)
+    headers = {**auth(admin, role="admin"), "Idempotency-Key": "grant-2",
+               "Content-Type": "application/x-ndjson"}
+
+    for _ in range(2):
+        response = client.post("/api/users/add-hours/bulk", data=body, headers=headers)
+        assert response.status_code == 200
+
+    assert hours(db, members) == [1, 1, 1]
+
+
+def test_bulk_grant_requires_admin_in_database(client, auth, db, members):
+    demoted = db.users.insert_one({"name": "Ex admin", "role": "user"}).inserted_id
+    items = [{"user_id": str(members[0]), "hours": 5}]
+
+    response = client.post("/api/users/add-hours/bulk", json={"items": items},
+                           headers=auth(demoted, role="admin"))
+
+    assert response.status_code == 403
+    assert hours(db, members[:1]) == [0]
+
+
+def test_no_time_budget_views_are_not_wrapped():
+    app = Flask(__name__)
+
+    @app.route("/largo")
+    @no_time_budget
+    def largo():
+        return "ok"
+
+    @app.route("/corto")
+    def corto():
+        return "ok"
+
+    init_budgets(app)
+
+    assert app.view_functions["largo"] is largo
+    assert app.view_functions["corto"] is not corto
+
+
+def test_create_user_rejects_non_text_fields(client, db):
+    response = client.post("/api/users/create",
+                           json={"name": "Ana", "email": 5, "password": "x"})
+
+    assert response.status_code == 400
+    assert "email" in response.get_json()["error"]
+    assert db.users.count_documents({}) == 0
+
+
+def test_create_user_splits_skills_text(client, db):
+    response = client.post("/api/users/create", json={
+        "name": "Ana", "email": "ana@x.com", "password": "Secreta123!",
+        "skills": "python, Diseño Web"})
+
+    assert response.status_code == 201
+    user = db.users.find_one({"email": "ana@x.com"})
+    assert user["skills"] == ["python", "Diseño Web"]
+    assert user["skills_normalized"] == ["python", "diseno web"]
+
+
+def test_update_rejects_non_list_skills(client, db, auth):
+    user_id = db.users.insert_one({"name": "Ana", "email": "ana@x.com",
+                                   "skills": ["python"]}).inserted_id
+
+    response = client.put("/api/users/update", headers=auth(user_id),
+                          json={"skills": {"python": True}})
+    assert response.status_code == 400
+
+    response = client.put("/api/users/update", headers=auth(user_id),
+                          json={"skills": "python"})
+    assert response.status_code == 200
+    assert db.users.find_one({"_id": user_id})["skills_normalized"] == ["python"]
+
+
+def test_search_rejects_incomplete_cursor(client):
+    cursor = encode_cursor({"_id": ObjectId()})
+
+    response = client.get(f"/api/users/search?skills=python&cursor={cursor}")
+
+    assert response.status_code == 400
+
+
+def test_leaderboard_entry_creates_missing_category_board(client, db):
+    created_at = datetime(2026, 1, 2, 3, 4, 5)
+    user_id = db.users.insert_one({"name": "Ana", "is_active": True, "rating_avg": 4.5,
+                                   "rating_count": 5, "created_at": created_at}).inserted_id
+    db.services.insert_one({"title": "Clases", "owner_id": user_id, "categories": ["Música"]})
+
+    update_leaderboard_entry(db, user_id)
+    response = client.get("/api/users/leaderboard?category=Música")
+
+    body = response.get_json()
+    assert [e["user_id"] for e in body["entries"]] == [str(user_id)]
+    assert body["entries"][0]["created_at"] == created_at.isoformat()
+    datetime.fromisoformat(body["updated_at"])
+    assert db.leaderboards.find_one({"_id": "overall"})["entries"][0]["user_id"] == user_id
+
+
+class RecordingPool:
+    def __init__(self):
+        self.hashed = []
+
+    def map(self, fn, items, chunksize=1):
+        self.hashed.extend(items)
+        return [fn(item) for item in items]
+
+
+def test_import_hashes_only_new_users(db):
+    db.users.insert_one({"name": "Ana", "email": "ana@x.com"})
+    pool = RecordingPool()
+    rows = [(1, {"name": "Ana", "email": "ana@x.com", "password": "repetida"}),
+            (2, {"name": "Luis", "email": "luis@x.com", "password": "nueva"})]
+
+    prepared = _prepare_user_rows(pool)(db, rows)
+
+    assert pool.hashed == ["nueva"]
+    assert prepared[0] == (1, None, "El email ya está registrado")
+    assert "password_hash" in prepared[1][1]